@@ -0,0 +1,53 @@
+# accounts.py | Список аккаунтов из файла конфигурации (или один аккаунт из .env)
+#
+# accounts.json:
+#   [
+#     {"name": "main", "session": "1BVtsOK..."},
+#     {"name": "alt", "session": "1BVtsOK...", "api_id": 123, "api_hash": "abc"}
+#   ]
+# api_id/api_hash по умолчанию берутся из API_ID/API_HASH, папка состояния —
+# DATA_DIR/accounts/<name> (можно задать "data_dir").
+import os
+import re
+import json
+import logging
+
+logger = logging.getLogger("auto_fisher.accounts")
+
+_NAME_RE = re.compile(r"^[\w\-]{1,32}$")
+
+
+def load_accounts(path: str, env_session: str, api_id: int, api_hash: str, data_dir: str):
+    """
+    Возвращает список {name, session, api_id, api_hash, data_dir}.
+    Если файла нет — один аккаунт "main" из SESSION_STRING_SERVER со старой
+    папкой состояния DATA_DIR, чтобы существующие установки работали как раньше.
+    """
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        if not isinstance(raw, list):
+            raise ValueError(f"{path}: ожидается список аккаунтов")
+        accounts, seen = [], set()
+        for i, item in enumerate(raw):
+            if not isinstance(item, dict) or not item.get("session"):
+                raise ValueError(f"{path}: у аккаунта #{i + 1} нет session")
+            if item.get("enabled", True) is False:
+                continue
+            name = str(item.get("name") or f"acc{i + 1}")
+            if not _NAME_RE.match(name) or name in seen:
+                raise ValueError(f"{path}: недопустимое или повторяющееся имя аккаунта {name!r}")
+            seen.add(name)
+            accounts.append({
+                "name": name,
+                "session": item["session"],
+                "api_id": int(item.get("api_id") or api_id),
+                "api_hash": item.get("api_hash") or api_hash,
+                "data_dir": item.get("data_dir") or os.path.join(data_dir, "accounts", name),
+            })
+        logger.info(f"👥 Аккаунтов в {path}: {len(accounts)}")
+        return accounts
+
+    if not env_session:
+        return []
+    return [{"name": "main", "session": env_session, "api_id": api_id, "api_hash": api_hash, "data_dir": data_dir}]
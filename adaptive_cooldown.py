@@ -0,0 +1,154 @@
+# adaptive_cooldown.py | Интервалы между действиями, подстраиваемые под ответы Qalais
+import re
+import json
+import time
+import logging
+from typing import Optional
+
+from utils import write_json_atomic
+
+logger = logging.getLogger("auto_fisher.cooldown")
+
+# Ответы игры, означающие "слишком рано"
+RATE_LIMIT_KEYWORDS = ["подожди", "слишком часто", "слишком быстро", "не так быстро",
+                       "не торопитесь", "попробуйте позже", "перезарядк", "кулдаун"]
+_WAIT_SECONDS_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(?:сек|с\b|s\b)")
+_WAIT_MINUTES_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*мин")
+
+# Сужение интервала после успешной попытки и расширение после отказа
+TIGHTEN_FACTOR = 0.95
+BACKOFF_FACTOR = 1.5
+# Запас над наблюдаемым порогом игры
+FLOOR_MARGIN = 1.05
+# Нижняя граница постепенно "забывается", чтобы заново прощупать порог
+FLOOR_DECAY = 0.995
+
+
+def parse_wait_reply(text: str) -> Optional[float]:
+    """
+    Если сообщение игры — отказ из-за частоты, возвращает сколько секунд
+    просит подождать игра (0.0, если число не указано). Иначе None.
+    """
+    if not text:
+        return None
+    low = text.lower()
+    if not any(k in low for k in RATE_LIMIT_KEYWORDS):
+        return None
+    m = _WAIT_MINUTES_RE.search(low)
+    if m:
+        return float(m.group(1).replace(",", ".")) * 60.0
+    m = _WAIT_SECONDS_RE.search(low)
+    if m:
+        return float(m.group(1).replace(",", "."))
+    return 0.0
+
+
+class AdaptiveInterval:
+    """Интервал, который сужается к наблюдаемому порогу игры и расширяется при отказах."""
+
+    def __init__(self, name: str, initial: float, minimum: float, maximum: float):
+        self.name = name
+        self.value = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.floor = minimum  # наименьший интервал, при котором игра еще не отказывала
+        self.successes = 0
+        self.rejects = 0
+
+    def on_success(self, elapsed: float) -> bool:
+        """Действие прошло через elapsed секунд после предыдущего. Возвращает True, если интервал изменился."""
+        self.successes += 1
+        # Успех на заметно большем интервале ничего не говорит о пороге
+        if elapsed > self.value * 1.2:
+            return False
+        self.floor = max(self.minimum, self.floor * FLOOR_DECAY)
+        new_value = max(self.floor * FLOOR_MARGIN, self.minimum, self.value * TIGHTEN_FACTOR)
+        changed = abs(new_value - self.value) > 1e-3
+        self.value = new_value
+        return changed
+
+    def on_reject(self, elapsed: float, wait_hint: float = 0.0) -> bool:
+        """Игра отказала через elapsed секунд; wait_hint — сколько она просила подождать."""
+        self.rejects += 1
+        observed = elapsed + (wait_hint or 0.0)
+        self.floor = min(self.maximum, max(self.floor, observed))
+        new_value = min(self.maximum, max(self.value * BACKOFF_FACTOR, self.floor * FLOOR_MARGIN))
+        changed = abs(new_value - self.value) > 1e-3
+        self.value = new_value
+        return changed
+
+    def to_dict(self) -> dict:
+        return {"value": round(self.value, 3), "floor": round(self.floor, 3),
+                "successes": self.successes, "rejects": self.rejects}
+
+    def load(self, data: dict):
+        try:
+            self.value = min(self.maximum, max(self.minimum, float(data.get("value", self.value))))
+            self.floor = min(self.maximum, max(self.minimum, float(data.get("floor", self.floor))))
+            self.successes = int(data.get("successes", 0))
+            self.rejects = int(data.get("rejects", 0))
+        except (TypeError, ValueError):
+            pass
+
+
+class CooldownLearner:
+    """
+    Набор обучаемых интервалов, сохраняемый в JSON:
+    - cast: пауза между кликом и следующим забросом (COOLDOWN_AFTER_CLICK)
+    - send: минимальный интервал между отправками (MIN_SEND_INTERVAL)
+    """
+
+    SAVE_EVERY = 10  # сохраняем не чаще чем раз в N успехов (отказы — сразу)
+
+    def __init__(self, path: str, cast_initial: float, send_initial: float):
+        self.path = path
+        self.intervals = {
+            "cast": AdaptiveInterval("cast", cast_initial, minimum=1.0, maximum=30.0),
+            "send": AdaptiveInterval("send", send_initial, minimum=0.3, maximum=10.0),
+        }
+        self._unsaved = 0
+        self._load()
+
+    def __getitem__(self, name: str) -> AdaptiveInterval:
+        return self.intervals[name]
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for name, interval in self.intervals.items():
+                if isinstance(data.get(name), dict):
+                    interval.load(data[name])
+            logger.info(f"⏱ Загружены обученные интервалы: {self.report()}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать интервалы {self.path}: {e}")
+
+    def save(self):
+        try:
+            data = {name: i.to_dict() for name, i in self.intervals.items()}
+            data["updated"] = time.time()
+            write_json_atomic(self.path, data)
+            self._unsaved = 0
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить интервалы: {e}")
+
+    def success(self, name: str, elapsed: float) -> bool:
+        changed = self.intervals[name].on_success(elapsed)
+        self._unsaved += 1
+        if self._unsaved >= self.SAVE_EVERY:
+            self.save()
+        return changed
+
+    def reject(self, name: str, elapsed: float, wait_hint: float = 0.0) -> bool:
+        changed = self.intervals[name].on_reject(elapsed, wait_hint)
+        logger.warning(f"⏱ Игра отказала через {elapsed:.1f}с (просит ждать {wait_hint:.0f}с): {self.report()}")
+        self.save()
+        return changed
+
+    def report(self) -> str:
+        cast, send = self.intervals["cast"], self.intervals["send"]
+        return (f"заброс {cast.value:.2f}с (порог {cast.floor:.2f}с), "
+                f"отправка {send.value:.2f}с (порог {send.floor:.2f}с), "
+                f"отказов {cast.rejects + send.rejects}")
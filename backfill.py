@@ -0,0 +1,89 @@
+# backfill.py | Досчет ивента по истории группы: курсор, пачки сообщений, защита от двойного счета
+import bisect
+import logging
+
+logger = logging.getLogger("event_bot.backfill")
+
+# Сообщений за один запрос истории (максимум Telegram — 100)
+BATCH_SIZE = 100
+
+
+class IdRanges:
+    """
+    Множество id сообщений в виде отсортированных непересекающихся отрезков [a, b].
+    id сообщений группы идут подряд, поэтому и живой счет, и проход по истории
+    дают несколько длинных отрезков — память не растет с числом сообщений.
+    """
+
+    def __init__(self, ranges=None):
+        self._starts = []
+        self._ends = []
+        for a, b in ranges or []:
+            self.add_range(a, b)
+
+    def __contains__(self, msg_id) -> bool:
+        i = bisect.bisect_right(self._starts, msg_id) - 1
+        return i >= 0 and self._ends[i] >= msg_id
+
+    def __len__(self):
+        return len(self._starts)
+
+    def add(self, msg_id) -> bool:
+        """Добавляет id; False — он уже был (сообщение уже посчитано)."""
+        if msg_id in self:
+            return False
+        self.add_range(msg_id, msg_id)
+        return True
+
+    def discard(self, msg_id):
+        """Убирает id (разбор сообщения не удался — его должен посчитать следующий проход)."""
+        i = bisect.bisect_right(self._starts, msg_id) - 1
+        if i < 0 or self._ends[i] < msg_id:
+            return
+        a, b = self._starts[i], self._ends[i]
+        pieces = [(x, y) for x, y in ((a, msg_id - 1), (msg_id + 1, b)) if x <= y]
+        self._starts[i:i + 1] = [x for x, _ in pieces]
+        self._ends[i:i + 1] = [y for _, y in pieces]
+
+    def add_range(self, a: int, b: int):
+        starts, ends = self._starts, self._ends
+        # Все отрезки, пересекающиеся с [a-1, b+1], сливаются в один
+        lo = bisect.bisect_left(ends, a - 1)
+        hi = bisect.bisect_right(starts, b + 1)
+        if lo < hi:
+            a = min(a, starts[lo])
+            b = max(b, ends[hi - 1])
+        starts[lo:hi] = [a]
+        ends[lo:hi] = [b]
+
+    def to_list(self):
+        return [[a, b] for a, b in zip(self._starts, self._ends)]
+
+
+async def fetch_history(client, limiter, chat_id, cursor: int, end_id: int, batch_size: int = BATCH_SIZE):
+    """
+    Пачки сообщений группы по возрастанию id: (cursor, end_id]. Следующая пачка
+    запрашивается только после обработки предыдущей, поэтому в памяти одна пачка.
+    Отправители приходят в той же выдаче (message.sender) — без отдельных запросов.
+    """
+    while cursor < end_id:
+        async with limiter.throttle("get_messages"):
+            batch = await client.get_messages(chat_id, limit=batch_size, offset_id=cursor, reverse=True)
+        batch = [m for m in batch if m.id <= end_id]
+        if not batch:
+            return
+        yield batch
+        cursor = batch[-1].id
+
+
+async def first_id_after(client, limiter, chat_id, start_date) -> int:
+    """id последнего сообщения до start_date (курсор начала прохода); 0 — с самого начала."""
+    async with limiter.throttle("get_messages"):
+        before = await client.get_messages(chat_id, limit=1, offset_date=start_date)
+    return before[0].id if before else 0
+
+
+async def last_id(client, limiter, chat_id) -> int:
+    async with limiter.throttle("get_messages"):
+        latest = await client.get_messages(chat_id, limit=1)
+    return latest[0].id if latest else 0
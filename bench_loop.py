@@ -0,0 +1,198 @@
+# bench_loop.py | Сравнение event loop (asyncio / uvloop) на симуляции бота Qalais
+#
+# Обновления идут через настоящий код Telethon: "сервер Qalais" шлет по TCP
+# сериализованные TL-объекты Updates, приемник разбирает их (BinaryReader), прогоняет
+# через _preprocess_updates и раздает задачами _dispatch_update, как цикл обновлений
+# клиента. Хендлеры NewMessage/MessageEdited зарегистрированы так же, как у FisherAccount,
+# и кладут сообщение в очередь воркера; воркер ждет его через wait_for, ищет кнопку
+# с эмодзи (emoji_button_index из бота) и "кликает" обратно по сокету.
+#
+# Не измеряется: шифрование и транспорт MTProto, сами RPC (заброс и клик — строка
+# в сокет) и перезапрос сообщения перед кликом — их в симуляции нет.
+#
+# Запуск:
+#   python bench_loop.py                      # оба loop, если uvloop установлен
+#   python bench_loop.py --accounts 20 --cycles 300
+import json
+import time
+import struct
+import random
+import asyncio
+import argparse
+import statistics
+from datetime import datetime, timezone
+
+from telethon import TelegramClient, events
+from telethon.sessions import StringSession
+from telethon.extensions import BinaryReader
+from telethon.tl import types
+
+from buttons import emoji_button_index, BLANK_CHAR
+
+EMOJIS = ["🐟", "🐠", "🐡", "🦈", "🐙", "🦑"]
+BOT_ID = 6964500387  # QALAIS_BOT_ID из main.py
+SELF_ID = 1000
+# Кадр: время отправки сервером (perf_counter) и длина TL-объекта
+FRAME = struct.Struct("<dI")
+
+BOT_USER = types.User(id=BOT_ID, bot=True, access_hash=1, first_name="Qalais", bot_info_version=1)
+
+
+def bot_message(msg_id, text, rows):
+    markup = types.ReplyInlineMarkup(rows=[
+        types.KeyboardButtonRow(buttons=[types.KeyboardButtonCallback(t, b"cb") for t in row])
+        for row in rows
+    ])
+    return types.Message(id=msg_id, peer_id=types.PeerUser(BOT_ID), date=datetime.now(timezone.utc),
+                         message=text, out=False, reply_markup=markup)
+
+
+def frame(update) -> bytes:
+    updates = types.Updates(updates=[update], users=[BOT_USER], chats=[],
+                            date=datetime.now(timezone.utc), seq=0)
+    data = bytes(updates)
+    return FRAME.pack(time.perf_counter(), len(data)) + data
+
+
+# ----------------- "Сервер Qalais" -----------------
+async def qalais_server(reader, writer, bite_delay):
+    """На каждый заброс: сообщение ожидания, через bite_delay — редактирование с кнопкой-эмодзи."""
+    msg_id = 0
+    pts = 0
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            req = json.loads(line)
+            pts += 1
+            if req["op"] == "cast":
+                msg_id += 1
+                blank = [[BLANK_CHAR] * 3 for _ in range(3)]
+                writer.write(frame(types.UpdateNewMessage(
+                    bot_message(msg_id, "Вы закинули удочку в воду", blank), pts, 1)))
+                await writer.drain()
+                await asyncio.sleep(bite_delay * random.uniform(0.5, 1.5))
+                buttons = [[BLANK_CHAR] * 3 for _ in range(3)]
+                buttons[random.randrange(3)][random.randrange(3)] = random.choice(EMOJIS)
+                pts += 1
+                writer.write(frame(types.UpdateEditMessage(bot_message(msg_id, "Подсекайте!", buttons), pts, 1)))
+                await writer.drain()
+            elif req["op"] == "click":
+                msg_id += 1
+                writer.write(frame(types.UpdateNewMessage(
+                    bot_message(msg_id, "Вы поймали рыбу", [["Рыбачить"]]), pts, 1)))
+                await writer.drain()
+    finally:
+        writer.close()
+
+
+# ----------------- Аккаунт: клиент Telethon без сети + воркер -----------------
+async def run_account(port, cycles, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    queue = asyncio.Queue(maxsize=128)
+    sent_at = {}  # id сообщения -> когда сервер отправил последнее обновление по нему
+
+    client = TelegramClient(StringSession(), 1, "bench")
+    # Свой id известен заранее, иначе _dispatch_update пойдет за ним в сеть (get_me)
+    client._mb_entity_cache.set_self_user(SELF_ID, False, 0)
+
+    async def on_bot_message(event):
+        # Как FisherAccount._on_any_new_message: при переполнении выбрасываем самое старое
+        m = event.message
+        try:
+            queue.put_nowait(m)
+        except asyncio.QueueFull:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+            queue.put_nowait(m)
+
+    client.add_event_handler(on_bot_message, events.NewMessage(incoming=True, chats=BOT_ID))
+    client.add_event_handler(on_bot_message, events.MessageEdited(chats=BOT_ID))
+
+    async def receiver():
+        # Цикл обновлений клиента: разбор TL, сущности в кэш, каждое обновление — своей задачей
+        tasks = set()
+        while True:
+            try:
+                sent, size = FRAME.unpack(await reader.readexactly(FRAME.size))
+                data = await reader.readexactly(size)
+            except asyncio.IncompleteReadError:
+                return
+            updates = BinaryReader(data).tgread_object()
+            for u in await client._preprocess_updates(updates.updates, updates.users, updates.chats):
+                sent_at[u.message.id] = sent
+                task = asyncio.create_task(client._dispatch_update(u))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+    recv_task = asyncio.create_task(receiver())
+    try:
+        for _ in range(cycles):
+            writer.write(b'{"op": "cast"}\n')
+            await writer.drain()
+            # Ждем кнопку с эмодзи
+            while True:
+                m = await asyncio.wait_for(queue.get(), timeout=10.0)
+                idx, _ = emoji_button_index(m)
+                if idx is not None:
+                    latencies.append(time.perf_counter() - sent_at[m.id])
+                    writer.write((json.dumps({"op": "click", "id": m.id, "idx": idx}) + "\n").encode())
+                    await writer.drain()
+                    break
+            # Ждем результат
+            while True:
+                m = await asyncio.wait_for(queue.get(), timeout=10.0)
+                if "поймали" in (m.raw_text or ""):
+                    break
+    finally:
+        recv_task.cancel()
+        writer.close()
+
+
+async def bench(accounts, cycles, bite_delay):
+    server = await asyncio.start_server(lambda r, w: qalais_server(r, w, bite_delay), "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    latencies = []
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    async with server:
+        await asyncio.gather(*(run_account(port, cycles, latencies) for _ in range(accounts)))
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    return latencies, cpu, wall
+
+
+def run_with(name, loop_factory, args):
+    random.seed(args.seed)
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        latencies, cpu, wall = runner.run(bench(args.accounts, args.cycles, args.bite_delay))
+    latencies.sort()
+    total = len(latencies)
+    p = lambda q: latencies[min(total - 1, int(q * total))] * 1e6
+    print(f"{name:<8} циклов {total:6d}  обновление→клик: p50 {p(0.50):7.0f}мкс  p99 {p(0.99):7.0f}мкс  "
+          f"ср {statistics.fmean(latencies) * 1e6:7.0f}мкс  | CPU/цикл {cpu / total * 1e6:6.0f}мкс  "
+          f"(CPU {cpu:.2f}с за {wall:.2f}с)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк event loop на симуляции бота Qalais")
+    parser.add_argument("--accounts", type=int, default=10, help="параллельных аккаунтов")
+    parser.add_argument("--cycles", type=int, default=200, help="циклов на аккаунт")
+    parser.add_argument("--bite-delay", type=float, default=0.005, help="задержка поклевки, с")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    loops = [("asyncio", None)]
+    try:
+        import uvloop
+        loops.append(("uvloop", uvloop.new_event_loop))
+    except ImportError:
+        print("uvloop не установлен — сравнение только для стандартного loop (pip install uvloop)")
+
+    for name, factory in loops:
+        run_with(name, factory, args)
+
+
+if __name__ == "__main__":
+    main()
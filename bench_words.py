@@ -0,0 +1,98 @@
+# bench_words.py | Подсчет загаданных слов в сообщениях группы: цикл str.count против WordMatcher
+#
+# Генерирует словарь из N загаданных слов и поток сообщений "шумной" группы
+# (обычные фразы, длинные расшифровки голосовых, вхождения слов и корней),
+# проверяет, что счет совпадает, и печатает пропускную способность.
+#
+# Запуск:
+#   python bench_words.py                     # 7, 100, 300 и 500 слов
+#   python bench_words.py --words 300 --messages 20000
+import time
+import random
+import argparse
+
+import word_matcher
+from word_matcher import WordMatcher
+
+ALPHABET = "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+FILLER = ["привет", "кто", "на", "рыбалку", "сегодня", "завтра", "ну", "да", "нет", "лол",
+          "клев", "удочка", "поймал", "карась", "щука", "го", "ребята", "кто-нибудь", "видел", "это"]
+
+
+def make_words(n: int, rng: random.Random):
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(ALPHABET) for _ in range(rng.randint(3, 9))))
+    return sorted(words)
+
+
+def make_messages(n: int, words, rng: random.Random):
+    messages = []
+    for _ in range(n):
+        # 80% коротких реплик, 20% длинных расшифровок голосовых
+        length = rng.randint(3, 15) if rng.random() < 0.8 else rng.randint(60, 200)
+        tokens = []
+        for _ in range(length):
+            if rng.random() < 0.05:
+                w = rng.choice(words)
+                tokens.append(w + rng.choice(["", "а", "ом", "у", w]))
+            else:
+                tokens.append(rng.choice(FILLER))
+        messages.append(" ".join(tokens))
+    return messages
+
+
+def count_naive(terms, text):
+    found = {}
+    for term in terms:
+        n = text.count(term)
+        if n:
+            found[term] = n
+    return found
+
+
+def bench(words_n: int, messages_n: int, seed: int):
+    rng = random.Random(seed)
+    terms = make_words(words_n, rng)
+    messages = make_messages(messages_n, terms, rng)
+    chars = sum(len(m) for m in messages)
+
+    started = time.perf_counter()
+    matcher = WordMatcher(terms)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    naive = [count_naive(terms, m) for m in messages]
+    t_naive = time.perf_counter() - started
+
+    started = time.perf_counter()
+    fast = [matcher.count(m) for m in messages]
+    t_fast = time.perf_counter() - started
+
+    if naive != fast:
+        bad = next(i for i, (a, b) in enumerate(zip(naive, fast)) if a != b)
+        raise SystemExit(f"❌ Счет расходится на сообщении {bad}: {naive[bad]} != {fast[bad]}")
+
+    print(f"\n=== {words_n} слов, {messages_n} сообщений ({chars / messages_n:.0f} симв. в среднем) ===")
+    mode = "регулярка-бор" if matcher.use_scan else "цикл str.count"
+    print(f"  сборка:           {build * 1000:.1f} мс")
+    print(f"  str.count:        {messages_n / t_naive:10.0f} сообщ/с")
+    print(f"  WordMatcher:      {messages_n / t_fast:10.0f} сообщ/с  (x{t_naive / t_fast:.1f}, {mode})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк подсчета загаданных слов")
+    parser.add_argument("--words", type=int, nargs="*", default=[7, 100, 300, 500])
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--scan-min-terms", type=int, default=None,
+                        help="порог переключения на регулярку-бор (для подбора SCAN_MIN_TERMS)")
+    args = parser.parse_args()
+    if args.scan_min_terms is not None:
+        word_matcher.SCAN_MIN_TERMS = args.scan_min_terms
+    for n in args.words:
+        bench(n, args.messages, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+# buttons.py | Поиск кнопки поклевки в сообщении Qalais (общий для бота и бенчмарка)
+
+# Пустая клетка поля — "пустой" символ Брайля
+BLANK_CHAR = "\u2800"
+
+
+def emoji_button_index(message):
+    """
+    (индекс в плоском списке кнопок, текст) кнопки с эмодзи — короткой кнопки без букв,
+    отличающейся от большинства кнопок поля; (None, None), если такой нет.
+    """
+    flat = []
+    for row in getattr(message, "buttons", None) or []:
+        for b in row: flat.append((getattr(b, "text", "") or "").strip())
+
+    button_stats = {}
+    for s in flat:
+        if s: button_stats[s] = button_stats.get(s, 0) + 1
+
+    most_common = max(button_stats.items(), key=lambda x: x[1])[0] if button_stats else ""
+
+    for i, s in enumerate(flat):
+        if not s: continue
+        if all(ch == BLANK_CHAR for ch in s): continue
+        if any(ch.isalpha() for ch in s.lower()): continue
+        if s != most_common and len(s) <= 3:
+            return i, s
+    return None, None
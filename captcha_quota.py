@@ -0,0 +1,239 @@
+# captcha_quota.py | Журнал квот моделей Gemini (переживает перезапуски)
+import re
+import json
+import time
+import logging
+from datetime import datetime, timedelta, timezone
+
+from utils import write_json_atomic
+
+logger = logging.getLogger("auto_fisher.quota")
+
+# Лимиты бесплатного тарифа: rpm = запросов в минуту, rpd = запросов в день
+# https://ai.google.dev/gemini-api/docs/rate-limits
+DEFAULT_MODEL_LIMITS = {
+    "gemini-2.5-flash": {"rpm": 10, "rpd": 250},
+    "gemini-2.5-flash-lite": {"rpm": 15, "rpd": 1000},
+    "gemini-robotics-er-1.5-preview": {"rpm": 10, "rpd": 250},
+}
+FALLBACK_LIMITS = {"rpm": 10, "rpd": 250}
+
+# Сколько последних капч помнить для оценки темпа
+CAPTCHA_HISTORY_SIZE = 50
+
+
+def _pacific_tz():
+    """Дневные квоты Gemini сбрасываются в полночь по тихоокеанскому времени."""
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo("America/Los_Angeles")
+    except Exception:
+        # На Windows без пакета tzdata — приблизительно (без летнего времени)
+        return timezone(timedelta(hours=-8))
+
+
+PACIFIC_TZ = _pacific_tz()
+
+
+def _day_key(ts: float) -> str:
+    return datetime.fromtimestamp(ts, PACIFIC_TZ).strftime("%Y-%m-%d")
+
+
+def next_daily_reset(ts: float) -> float:
+    """Момент следующего дневного сброса квот (epoch)."""
+    local = datetime.fromtimestamp(ts, PACIFIC_TZ)
+    midnight = (local + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight.timestamp()
+
+
+def _parse_retry_delay(error_str: str):
+    """Достает retryDelay (в секундах) из текста ошибки RESOURCE_EXHAUSTED, если он есть."""
+    m = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", error_str)
+    if m:
+        return float(m.group(1))
+    return None
+
+
+class QuotaLedger:
+    """
+    Учет запросов к каждой модели за минуту и за сутки.
+    Состояние сохраняется в JSON, чтобы после перезапуска не тратить
+    запрос на модель, которая уже исчерпала лимит.
+    """
+
+    def __init__(self, path: str, models, limits=None):
+        self.path = path
+        self.models = list(models)
+        self.limits = dict(DEFAULT_MODEL_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        # models: {model: {"minute": [ts...], "day": "YYYY-MM-DD", "day_count": int, "exhausted_until": ts|None}}
+        self.state = {"models": {}, "captchas": []}
+        self._load()
+
+    # ---------- хранение ----------
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self.state["models"] = data.get("models", {}) or {}
+                self.state["captchas"] = data.get("captchas", []) or []
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать журнал квот {self.path}: {e}")
+
+    def save(self):
+        try:
+            write_json_atomic(self.path, self.state, ensure_ascii=False)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить журнал квот: {e}")
+
+    # ---------- учет ----------
+    def _limits_for(self, model: str) -> dict:
+        return self.limits.get(model, FALLBACK_LIMITS)
+
+    def _entry(self, model: str, now: float) -> dict:
+        entry = self.state["models"].setdefault(
+            model, {"minute": [], "day": _day_key(now), "day_count": 0, "exhausted_until": None}
+        )
+        # Новый день по тихоокеанскому времени — дневной счетчик обнуляется
+        today = _day_key(now)
+        if entry.get("day") != today:
+            entry["day"] = today
+            entry["day_count"] = 0
+        entry["minute"] = [t for t in entry.get("minute", []) if now - t < 60.0]
+        until = entry.get("exhausted_until")
+        if until and until <= now:
+            entry["exhausted_until"] = None
+        return entry
+
+    def available_in(self, model: str, now: float = None) -> float:
+        """Через сколько секунд модель снова сможет принять запрос (0 — прямо сейчас)."""
+        now = now or time.time()
+        entry = self._entry(model, now)
+        limits = self._limits_for(model)
+        wait = 0.0
+        if entry.get("exhausted_until"):
+            wait = max(wait, entry["exhausted_until"] - now)
+        if entry["day_count"] >= limits["rpd"]:
+            wait = max(wait, next_daily_reset(now) - now)
+        if len(entry["minute"]) >= limits["rpm"]:
+            wait = max(wait, 60.0 - (now - min(entry["minute"])))
+        return wait
+
+    def is_available(self, model: str, now: float = None) -> bool:
+        return self.available_in(model, now) <= 0
+
+    def record_request(self, model: str):
+        """Фиксирует запрос к модели (вызывать перед обращением к API)."""
+        now = time.time()
+        entry = self._entry(model, now)
+        entry["minute"].append(now)
+        entry["day_count"] += 1
+        self.save()
+
+    def mark_exhausted(self, model: str, error_str: str = ""):
+        """Помечает модель исчерпанной после RESOURCE_EXHAUSTED до ближайшего окна сброса."""
+        now = time.time()
+        entry = self._entry(model, now)
+        retry_delay = _parse_retry_delay(error_str)
+        is_daily = "perday" in error_str.lower().replace("_", "").replace(" ", "")
+
+        if is_daily:
+            until = next_daily_reset(now)
+        elif retry_delay is not None:
+            until = now + retry_delay
+        elif entry["day_count"] >= self._limits_for(model)["rpd"] * 0.9:
+            # Почти весь дневной лимит потрачен — скорее всего это суточная квота
+            until = next_daily_reset(now)
+        else:
+            until = now + 60.0
+
+        entry["exhausted_until"] = until
+        self.save()
+        logger.warning(
+            f"📒 Квота {model} исчерпана до "
+            f"{datetime.fromtimestamp(until, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')} UTC"
+        )
+
+    def record_captcha(self):
+        """Фиксирует появление капчи — по этим отметкам оценивается темп расхода квот."""
+        captchas = self.state["captchas"]
+        captchas.append(time.time())
+        del captchas[:-CAPTCHA_HISTORY_SIZE]
+        self.save()
+
+    # ---------- прогноз ----------
+    def captcha_rate_per_hour(self, now: float = None):
+        now = now or time.time()
+        recent = [t for t in self.state["captchas"] if now - t < 24 * 3600]
+        if len(recent) < 2:
+            return None
+        span = max(now - recent[0], 60.0)
+        return len(recent) / (span / 3600.0)
+
+    def remaining_today(self, now: float = None) -> int:
+        now = now or time.time()
+        reset_at = next_daily_reset(now)
+        total = 0
+        for model in self.models:
+            entry = self._entry(model, now)
+            until = entry.get("exhausted_until")
+            if until and until >= reset_at:
+                continue
+            total += max(0, self._limits_for(model)["rpd"] - entry["day_count"])
+        return total
+
+    def next_available_at(self, now: float = None):
+        """Ближайший момент, когда хоть одна модель станет доступна (epoch)."""
+        now = now or time.time()
+        waits = [self.available_in(m, now) for m in self.models]
+        return now + min(waits) if waits else None
+
+    def forecast(self, rate_per_hour: float = None) -> dict:
+        """
+        Прогноз: когда при текущем темпе капч закончатся все модели.
+        Один запрос к модели на капчу — нижняя оценка.
+        """
+        now = time.time()
+        rate = rate_per_hour if rate_per_hour is not None else self.captcha_rate_per_hour(now)
+        remaining = self.remaining_today(now)
+        reset_at = next_daily_reset(now)
+        exhausted_at = None
+        if rate and rate > 0:
+            at = now + remaining / rate * 3600.0
+            if at < reset_at:
+                exhausted_at = at
+        elif remaining == 0:
+            exhausted_at = now
+        return {
+            "remaining": remaining,
+            "rate_per_hour": rate,
+            "exhausted_at": exhausted_at,
+            "reset_at": reset_at,
+        }
+
+    def summary(self) -> str:
+        now = time.time()
+        parts = []
+        for model in self.models:
+            entry = self._entry(model, now)
+            limits = self._limits_for(model)
+            status = "✅"
+            wait = self.available_in(model, now)
+            if wait > 0:
+                status = f"⛔ ещё {max(1, int(wait // 60))}м"
+            parts.append(f"{model}: {entry['day_count']}/{limits['rpd']} за день {status}")
+        fc = self.forecast()
+        if fc["rate_per_hour"]:
+            tail = f"темп {fc['rate_per_hour']:.1f} капч/ч"
+            if fc["exhausted_at"]:
+                tail += ", лимиты закончатся в " + datetime.fromtimestamp(
+                    fc["exhausted_at"], timezone.utc).strftime("%H:%M UTC")
+            else:
+                tail += ", лимитов хватит до сброса"
+        else:
+            tail = "темп капч пока неизвестен"
+        return "; ".join(parts) + f" | осталось {fc['remaining']} запросов, {tail}"
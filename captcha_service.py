@@ -0,0 +1,345 @@
+# captcha_service.py | Общий сервис решения капчи для всех аккаунтов и шардов
+#
+# Запуск (отдельный процесс):
+#   python captcha_service.py --port 9200
+# Боты подключаются через CAPTCHA_SERVICE_URL=http://127.0.0.1:9200
+#
+# Сервис один на весь парк: одинаковые картинки решаются один раз (кэш ответов и
+# склейка одновременных запросов), журнал квот и ротация моделей общие, капчи разных
+# аккаунтов собираются в один запрос к модели, а очередь обходится по аккаунтам по кругу,
+# чтобы один аккаунт с потоком капч не задерживал остальных.
+import os
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import argparse
+from collections import OrderedDict, deque
+
+from utils import percentile
+from captcha_quota import QuotaLedger, DEFAULT_MODEL_LIMITS
+from captcha_solver import (
+    ask_model, ask_model_batch, needs_second_opinion, get_consensus, crop_captcha_image,
+)
+
+logger = logging.getLogger("auto_fisher.captcha_service")
+
+# Сколько капч максимум в одном запросе к модели и сколько ждать попутчиков (секунды)
+BATCH_MAX = int(os.getenv("CAPTCHA_BATCH_MAX", "4"))
+BATCH_WINDOW = float(os.getenv("CAPTCHA_BATCH_WINDOW", "0.3"))
+# Одновременных запросов к моделям
+CONCURRENCY = int(os.getenv("CAPTCHA_CONCURRENCY", "4"))
+# Кэш ответов по хешу картинки и вариантов
+CACHE_TTL = 3600.0
+CACHE_SIZE = 5000
+# Таймауты запроса к модели: одна капча / пачка
+MODEL_TIMEOUT = 60.0
+BATCH_TIMEOUT = 90.0
+# Таймаут клиента (бот ждет ответ сервиса)
+CLIENT_TIMEOUT = 150.0
+
+
+class SolveJob:
+    __slots__ = ("key", "account", "image", "options", "enqueued_at")
+
+    def __init__(self, key, account, image, options):
+        self.key = key
+        self.account = account
+        self.image = image
+        self.options = options
+        self.enqueued_at = time.perf_counter()
+
+
+class CaptchaService:
+    """
+    solve() возвращает dict:
+      {"status": "ok", "answer", "model", "confidence", "cached"}
+      {"status": "no_answer", "model"}             — модели не смогли выбрать вариант
+      {"status": "exhausted", "next_available_at"} — квоты всех моделей исчерпаны
+      {"status": "error", "error"}                 — другая ошибка модели
+    """
+
+    def __init__(self, ledger: QuotaLedger, models, genai_client_factory,
+                 batch_max: int = BATCH_MAX, batch_window: float = BATCH_WINDOW, concurrency: int = CONCURRENCY):
+        self.ledger = ledger
+        self.models = list(models)
+        self.genai_client_factory = genai_client_factory
+        self.batch_max = max(1, batch_max)
+        self.batch_window = batch_window
+        self.model_index = 0
+        self.cache = OrderedDict()   # ключ -> (истекает, результат)
+        self.inflight = {}           # ключ -> future общего решения
+        self.queues = OrderedDict()  # аккаунт -> deque(SolveJob), порядок = очередь обхода
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._tasks = set()
+        self.latencies = deque(maxlen=1000)
+        self.stats = {"requests": 0, "cache_hits": 0, "deduped": 0, "unique": 0,
+                      "model_calls": 0, "batches": 0, "batched_images": 0}
+        self.per_account = {}
+
+    # ---------- прием запросов ----------
+    @staticmethod
+    def image_key(image: bytes, options) -> str:
+        h = hashlib.sha256(image)
+        h.update("\x1f".join(options).encode("utf-8"))
+        return h.hexdigest()
+
+    def _cache_get(self, key):
+        item = self.cache.get(key)
+        if item is None:
+            return None
+        expires, result = item
+        if expires < time.monotonic():
+            del self.cache[key]
+            return None
+        self.cache.move_to_end(key)
+        return result
+
+    def _cache_put(self, key, result):
+        self.cache[key] = (time.monotonic() + CACHE_TTL, result)
+        self.cache.move_to_end(key)
+        while len(self.cache) > CACHE_SIZE:
+            self.cache.popitem(last=False)
+
+    async def solve(self, account: str, image: bytes, options) -> dict:
+        started = time.perf_counter()
+        options = list(options)
+        self.stats["requests"] += 1
+        self.per_account[account] = self.per_account.get(account, 0) + 1
+        key = self.image_key(image, options)
+
+        cached = self._cache_get(key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            return dict(cached, cached=True)
+
+        future = self.inflight.get(key)
+        if future is not None:
+            self.stats["deduped"] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self.inflight[key] = future
+            self.stats["unique"] += 1
+            self.queues.setdefault(account, deque()).append(SolveJob(key, account, image, options))
+            self._wakeup.set()
+        # shield: отмена одного ожидающего не отменяет решение для остальных
+        result = await asyncio.shield(future)
+        self.latencies.append(time.perf_counter() - started)
+        return dict(result, cached=False)
+
+    # ---------- очередь и пачки ----------
+    def _pending(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+    def _take_batch(self):
+        """По одной капче от каждого аккаунта по кругу, пока не наберется batch_max."""
+        batch = []
+        while len(batch) < self.batch_max and self.queues:
+            account, queue = next(iter(self.queues.items()))
+            batch.append(queue.popleft())
+            if queue:
+                self.queues.move_to_end(account)
+            else:
+                del self.queues[account]
+        return batch
+
+    async def run(self):
+        """Диспетчер: собирает пачки и отдает их в работу в пределах CONCURRENCY."""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # Короткое окно, чтобы капчи других аккаунтов ушли тем же запросом
+            if self.batch_max > 1 and self._pending() < self.batch_max:
+                await asyncio.sleep(self.batch_window)
+            while self.queues:
+                await self._slots.acquire()
+                batch = self._take_batch()
+                if not batch:
+                    self._slots.release()
+                    break
+                task = asyncio.create_task(self._run_batch(batch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch):
+        try:
+            images = await asyncio.gather(*(asyncio.to_thread(self._prepare, job.image) for job in batch))
+            results = await self._solve_images(images, [job.options for job in batch])
+        except Exception as e:
+            logger.exception(f"❌ Ошибка решения пачки капч: {e}")
+            results = [{"status": "error", "error": str(e)}] * len(batch)
+        finally:
+            self._slots.release()
+        for job, result in zip(batch, results):
+            if result["status"] == "ok":
+                self._cache_put(job.key, result)
+            future = self.inflight.pop(job.key, None)
+            if future is not None and not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _prepare(raw: bytes) -> bytes:
+        try:
+            return crop_captcha_image(raw)
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка обработки изображения PIL, используем оригинал: {e}")
+            return raw
+
+    # ---------- модели ----------
+    def _pick_model(self):
+        """Текущая модель или следующая по кругу, у которой по журналу еще есть квота."""
+        for step in range(len(self.models)):
+            index = (self.model_index + step) % len(self.models)
+            if self.ledger.is_available(self.models[index]):
+                self.model_index = index
+                return self.models[index]
+        return None
+
+    async def _solve_images(self, images, options_list):
+        genai_client = await asyncio.to_thread(self.genai_client_factory)
+        if genai_client is None:
+            return [{"status": "error", "error": "Клиент Gemini не инициализирован"}] * len(images)
+
+        for _ in range(len(self.models)):
+            model = self._pick_model()
+            if model is None:
+                break
+            self.ledger.record_request(model)
+            self.stats["model_calls"] += 1
+            try:
+                if len(images) == 1:
+                    answers = [await asyncio.wait_for(
+                        ask_model(genai_client, model, images[0], options_list[0]), timeout=MODEL_TIMEOUT)]
+                else:
+                    self.stats["batches"] += 1
+                    self.stats["batched_images"] += len(images)
+                    answers = await asyncio.wait_for(
+                        ask_model_batch(genai_client, model, images, options_list), timeout=BATCH_TIMEOUT)
+            except Exception as e:
+                error_str = str(e)
+                if "RESOURCE_EXHAUSTED" in error_str.upper() or ("404" in error_str and "NOT_FOUND" in error_str.upper()):
+                    logger.warning(f"⚠️ Модель {model} недоступна или лимит исчерпан, пробуем следующую")
+                    if "RESOURCE_EXHAUSTED" in error_str.upper():
+                        self.ledger.mark_exhausted(model, error_str)
+                    self.model_index = (self.model_index + 1) % len(self.models)
+                    continue
+                if isinstance(e, asyncio.TimeoutError):
+                    error_str = f"Тайм-аут ожидания ответа от {model}"
+                return [{"status": "error", "error": f"{model}: {error_str}"}] * len(images)
+
+            results = []
+            for image, options, answer in zip(images, options_list, answers):
+                self.ledger.record_captcha()
+                # Сомнительные ответы перепроверяем по одному (вторым мнением других моделей)
+                if needs_second_opinion(answer):
+                    answer = await get_consensus(genai_client, self.ledger, self.models, answer, image, options)
+                if answer and answer.answer:
+                    results.append({"status": "ok", "answer": answer.answer,
+                                    "model": answer.model, "confidence": answer.confidence})
+                else:
+                    results.append({"status": "no_answer", "model": model})
+            return results
+
+        return [{"status": "exhausted", "next_available_at": self.ledger.next_available_at()}] * len(images)
+
+    # ---------- метрики ----------
+    def snapshot(self) -> dict:
+        latencies = sorted(self.latencies)
+        requests = self.stats["requests"]
+        return {
+            **self.stats,
+            "model_calls_per_request": round(self.stats["model_calls"] / requests, 3) if requests else 0.0,
+            "latency_s": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+                          "max": latencies[-1] if latencies else 0.0},
+            "queued": self._pending(),
+            "inflight": len(self.inflight),
+            "cache_size": len(self.cache),
+            "per_account": dict(self.per_account),
+            "model": self.models[self.model_index],
+            "quota": self.ledger.summary(),
+        }
+
+
+# ----------------- HTTP-интерфейс -----------------
+def create_app(service: CaptchaService):
+    from aiohttp import web
+
+    async def solve(request):
+        try:
+            data = await request.json()
+            image = base64.b64decode(data["image"])
+            options = [str(o) for o in data["options"]]
+        except Exception as e:
+            return web.json_response({"status": "error", "error": f"bad request: {e}"}, status=400)
+        result = await service.solve(str(data.get("account") or "?"), image, options)
+        return web.json_response(result)
+
+    async def stats(request):
+        return web.json_response(service.snapshot())
+
+    app = web.Application(client_max_size=8 * 1024 * 1024)
+    app.router.add_post("/solve", solve)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+_session = None
+
+
+async def request_solve(url: str, account: str, image: bytes, options, timeout: float = CLIENT_TIMEOUT) -> dict:
+    """Клиент для бота: отправляет картинку и варианты в сервис и возвращает его ответ."""
+    global _session
+    import aiohttp
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession()
+    payload = {"account": account, "options": list(options), "image": base64.b64encode(image).decode("ascii")}
+    async with _session.post(url.rstrip("/") + "/solve", json=payload,
+                             timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+        return await resp.json()
+
+
+async def serve(host: str, port: int, data_dir: str, models):
+    from aiohttp import web
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    genai_client = None
+
+    def genai_client_factory():
+        nonlocal genai_client
+        if genai_client is None and api_key:
+            from google import genai
+            genai_client = genai.Client(api_key=api_key)
+        return genai_client
+
+    ledger = QuotaLedger(os.path.join(data_dir, "captcha_quota.json"), models)
+    service = CaptchaService(ledger, models, genai_client_factory)
+    runner = web.AppRunner(create_app(service))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"🧠 Сервис капчи слушает http://{host}:{port} (модели: {', '.join(models)}; квоты: {ledger.summary()})")
+    try:
+        await service.run()
+    finally:
+        await runner.cleanup()
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Общий сервис решения капчи для Auto Fisher Bot")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--data-dir", default=os.getenv("DATA_DIR", "data"), help="папка журнала квот")
+    parser.add_argument("--models", default=",".join(DEFAULT_MODEL_LIMITS), help="модели через запятую, по порядку")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(serve(args.host, args.port, args.data_dir, [m.strip() for m in args.models.split(",") if m.strip()]))
+    except KeyboardInterrupt:
+        logger.info("👋 Сервис капчи остановлен")
+
+
+if __name__ == "__main__":
+    main()
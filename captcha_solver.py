@@ -0,0 +1,303 @@
+# captcha_solver.py | Структурированные ответы ИИ на капчу и выбор по уверенности
+import io
+import re
+import json
+import asyncio
+import logging
+from typing import Optional, TYPE_CHECKING
+
+# google.genai и PIL импортируются при первом использовании: их импорт занимает секунды,
+# а капча нужна далеко не сразу после запуска
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger("auto_fisher.captcha")
+
+# Ниже этой уверенности ответ перепроверяется другими моделями
+CAPTCHA_CONFIDENCE_THRESHOLD = 0.75
+# Сколько дополнительных моделей опрашивать параллельно при сомнениях
+CAPTCHA_SECOND_OPINIONS = 2
+# Уверенность, которую получает ответ, распознанный из свободного текста
+FREE_TEXT_CONFIDENCE = 0.5
+
+
+def crop_captcha_image(raw_img: bytes) -> bytes:
+    """
+    Обрезает правые ~35% картинки (текст "ПРОВЕРКА НА РОБОТА...") и
+    возвращает JPEG. Синхронная и CPU-тяжелая — вызывать через asyncio.to_thread.
+    """
+    from PIL import Image
+    with Image.open(io.BytesIO(raw_img)) as img:
+        width, height = img.size
+        # Текст находится справа, а нужный объект слева/по центру
+        crop_width = int(width * 0.65)
+        cropped_img = img.crop((0, 0, crop_width, height))
+        if img.mode in ("RGBA", "P"):
+            cropped_img = cropped_img.convert("RGB")
+        output_buffer = io.BytesIO()
+        cropped_img.save(output_buffer, format="JPEG")
+        return output_buffer.getvalue()
+
+
+class CaptchaAnswer:
+    """Ответ одной модели: выбранный вариант, уверенность и все упомянутые варианты."""
+
+    def __init__(self, model: str, answer: Optional[str], confidence: float, candidates=None, raw: str = ""):
+        self.model = model
+        self.answer = answer
+        self.confidence = confidence
+        self.candidates = candidates or ([answer] if answer else [])
+        self.raw = raw
+
+    @property
+    def is_ambiguous(self) -> bool:
+        return self.answer is None and len(self.candidates) > 1
+
+    def __repr__(self):
+        return f"CaptchaAnswer({self.model!r}, {self.answer!r}, {self.confidence:.2f})"
+
+
+def build_prompt(options) -> str:
+    return (
+        f"This is a captcha check. The image contains one MAIN object which is significantly LARGER than the others. "
+        f"There are also small decoy icons and chaotic lines - IGNORE them. "
+        f"Look strictly for the single BIGGEST visual element in the image. "
+        f"Compare this biggest object with the following emoji options: {', '.join(options)}. "
+        f"Answer with JSON: \"answer\" is the single emoji from the list that matches the biggest object, "
+        f"\"confidence\" is a number from 0 to 1 showing how sure you are."
+    )
+
+
+def build_config(options) -> "types.GenerateContentConfig":
+    """Просим модель ответить строго по схеме: вариант из списка + уверенность."""
+    from google.genai import types
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema={
+            "type": "OBJECT",
+            "properties": {
+                "answer": {"type": "STRING", "enum": list(options)},
+                "confidence": {"type": "NUMBER"},
+            },
+            "required": ["answer", "confidence"],
+        },
+    )
+
+
+def parse_answer(model: str, raw_text: str, options) -> CaptchaAnswer:
+    """
+    Разбирает ответ модели. Сначала как JSON по схеме,
+    если не вышло — ищет варианты в свободном тексте (как раньше).
+    """
+    raw = (raw_text or "").strip()
+
+    # 1. Структурированный ответ (иногда модель оборачивает его в ```json)
+    cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", raw)
+    try:
+        data = json.loads(cleaned)
+        if isinstance(data, dict):
+            answer = str(data.get("answer", "")).strip()
+            try:
+                confidence = float(data.get("confidence", 0.0))
+            except (TypeError, ValueError):
+                confidence = 0.0
+            confidence = min(max(confidence, 0.0), 1.0)
+            if answer in options:
+                return CaptchaAnswer(model, answer, confidence, raw=raw)
+            found = [opt for opt in options if opt in answer]
+            if len(found) == 1:
+                return CaptchaAnswer(model, found[0], confidence, raw=raw)
+            return CaptchaAnswer(model, None, 0.0, candidates=found, raw=raw)
+    except (ValueError, TypeError):
+        pass
+
+    # 2. Свободный текст: точное совпадение или единственный упомянутый вариант
+    if raw in options:
+        return CaptchaAnswer(model, raw, FREE_TEXT_CONFIDENCE, raw=raw)
+    found = [opt for opt in options if opt in raw]
+    if len(found) == 1:
+        return CaptchaAnswer(model, found[0], FREE_TEXT_CONFIDENCE, raw=raw)
+    return CaptchaAnswer(model, None, 0.0, candidates=found, raw=raw)
+
+
+def needs_second_opinion(answer: CaptchaAnswer) -> bool:
+    return answer.answer is None or answer.confidence < CAPTCHA_CONFIDENCE_THRESHOLD
+
+
+def _vote(answers):
+    """{вариант: вес}: голоса с весами по уверенности; неоднозначные ответы делят небольшой вес."""
+    scores = {}
+    for a in answers:
+        if a.answer:
+            scores[a.answer] = scores.get(a.answer, 0.0) + max(a.confidence, 0.05)
+        elif a.candidates:
+            for c in a.candidates:
+                scores[c] = scores.get(c, 0.0) + 0.05 / len(a.candidates)
+    return scores
+
+
+def _leaders(scores):
+    best_score = max(scores.values())
+    return [c for c, v in scores.items() if v == best_score]
+
+
+def is_tie(answers) -> bool:
+    scores = _vote(answers)
+    return bool(scores) and len(_leaders(scores)) > 1
+
+
+def combine_answers(answers) -> Optional[CaptchaAnswer]:
+    """
+    Голосование с весами по уверенности; answers[0] — ответ основной модели.
+    При ничьей побеждает вариант основной модели (или самый уверенный из равных),
+    а не отказ: None — только если вариантов нет совсем.
+    """
+    scores = _vote(answers)
+    if not scores:
+        return None
+
+    leaders = _leaders(scores)
+    best = leaders[0]
+    if len(leaders) > 1:
+        primary = answers[0]
+        if primary.answer in leaders:
+            best = primary.answer
+        else:
+            best = max(leaders, key=lambda c: max((a.confidence for a in answers if a.answer == c), default=0.0))
+        logger.info(f"⚖️ CAPTCHA: Ничья между {', '.join(leaders)}, выбираем {best}")
+    best_score = scores[best]
+    total = sum(scores.values())
+    models = "+".join(a.model for a in answers if a.answer == best) or "consensus"
+    return CaptchaAnswer(models, best, best_score / total if total else 0.0, raw="consensus")
+
+
+async def ask_model(genai_client, model: str, image_data: bytes, options) -> CaptchaAnswer:
+    """Один запрос к модели со структурированным ответом."""
+    from google.genai import types
+    response = await asyncio.to_thread(
+        genai_client.models.generate_content,
+        model=model,
+        contents=[
+            types.Part.from_bytes(data=image_data, mime_type="image/jpeg"),
+            build_prompt(options),
+        ],
+        config=build_config(options),
+    )
+    return parse_answer(model, response.text or "", options)
+
+
+# ---------- несколько капч одним запросом (общий сервис капчи) ----------
+def build_batch_prompt(options_list) -> str:
+    lines = [
+        f"You will get {len(options_list)} captcha images, numbered from 1 in the order they are given. "
+        f"Each image contains one MAIN object which is significantly LARGER than the others, "
+        f"plus small decoy icons and chaotic lines - IGNORE them. "
+        f"For every image find the single BIGGEST visual element and pick the matching emoji from that image's options.",
+    ]
+    for i, options in enumerate(options_list, 1):
+        lines.append(f"Image {i} options: {', '.join(options)}")
+    lines.append(
+        "Answer with a JSON array, one object per image: \"index\" is the image number, "
+        "\"answer\" is the single emoji from that image's options, "
+        "\"confidence\" is a number from 0 to 1 showing how sure you are."
+    )
+    return "\n".join(lines)
+
+
+def build_batch_config(options_list) -> "types.GenerateContentConfig":
+    from google.genai import types
+    all_options = sorted({opt for options in options_list for opt in options})
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema={
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "index": {"type": "INTEGER"},
+                    "answer": {"type": "STRING", "enum": all_options},
+                    "confidence": {"type": "NUMBER"},
+                },
+                "required": ["index", "answer", "confidence"],
+            },
+        },
+    )
+
+
+def parse_batch_answer(model: str, raw_text: str, options_list):
+    """[CaptchaAnswer] по порядку картинок; пропущенные или чужие варианты — пустой ответ."""
+    raw = (raw_text or "").strip()
+    cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", raw)
+    answers = [CaptchaAnswer(model, None, 0.0, raw=raw) for _ in options_list]
+    try:
+        data = json.loads(cleaned)
+    except (ValueError, TypeError):
+        return answers
+    if not isinstance(data, list):
+        return answers
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        try:
+            i = int(item.get("index", 0)) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= i < len(options_list):
+            answers[i] = parse_answer(model, json.dumps(item, ensure_ascii=False), options_list[i])
+    return answers
+
+
+async def ask_model_batch(genai_client, model: str, images, options_list):
+    """Несколько капч одним запросом: квота моделей считается в запросах, а не в картинках."""
+    from google.genai import types
+    contents = [types.Part.from_bytes(data=img, mime_type="image/jpeg") for img in images]
+    contents.append(build_batch_prompt(options_list))
+    response = await asyncio.to_thread(
+        genai_client.models.generate_content,
+        model=model,
+        contents=contents,
+        config=build_batch_config(options_list),
+    )
+    return parse_batch_answer(model, response.text or "", options_list)
+
+
+async def _ask_others(genai_client, ledger, models, image_data: bytes, options, answers):
+    """Параллельно спрашивает models и дописывает полученные ответы в answers."""
+    results = await asyncio.gather(
+        *(asyncio.wait_for(ask_model(genai_client, m, image_data, options), timeout=30.0) for m in models),
+        return_exceptions=True
+    )
+    for m, res in zip(models, results):
+        if isinstance(res, Exception):
+            logger.warning(f"⚠️ CAPTCHA: Второе мнение от {m} не получено: {res}")
+            if 'RESOURCE_EXHAUSTED' in str(res).upper():
+                ledger.mark_exhausted(m, str(res))
+            continue
+        logger.info(f"🗳 CAPTCHA: {res}")
+        answers.append(res)
+
+
+async def get_consensus(genai_client, ledger, models, primary: CaptchaAnswer, image_data: bytes, options):
+    """Параллельно опрашивает другие доступные модели и выбирает ответ голосованием по уверенности."""
+    available = [m for m in models if m != primary.model and ledger.is_available(m)]
+    others, spare = available[:CAPTCHA_SECOND_OPINIONS], available[CAPTCHA_SECOND_OPINIONS:]
+    if not others:
+        logger.warning("⚠️ CAPTCHA: Нет свободных моделей для второго мнения")
+        return primary if primary.answer else None
+
+    logger.info(f"🤔 CAPTCHA: Ответ {primary} вызывает сомнения, спрашиваем {', '.join(others)}")
+    for m in others:
+        ledger.record_request(m)
+    answers = [primary]
+    await _ask_others(genai_client, ledger, others, image_data, options, answers)
+
+    # Ничья — спрашиваем еще одну свободную модель; если ее нет, решит ответ основной модели
+    spare = [m for m in spare if ledger.is_available(m)]
+    if is_tie(answers) and spare:
+        logger.info(f"⚖️ CAPTCHA: Ничья, спрашиваем {spare[0]}")
+        ledger.record_request(spare[0])
+        await _ask_others(genai_client, ledger, spare[:1], image_data, options, answers)
+
+    result = combine_answers(answers)
+    logger.info(f"🗳 CAPTCHA: Итог голосования: {result}")
+    return result
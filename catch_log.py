@@ -0,0 +1,314 @@
+# catch_log.py | Разбор результатов рыбалки и журнал уловов (SQLite WAL, запись в фоне)
+# Схема журнала:
+#   catches — каждый результат рыбалки
+#   cycles  — исход каждого цикла воркера (включая неудачи и капчи)
+#   hourly  — почасовые агрегаты, обновляются в той же транзакции, что и вставка,
+#             чтобы запросы за месяцы не сканировали сырые строки (см. catch_stats.py)
+import re
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+import os
+
+logger = logging.getLogger("auto_fisher.catch_log")
+
+# Типы исхода: рыба, предмет, оборванная леска, рыба сорвалась
+OUTCOME_PATTERNS = [
+    ("fish", ["вы поймали рыбу"]),
+    ("item", ["вы поймали предмет"]),
+    ("line_break", ["леска не выдержала", "оборвалась"]),
+    ("escaped", ["сорвалась с крючка", "подсечь рыбу"]),
+]
+
+# Имя после "Вы поймали рыбу/предмет": до конца строки или знака препинания
+_NAME_RE = re.compile(r"вы поймали (?:рыбу|предмет)\s*[:\-—]?\s*[\"«]?([^\n\"«»!.,:(]+)", re.IGNORECASE)
+# Строки вида "Вес: 1,2 кг", "Опыт: +15", "Цена — 40 💰"
+_FIELD_RE = re.compile(r"^[^\wА-Яа-яЁё]*([A-Za-zА-Яа-яЁё][A-Za-zА-Яа-яЁё ]*?)\s*[:—\-]\s*\+?(-?\d+(?:[.,]\d+)?)\s*([^\s\d]*)")
+
+# Известные поля -> колонка журнала
+FIELD_ALIASES = {
+    "вес": "weight",
+    "масса": "weight",
+    "цена": "value",
+    "стоимость": "value",
+    "монеты": "value",
+    "монет": "value",
+    "опыт": "xp",
+}
+
+# Запись пачками: не чаще чем раз в FLUSH_INTERVAL или по накоплении FLUSH_BATCH
+FLUSH_INTERVAL = 2.0
+FLUSH_BATCH = 50
+# Сколько ждать блокировку базы (другой шард пишет) и сколько пачек держать, пока база занята
+BUSY_TIMEOUT = 30.0
+MAX_PENDING_BATCHES = 20
+
+# Гистограмма длительностей циклов: корзины по 0.5с, все что дольше — в последней
+CYCLE_BIN_WIDTH = 0.5
+CYCLE_BIN_MAX = 240
+
+
+def cycle_bin(duration: float) -> int:
+    return min(int(duration / CYCLE_BIN_WIDTH), CYCLE_BIN_MAX)
+
+
+def parse_catch_result(text: str) -> dict:
+    """Разбирает сообщение с результатом: тип исхода, название и числовые поля."""
+    raw = text or ""
+    low = raw.lower()
+
+    outcome = "unknown"
+    for name, keywords in OUTCOME_PATTERNS:
+        if any(k in low for k in keywords):
+            outcome = name
+            break
+
+    name = None
+    m = _NAME_RE.search(raw)
+    if m:
+        name = m.group(1).strip() or None
+
+    fields = {}
+    for line in raw.splitlines():
+        fm = _FIELD_RE.match(line.strip())
+        if not fm:
+            continue
+        label = fm.group(1).strip().lower()
+        try:
+            value = float(fm.group(2).replace(",", "."))
+        except ValueError:
+            continue
+        unit = fm.group(3).lower()
+        key = FIELD_ALIASES.get(label, label)
+        # Вес приводим к килограммам
+        if key == "weight" and unit.startswith("г"):
+            value /= 1000.0
+        fields[key] = value
+
+    return {
+        "outcome": outcome,
+        "name": name,
+        "weight": fields.get("weight"),
+        "value": fields.get("value"),
+        "xp": fields.get("xp"),
+        "fields": fields,
+    }
+
+
+class CatchLogWriter:
+    """
+    Журнал уловов только на добавление. record() лишь кладет запись в очередь,
+    а отдельный поток пишет пачками в SQLite (WAL), поэтому воркер не ждет диск.
+    """
+
+    SCHEMA = [
+        """
+        CREATE TABLE IF NOT EXISTS catches (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            outcome TEXT NOT NULL,
+            name TEXT,
+            weight REAL,
+            value REAL,
+            xp REAL,
+            fields TEXT,
+            raw TEXT,
+            account TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS cycles (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            outcome TEXT NOT NULL,
+            duration REAL,
+            account TEXT
+        )
+        """,
+        # bucket = номер часа (ts // 3600); metric/key: catch/<исход>, species/<название>,
+        # cycle/<исход>, cycle_bin/<корзина длительности>; total — сумма value или длительностей
+        """
+        CREATE TABLE IF NOT EXISTS hourly (
+            bucket INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, metric, key)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_catches_ts ON catches (ts)",
+        "CREATE INDEX IF NOT EXISTS idx_catches_name_ts ON catches (name, ts)",
+        "CREATE INDEX IF NOT EXISTS idx_cycles_ts ON cycles (ts)",
+        "CREATE INDEX IF NOT EXISTS idx_cycles_outcome_ts ON cycles (outcome, ts)",
+        "CREATE INDEX IF NOT EXISTS idx_hourly_metric ON hourly (metric, bucket)",
+    ]
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="catch-log", daemon=True)
+        self._thread.start()
+
+    def record(self, rec: dict):
+        """Неблокирующая запись результата рыбалки (rec["account"] — чей улов): только постановка в очередь."""
+        self._queue.put(("catch", rec))
+
+    def record_cycle(self, outcome: str, duration: float = None, account: str = None):
+        """Неблокирующая запись исхода цикла (duration — секунды, если известны)."""
+        self._queue.put(("cycle", {"ts": time.time(), "outcome": outcome, "duration": duration, "account": account}))
+
+    def close(self, timeout: float = 5.0):
+        """Дописывает очередь и останавливает поток."""
+        if self._thread:
+            self._stopping.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ---------- поток записи ----------
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Шарды пишут в один файл из разных процессов: ждем блокировку, а не падаем сразу
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for stmt in self.SCHEMA:
+            conn.execute(stmt)
+        self._add_account_columns(conn)
+        conn.commit()
+        self._rebuild_aggregates_if_empty(conn)
+        return conn
+
+    @staticmethod
+    def _add_account_columns(conn):
+        """Журнал из версии без аккаунтов: добавляем колонку (старые строки остаются с NULL)."""
+        for table in ("catches", "cycles"):
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if "account" not in columns:
+                try:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN account TEXT")
+                except sqlite3.OperationalError as e:
+                    # Соседний шард успел добавить колонку первым
+                    if "duplicate column" not in str(e):
+                        raise
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_account_ts ON {table} (account, ts)")
+
+    @staticmethod
+    def _rebuild_aggregates_if_empty(conn):
+        """Журнал из старой версии без агрегатов — строим их один раз из сырых строк."""
+        if conn.execute("SELECT 1 FROM hourly LIMIT 1").fetchone():
+            return
+        if not conn.execute("SELECT 1 FROM catches LIMIT 1").fetchone():
+            return
+        logger.info("📊 Строим почасовые агрегаты журнала уловов...")
+        with conn:
+            conn.execute(
+                "INSERT INTO hourly (bucket, metric, key, count, total) "
+                "SELECT CAST(ts / 3600 AS INTEGER), 'catch', outcome, COUNT(*), COALESCE(SUM(value), 0) "
+                "FROM catches GROUP BY 1, 3"
+            )
+            conn.execute(
+                "INSERT INTO hourly (bucket, metric, key, count, total) "
+                "SELECT CAST(ts / 3600 AS INTEGER), 'species', name, COUNT(*), COALESCE(SUM(value), 0) "
+                "FROM catches WHERE name IS NOT NULL GROUP BY 1, 3"
+            )
+
+    def _write_batch(self, conn, batch):
+        catches = [r for kind, r in batch if kind == "catch"]
+        cycles = [r for kind, r in batch if kind == "cycle"]
+
+        # Агрегаты копим в памяти и добавляем одним UPSERT на ключ
+        agg = {}
+
+        def bump(ts, metric, key, total=0.0):
+            k = (int(ts // 3600), metric, key)
+            c, t = agg.get(k, (0, 0.0))
+            agg[k] = (c + 1, t + (total or 0.0))
+
+        rows = []
+        for r in catches:
+            ts = r.get("ts", time.time())
+            rows.append((
+                ts, r.get("outcome", "unknown"), r.get("name"),
+                r.get("weight"), r.get("value"), r.get("xp"),
+                json.dumps(r.get("fields") or {}, ensure_ascii=False), r.get("raw"), r.get("account"),
+            ))
+            bump(ts, "catch", r.get("outcome", "unknown"), r.get("value"))
+            if r.get("name"):
+                bump(ts, "species", r["name"], r.get("value"))
+
+        cycle_rows = []
+        for r in cycles:
+            cycle_rows.append((r["ts"], r["outcome"], r.get("duration"), r.get("account")))
+            bump(r["ts"], "cycle", r["outcome"], r.get("duration"))
+            if r.get("duration") is not None:
+                bump(r["ts"], "cycle_bin", str(cycle_bin(r["duration"])))
+
+        with conn:
+            if rows:
+                conn.executemany(
+                    "INSERT INTO catches (ts, outcome, name, weight, value, xp, fields, raw, account) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            if cycle_rows:
+                conn.executemany("INSERT INTO cycles (ts, outcome, duration, account) VALUES (?, ?, ?, ?)", cycle_rows)
+            conn.executemany(
+                "INSERT INTO hourly (bucket, metric, key, count, total) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (bucket, metric, key) DO UPDATE SET "
+                "count = count + excluded.count, total = total + excluded.total",
+                [(b, m, k, c, t) for (b, m, k), (c, t) in agg.items()],
+            )
+
+    def _run(self):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            logger.error(f"❌ Не удалось открыть журнал уловов {self.path}: {e}")
+            return
+
+        batch = []
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self._queue.get(timeout=min(timeout, 0.5)))
+            except queue.Empty:
+                pass
+
+            stopping = self._stopping.is_set()
+            if batch and (len(batch) >= FLUSH_BATCH or time.monotonic() >= deadline or stopping):
+                # Забираем все, что уже накопилось в очереди
+                while len(batch) < FLUSH_BATCH * 4:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    self._write_batch(conn, batch)
+                    batch = []
+                except sqlite3.OperationalError as e:
+                    # "database is locked": транзакция откатилась целиком — пачку пишем на следующем сбросе
+                    logger.warning(f"⚠️ Журнал уловов занят ({len(batch)} записей отложено): {e}")
+                    if stopping or len(batch) > FLUSH_BATCH * MAX_PENDING_BATCHES:
+                        logger.warning(f"⚠️ Журнал уловов недоступен слишком долго, отброшено {len(batch)} записей")
+                        batch = []
+                except Exception as e:
+                    logger.warning(f"⚠️ Ошибка записи журнала уловов ({len(batch)} записей): {e}")
+                    batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + FLUSH_INTERVAL
+            if stopping and self._queue.empty() and not batch:
+                break
+        conn.close()
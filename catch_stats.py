@@ -0,0 +1,196 @@
+# catch_stats.py | Запросы к журналу уловов (почасовые агрегаты) + CLI
+#
+# Примеры:
+#   python catch_stats.py per-hour --days 2
+#   python catch_stats.py species --days 30
+#   python catch_stats.py captcha-by-hour --days 30 --tz 3
+#   python catch_stats.py cycle-time --days 7
+#   python catch_stats.py per-account --days 1
+import os
+import time
+import sqlite3
+import argparse
+
+from catch_log import CYCLE_BIN_WIDTH, CYCLE_BIN_MAX
+
+DEFAULT_DB = os.path.join(os.getenv("DATA_DIR", "data"), "catches.db")
+
+# Исходы циклов, которые считаются капчей
+CAPTCHA_OUTCOMES = ("captcha_solved", "captcha_failed")
+
+
+def connect(path: str = DEFAULT_DB) -> sqlite3.Connection:
+    # Только чтение: бот в это время может писать в журнал (WAL это позволяет)
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def _bucket_range(days: float, now: float = None):
+    now = now or time.time()
+    return int((now - days * 86400) // 3600), int(now // 3600)
+
+
+def catches_per_hour(conn, days: float = 1.0):
+    """[(начало часа epoch, уловов, сумма value)] по часам, только успешные уловы (рыба и предметы)."""
+    lo, hi = _bucket_range(days)
+    rows = conn.execute(
+        "SELECT bucket, SUM(count), SUM(total) FROM hourly "
+        "WHERE metric = 'catch' AND key IN ('fish', 'item') AND bucket BETWEEN ? AND ? "
+        "GROUP BY bucket ORDER BY bucket",
+        (lo, hi),
+    ).fetchall()
+    return [(b * 3600, c, t) for b, c, t in rows]
+
+
+def outcome_breakdown(conn, days: float = 1.0):
+    """{исход: количество} за период — для доли удачных забросов."""
+    lo, hi = _bucket_range(days)
+    rows = conn.execute(
+        "SELECT key, SUM(count) FROM hourly WHERE metric = 'catch' AND bucket BETWEEN ? AND ? GROUP BY key",
+        (lo, hi),
+    ).fetchall()
+    return dict(rows)
+
+
+def species_breakdown(conn, days: float = 30.0, limit: int = 30):
+    """[(название, штук, сумма value)] по убыванию количества."""
+    lo, hi = _bucket_range(days)
+    return conn.execute(
+        "SELECT key, SUM(count) AS n, SUM(total) FROM hourly "
+        "WHERE metric = 'species' AND bucket BETWEEN ? AND ? "
+        "GROUP BY key ORDER BY n DESC LIMIT ?",
+        (lo, hi, limit),
+    ).fetchall()
+
+
+def captcha_by_hour_of_day(conn, days: float = 30.0, tz_hours: int = 0):
+    """
+    [(час суток, капч, циклов, капч на 100 циклов)] — частота капчи
+    в зависимости от времени суток (tz_hours — смещение от UTC).
+    """
+    lo, hi = _bucket_range(days)
+    rows = conn.execute(
+        "SELECT ((bucket + ?) % 24 + 24) % 24 AS hod, "
+        f"SUM(CASE WHEN key IN ({','.join('?' * len(CAPTCHA_OUTCOMES))}) THEN count ELSE 0 END), "
+        "SUM(count) FROM hourly WHERE metric = 'cycle' AND bucket BETWEEN ? AND ? "
+        "GROUP BY hod ORDER BY hod",
+        (tz_hours, *CAPTCHA_OUTCOMES, lo, hi),
+    ).fetchall()
+    return [(h, c, n, (100.0 * c / n) if n else 0.0) for h, c, n in rows]
+
+
+def cycle_time_percentiles(conn, days: float = 7.0, percentiles=(50, 90, 99)):
+    """{перцентиль: секунды} по гистограмме длительностей циклов (точность — ширина корзины)."""
+    lo, hi = _bucket_range(days)
+    hist = conn.execute(
+        "SELECT CAST(key AS INTEGER) AS bin, SUM(count) FROM hourly "
+        "WHERE metric = 'cycle_bin' AND bucket BETWEEN ? AND ? GROUP BY bin ORDER BY bin",
+        (lo, hi),
+    ).fetchall()
+    total = sum(c for _, c in hist)
+    result = {}
+    if not total:
+        return result
+    for p in percentiles:
+        target = total * p / 100.0
+        acc = 0
+        for b, c in hist:
+            acc += c
+            if acc >= target:
+                # Верхняя граница корзины; последняя корзина открыта сверху
+                result[p] = (b + 1) * CYCLE_BIN_WIDTH if b < CYCLE_BIN_MAX else float("inf")
+                break
+    return result
+
+
+def value_per_hour(conn, days: float = 1.0):
+    """Средняя ценность улова в час за период."""
+    lo, hi = _bucket_range(days)
+    row = conn.execute(
+        "SELECT SUM(total), COUNT(DISTINCT bucket) FROM hourly "
+        "WHERE metric = 'catch' AND bucket BETWEEN ? AND ?",
+        (lo, hi),
+    ).fetchone()
+    total, hours = row if row else (None, 0)
+    return (total or 0.0) / hours if hours else 0.0
+
+
+def per_account(conn, days: float = 1.0):
+    """
+    [(аккаунт, уловов, сумма value, циклов, средний цикл в сек)] — по сырым строкам
+    (почасовые агрегаты общие на парк). Строки старых версий без аккаунта — под None.
+    """
+    since = time.time() - days * 86400
+    catches = {a: (n, v) for a, n, v in conn.execute(
+        "SELECT account, COUNT(*), COALESCE(SUM(value), 0) FROM catches "
+        "WHERE ts >= ? AND outcome IN ('fish', 'item') GROUP BY account",
+        (since,),
+    )}
+    cycles = {a: (n, avg) for a, n, avg in conn.execute(
+        "SELECT account, COUNT(*), AVG(duration) FROM cycles WHERE ts >= ? GROUP BY account",
+        (since,),
+    )}
+    accounts = sorted(set(catches) | set(cycles), key=lambda a: (a is None, a or ""))
+    return [(a, *catches.get(a, (0, 0.0)), *cycles.get(a, (0, None))) for a in accounts]
+
+
+# ----------------- CLI -----------------
+def _fmt_hour(ts: float) -> str:
+    return time.strftime("%Y-%m-%d %H:00", time.gmtime(ts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Статистика журнала уловов Auto Fisher Bot")
+    parser.add_argument("--db", default=DEFAULT_DB, help="путь к catches.db")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("per-hour", help="уловы по часам (UTC)")
+    p.add_argument("--days", type=float, default=1.0)
+    p = sub.add_parser("species", help="разбивка по видам")
+    p.add_argument("--days", type=float, default=30.0)
+    p.add_argument("--limit", type=int, default=30)
+    p = sub.add_parser("captcha-by-hour", help="частота капчи по времени суток")
+    p.add_argument("--days", type=float, default=30.0)
+    p.add_argument("--tz", type=int, default=0, help="смещение от UTC в часах")
+    p = sub.add_parser("cycle-time", help="перцентили длительности цикла")
+    p.add_argument("--days", type=float, default=7.0)
+    p = sub.add_parser("per-account", help="уловы и циклы по аккаунтам")
+    p.add_argument("--days", type=float, default=1.0)
+    p = sub.add_parser("summary", help="сводка за период")
+    p.add_argument("--days", type=float, default=1.0)
+
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        parser.error(f"журнал не найден: {args.db}")
+    conn = connect(args.db)
+
+    if args.cmd == "per-hour":
+        for ts, n, value in catches_per_hour(conn, args.days):
+            print(f"{_fmt_hour(ts)}  {n:5d} уловов  {value:10.1f} ценность")
+    elif args.cmd == "species":
+        for name, n, value in species_breakdown(conn, args.days, args.limit):
+            print(f"{name:<30} {n:6d}  {value:10.1f}")
+    elif args.cmd == "captcha-by-hour":
+        for hod, captchas, cycles, per100 in captcha_by_hour_of_day(conn, args.days, args.tz):
+            print(f"{hod:02d}:00  {captchas:5d} капч / {cycles:6d} циклов  ({per100:.2f} на 100)")
+    elif args.cmd == "cycle-time":
+        for p_, sec in cycle_time_percentiles(conn, args.days).items():
+            print(f"p{p_}: {sec:.1f}с")
+    elif args.cmd == "per-account":
+        for account, n, value, cycles, avg in per_account(conn, args.days):
+            avg_str = f"{avg:.1f}с" if avg is not None else "—"
+            print(f"{account or '(без аккаунта)':<20} {n:6d} уловов  {value:10.1f} ценность  "
+                  f"{cycles:6d} циклов  ср. цикл {avg_str}")
+    elif args.cmd == "summary":
+        outcomes = outcome_breakdown(conn, args.days)
+        total = sum(outcomes.values())
+        print(f"Результатов: {total}")
+        for k, n in sorted(outcomes.items(), key=lambda kv: -kv[1]):
+            print(f"  {k:<12} {n:6d}  ({100.0 * n / total:.1f}%)")
+        print(f"Ценность в час: {value_per_hour(conn, args.days):.1f}")
+        for p_, sec in cycle_time_percentiles(conn, args.days).items():
+            print(f"Цикл p{p_}: {sec:.1f}с")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,353 +1,1018 @@
-import asyncio
-import logging
-from datetime import datetime, timezone
-from telethon import events, TelegramClient
-from telethon.errors import MessageNotModifiedError
-
-# ================= КОНФИГУРАЦИЯ =================
-
-# 1. Режим игры:
-# 1 = Точное совпадение (Сообщение == Слово)
-# 2 = Поиск вхождения (Слово внутри сообщения)
-EVENT_MODE = 2
-
-# 2. Загаданные слова (массив строк)
-SECRET_WORDS = ["WW", "Завоз", "Фармить", "Крока", "Эксайл", "Нфт", "Андраник гений"]
-
-# Словарь корней для поиска (чтобы учитывать падежи)
-# Ключ = слово из списка выше (в нижнем регистре), Значение = часть слова, которую ищем
-WORD_ROOTS = {
-    "фармить": "фарм",    # найдет: фармлю, фарма, фармил
-    "крока": "крок",      # найдет: кроку, кроком, кроки
-    "завоз": "завоз",     # найдет: завоза, завозу
-    "эксайл": "эксайл",   # найдет: эксайла
-    "нфт": "нфт",         # найдет: нфтшка, нфтхи
-    "ww": "ww"
-    # "андраник гений" сюда НЕ пишем, чтобы искалось точное совпадение фразы
-}
-
-# 3. Команды управления
-CMD_START_EVENT = "старт ивент"
-CMD_STOP_EVENT = "стоп ивент"
-
-# 4. ID администраторов (кто может управлять ботом)
-ADMIN_IDS = [5553779390, 1057267401]
-
-# 5. ID группы для отслеживания
-TARGET_GROUP_ID = -1002157100033
-
-# 6. ID бота, который переводит голосовые/кружочки в текст
-TRANSCRIPTION_BOT_ID = 5244379085
-
-# 7. Интервал обновления сообщения админа (в секундах)
-UI_UPDATE_INTERVAL = 4
-
-# ================================================
-
-logger = logging.getLogger("event_bot")
-
-# Хранилище состояния (в памяти)
-class EventState:
-    def __init__(self):
-        self.is_running = False
-        self.start_time = None
-        self.initiator_id = None  # Кто запустил (админ)
-        self.status_msg = None    # Объект сообщения в ЛС админа для редактирования
-        
-        # Запоминаем последний текст, чтобы не спамить API ошибками
-        self.last_check_text = None 
-        
-        # Данные статистики
-        # scores: {user_id: {"name": str, "count": int}}
-        self.scores = {}
-        
-        # word_stats: {word: count}
-        self.word_stats = {w.lower(): 0 for w in SECRET_WORDS}
-        
-        # user_word_stats: {word: {user_id: count}} - кто сколько раз какое слово сказал
-        self.user_word_stats = {w.lower(): {} for w in SECRET_WORDS}
-
-        # Для защиты от FloodWait (UI Update Loop)
-        self.needs_update = False
-        self.ui_task = None
-
-    def reset(self, initiator_id):
-        self.is_running = True
-        self.start_time = datetime.now(timezone.utc)
-        self.initiator_id = initiator_id
-        self.status_msg = None
-        self.last_check_text = None # Сброс кэша текста
-        self.scores = {}
-        self.word_stats = {w.lower(): 0 for w in SECRET_WORDS}
-        self.user_word_stats = {w.lower(): {} for w in SECRET_WORDS}
-        self.needs_update = True
-
-state = EventState()
-
-def get_time_str(start_dt):
-    if not start_dt:
-        return "0ч 0м"
-    diff = datetime.now(timezone.utc) - start_dt
-    days = diff.days
-    seconds = diff.seconds
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
-    
-    time_str = ""
-    if days > 0: time_str += f"{days}д. "
-    time_str += f"{hours}ч. {minutes}м."
-    return time_str
-
-def generate_report(is_final=False):
-    title = "🏁 <b>ИТОГИ ИВЕНТА</b>" if is_final else "📊 <b>LIVE СТАТИСТИКА</b>"
-    timer = f"⏱ Время работы: <b>{get_time_str(state.start_time)}</b>"
-    if is_final:
-        timer += " (Завершен)"
-
-    # Сортировка участников по баллам
-    sorted_users = sorted(state.scores.items(), key=lambda item: item[1]['count'], reverse=True)
-    
-    users_text = ""
-    if sorted_users:
-        users_text += "\n\n🏆 <b>Лидерборд:</b>\n"
-        for idx, (uid, data) in enumerate(sorted_users, 1):
-            # Сбор детальной статистики по словам для пользователя
-            user_details = []
-            for w in SECRET_WORDS:
-                w_lower = w.lower()
-                # Получаем сколько раз этот uid сказал слово w
-                count = state.user_word_stats.get(w_lower, {}).get(uid, 0)
-                if count > 0:
-                    user_details.append(f"{w} - {count}")
-            
-            details_str = ""
-            if user_details:
-                details_str = f" ({', '.join(user_details)})"
-
-            # Ссылка на профиль tg://user?id=...
-            name_link = f"<a href='tg://user?id={uid}'>{data['name']}</a>"
-            users_text += f"{idx}. {name_link} — <b>{data['count']}</b>{details_str}\n"
-    else:
-        users_text += "\n\n💤 Пока никто ничего не угадал."
-
-    # Аналитика по словам
-    analytics_text = "\n📉 <b>Аналитика по словам:</b>\n"
-    for word in SECRET_WORDS:
-        w_lower = word.lower()
-        total_uses = state.word_stats.get(w_lower, 0)
-        
-        # Находим лидера по этому слову
-        top_user_for_word = "Никто"
-        u_stats = state.user_word_stats.get(w_lower, {})
-        if u_stats:
-            top_user_id = max(u_stats, key=u_stats.get)
-            top_count = u_stats[top_user_id]
-            # Пытаемся достать имя из общего скора
-            if top_user_id in state.scores:
-                u_name = state.scores[top_user_id]['name']
-                top_user_for_word = f"<a href='tg://user?id={top_user_id}'>{u_name}</a> ({top_count})"
-        
-        analytics_text += f"▪️ <i>{word}</i>: использовано {total_uses} раз. Лидер: {top_user_for_word}\n"
-
-    return f"{title}\n{timer}{users_text}\n{analytics_text}"
-
-async def ui_updater_loop(client: TelegramClient):
-    """Фоновая задача: обновляет сообщение админа раз в N секунд, если есть изменения."""
-    logger.info("UI Updater Loop started")
-    while state.is_running:
-        try:
-            # Проверяем state.status_msg на случай, если сообщение удалили вручную
-            if state.needs_update and state.status_msg:
-                text = generate_report(is_final=False)
-                
-                # Сравниваем с последним успешно отправленным текстом (в памяти),
-                # а не с тем, что возвращает API (там могут быть отличия в разметке).
-                if text == state.last_check_text:
-                    # Текст идентичен, обновление не требуется
-                    state.needs_update = False
-                else:
-                    try:
-                        await state.status_msg.edit(text, parse_mode='html')
-                        state.last_check_text = text # Запоминаем успешный текст
-                        state.needs_update = False
-                    except MessageNotModifiedError:
-                        # Telegram говорит, что ничего не поменялось. 
-                        # Синхронизируем наше состояние и игнорируем ошибку.
-                        state.last_check_text = text
-                        state.needs_update = False
-                    except Exception as e:
-                        logger.warning(f"UI Update error: {e}")
-            
-            # Ждем заданное количество секунд перед следующей проверкой
-            await asyncio.sleep(UI_UPDATE_INTERVAL)
-        except asyncio.CancelledError:
-            break
-        except Exception as e:
-            logger.error(f"Error in UI loop: {e}")
-            await asyncio.sleep(5)
-
-# ================= ГЛАВНАЯ ФУНКЦИЯ ПОДКЛЮЧЕНИЯ =================
-
-def init_event_bot(client: TelegramClient):
-    """Подключает хендлеры ивента к существующему клиенту."""
-    logger.info("🎮 Event Bot module loaded")
-
-    @client.on(events.NewMessage(chats=ADMIN_IDS + [TARGET_GROUP_ID]))
-    async def admin_commands_handler(event):
-        sender_id = event.sender_id
-        
-        if sender_id not in ADMIN_IDS:
-            return
-
-        text = event.raw_text.lower().strip()
-        
-        # --- КОМАНДА СТАРТ ---
-        if text == CMD_START_EVENT:
-            if event.chat_id == TARGET_GROUP_ID:
-                return
-
-            if state.is_running:
-                await event.reply("⚠️ Ивент уже запущен!")
-                return
-            
-            state.reset(sender_id)
-            report = generate_report(is_final=False)
-            state.status_msg = await client.send_message(sender_id, report, parse_mode='html')
-            
-            # Инициализируем кэш текста сразу же, чтобы цикл не пытался редактировать 
-            # только что отправленное сообщение
-            state.last_check_text = report
-            
-            # Запускаем фоновый цикл обновления UI
-            state.ui_task = asyncio.create_task(ui_updater_loop(client))
-            logger.info(f"Ивент запущен администратором {sender_id}")
-
-        # --- КОМАНДА СТОП ---
-        elif text == CMD_STOP_EVENT:
-            if not state.is_running:
-                await event.reply("⚠️ Ивент не запущен.")
-                return
-
-            state.is_running = False
-
-            # Останавливаем цикл обновления
-            if state.ui_task:
-                state.ui_task.cancel()
-                state.ui_task = None
-
-            # Формируем финальный отчет
-            final_report = generate_report(is_final=True)
-            
-            # 1. Удаляем лайв-сообщение в ЛС (если есть)
-            if state.status_msg:
-                try:
-                    await state.status_msg.delete()
-                except Exception:
-                    pass
-            
-            # 2. Отправляем итоги в ЛС инициатору
-            if state.initiator_id:
-                await client.send_message(state.initiator_id, final_report, parse_mode='html')
-            
-            # 3. Если команду написали в Группе, дублируем туда
-            if event.chat_id == TARGET_GROUP_ID:
-                await event.reply(final_report, parse_mode='html')
-            
-            logger.info("Ивент остановлен.")
-
-    @client.on(events.NewMessage(chats=TARGET_GROUP_ID))
-    async def group_watcher_handler(event):
-        # Игнорируем, если ивент не запущен
-        if not state.is_running:
-            return
-
-        sender = await event.get_sender()
-        if not sender:
-            return
-
-        is_transcription_bot = (sender.id == TRANSCRIPTION_BOT_ID)
-
-        # Логика фильтрации ботов:
-        # Если пишет бот и это НЕ бот-переводчик -> игнорируем
-        if sender.bot and not is_transcription_bot:
-            return
-            
-        # Игнорируем команды управления
-        if event.raw_text.lower().strip() in [CMD_START_EVENT, CMD_STOP_EVENT]:
-            return
-
-        # --- ОПРЕДЕЛЕНИЕ РЕАЛЬНОГО АВТОРА И ТЕКСТА ---
-        target_user = None
-        
-        if is_transcription_bot:
-            # Если пишет бот-переводчик, ищем автора оригинального сообщения (reply)
-            reply_msg = await event.get_reply_message()
-            if reply_msg:
-                target_user = await reply_msg.get_sender()
-            else:
-                # Если реплая нет (странно для этого бота), игнорируем
-                return
-        else:
-            # Обычный пользователь
-            target_user = sender
-
-        if not target_user:
-            return
-            
-        # Игнорируем, если "реальный автор" тоже бот (на всякий случай)
-        if target_user.bot:
-            return
-
-        user_id = target_user.id
-        import html
-        full_name = html.escape(f"{target_user.first_name} {target_user.last_name or ''}".strip())
-
-        # Получаем текст. 
-        # event.raw_text берет:
-        # 1. Текст обычного сообщения
-        # 2. Caption (подпись) к картинке/видео
-        # 3. Текст внутри цитирования (blockquote) без Markdown-символов
-        msg_text = event.raw_text.lower().strip()
-        
-        found_matches = 0
-        
-        # --- ЛОГИКА ПОИСКА ---
-        if EVENT_MODE == 1:
-            # Точное совпадение
-            for secret in SECRET_WORDS:
-                s_lower = secret.lower()
-                
-                # Если слово есть в словаре корней - берем корень, иначе само слово
-                search_term = WORD_ROOTS.get(s_lower, s_lower)
-                
-                if msg_text == s_lower or msg_text == search_term:
-                    found_matches += 1
-                    state.word_stats[s_lower] += 1
-                    state.user_word_stats[s_lower][user_id] = state.user_word_stats[s_lower].get(user_id, 0) + 1
-
-        elif EVENT_MODE == 2:
-            # Вхождение (для бота-транскрибатора это основной вариант, так как там много текста)
-            for secret in SECRET_WORDS:
-                s_lower = secret.lower()
-                
-                # Получаем корень слова для поиска (чтобы найти "фармлю" через "фарм")
-                # Если слова (как "андраник гений") нет в словаре, вернется само слово.
-                search_term = WORD_ROOTS.get(s_lower, s_lower)
-                
-                # Ищем количество вхождений корня или слова/фразы
-                count_in_msg = msg_text.count(search_term)
-                
-                if count_in_msg > 0:
-                    found_matches += count_in_msg
-                    state.word_stats[s_lower] += count_in_msg
-                    state.user_word_stats[s_lower][user_id] = state.user_word_stats[s_lower].get(user_id, 0) + count_in_msg
-
-        # --- ОБНОВЛЕНИЕ СЧЕТА ПОЛЬЗОВАТЕЛЯ ---
-        if found_matches > 0:
-            if user_id not in state.scores:
-                state.scores[user_id] = {"name": full_name, "count": 0}
-            
-            state.scores[user_id]["count"] += found_matches
-            
-            # Ставим флаг обновления, вместо прямого вызова
-            state.needs_update = True
+import os
+import re
+import html
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from telethon import events, TelegramClient
+from telethon.errors import MessageNotModifiedError, FloodWaitError
+from telethon.tl.types import User
+
+from rate_limiter import RateLimiter
+from word_matcher import WordMatcher
+from leaderboard import Leaderboard
+from entity_cache import TTLCache
+from event_store import EventStore
+from backfill import IdRanges, fetch_history, first_id_after, last_id
+from utils import percentile
+
+# ================= КОНФИГУРАЦИЯ =================
+
+# 1. Режим игры (по умолчанию; для отдельного ивента задается командой "режим 1"):
+# 1 = Точное совпадение (Сообщение == Слово)
+# 2 = Поиск вхождения (Слово внутри сообщения)
+EVENT_MODE = 2
+
+# 2. Загаданные слова по умолчанию (для отдельного ивента — "слова: WW, Завоз")
+SECRET_WORDS = ["WW", "Завоз", "Фармить", "Крока", "Эксайл", "Нфт", "Андраник гений"]
+
+# Словарь корней для поиска (чтобы учитывать падежи)
+# Ключ = слово из списка выше (в нижнем регистре), Значение = часть слова, которую ищем
+WORD_ROOTS = {
+    "фармить": "фарм",    # найдет: фармлю, фарма, фармил
+    "крока": "крок",      # найдет: кроку, кроком, кроки
+    "завоз": "завоз",     # найдет: завоза, завозу
+    "эксайл": "эксайл",   # найдет: эксайла
+    "нфт": "нфт",         # найдет: нфтшка, нфтхи
+    "ww": "ww"
+    # "андраник гений" сюда НЕ пишем, чтобы искалось точное совпадение фразы
+}
+
+# 3. Команды управления
+# В группе: "старт ивент [режим 1] [слова: WW, Завоз]" / "стоп ивент" — ивент этой группы.
+# В ЛС: то же с id группы первым аргументом ("старт ивент -100123 ..."); без id — TARGET_GROUP_ID
+# "бэкфилл ивент [6ч | 30м]" — досчитать сообщения группы из истории (по умолчанию — с начала ивента)
+CMD_START_EVENT = "старт ивент"
+CMD_STOP_EVENT = "стоп ивент"
+CMD_BACKFILL_EVENT = "бэкфилл ивент"
+
+# 4. ID администраторов (кто может управлять ботом)
+ADMIN_IDS = [5553779390, 1057267401]
+
+# 5. ID группы по умолчанию (для команд из ЛС без id группы)
+TARGET_GROUP_ID = -1002157100033
+
+# 6. ID бота, который переводит голосовые/кружочки в текст
+TRANSCRIPTION_BOT_ID = 5244379085
+
+# 7. Обновление сообщений админа: планировщик просыпается на изменения, но правит ивент
+# не чаще раза в UI_MIN_INTERVAL секунд. После FloodWait интервал ивента растет в UI_BACKOFF раз
+# (до UI_MAX_INTERVAL), после каждого спокойного обновления уменьшается в 1/UI_RECOVERY раз
+UI_MIN_INTERVAL = 4
+UI_MAX_INTERVAL = 120
+UI_BACKOFF = 2.0
+UI_RECOVERY = 0.75
+
+# 8. Сколько лучших участников показывать в лидерборде (не влезающее в одно сообщение уходит на следующие)
+LEADERBOARD_TOP_K = 200
+
+# 9. Лимит длины одного сообщения статуса (у Telegram 4096 символов, оставляем запас)
+MESSAGE_LIMIT = 4000
+# Строка участника длиннее этого обрезается (много разных слов у одного человека)
+ROW_LIMIT = 1000
+
+# ================================================
+
+logger = logging.getLogger("event_bot")
+
+# Хранилище состояния одного ивента (в памяти)
+class EventState:
+    def __init__(self, chat_id, words=None, mode=None, roots=None):
+        self.chat_id = chat_id
+        self.title = None          # Название группы для отчета
+        self.words = list(words or SECRET_WORDS)
+        self.mode = mode or EVENT_MODE
+        self.roots = dict(WORD_ROOTS if roots is None else roots)
+        # Автомат поиска слов собирается один раз: список слов ивента не меняется
+        self.matcher = WordMatcher(term for _, term in self.search_terms())
+        # Порядок и написание слов для строк отчета
+        self.word_order = {w.lower(): i for i, w in enumerate(self.words)}
+        self.word_titles = {w.lower(): w for w in self.words}
+
+        self.is_running = False
+        self.start_time = None
+        self.initiator_id = None  # Кто запустил (админ)
+        self.status_msgs = []     # Сообщения статуса в ЛС админа (по одному на страницу отчета)
+
+        # Последний отправленный текст каждой страницы: правим только изменившиеся
+        self.page_texts = []
+
+        # Кэш отрисованных строк отчета: перерисовываются только строки измененных участников и слов
+        self.row_cache = {}        # {user_id: (место, строка)}
+        self.word_row_cache = {}   # {слово: строка}
+        self.dirty_users = set()
+        self.dirty_words = set()
+
+        # Данные статистики
+        # scores: {user_id: {"name": str, "count": int}}
+        self.scores = {}
+
+        # word_stats: {word: count}
+        self.word_stats = {w.lower(): 0 for w in self.words}
+
+        # user_word_stats: {word: {user_id: count}} - кто сколько раз какое слово сказал
+        self.user_word_stats = {w.lower(): {} for w in self.words}
+
+        # Рейтинги обновляются на каждом совпадении, поэтому отчет не сортирует всех участников
+        self.leaderboard = Leaderboard()
+        self.word_leaders = {w.lower(): Leaderboard() for w in self.words}
+        # user_words: {user_id: {word: count}} — детали строки участника без перебора всех слов
+        self.user_words = {}
+
+        # Для защиты от FloodWait (общий планировщик UI)
+        self.needs_update = False
+        self.last_edit_at = 0.0
+        self.ui_interval = UI_MIN_INTERVAL  # Текущий интервал обновления (растет после FloodWait)
+        self.dirty_since = None             # Когда появились неотображенные изменения
+
+        # id уже разобранных сообщений (живой счет и история): одно сообщение — один раз
+        self.seen = IdRanges()
+        # Проход по истории: {"cursor", "end_id", "scanned", "counted", "notify"}; курсор пишется в журнал
+        self.backfill = None
+        self.backfill_task = None
+
+        # Журнал ивента на диске, чтобы перезапуск не обнулял счет
+        self.store = None
+
+    def reset(self, initiator_id):
+        self.is_running = True
+        self.start_time = datetime.now(timezone.utc)
+        self.initiator_id = initiator_id
+        self.status_msgs = []
+        self.page_texts = [] # Сброс кэша текста
+        self.row_cache = {}
+        self.word_row_cache = {}
+        self.dirty_users = set()
+        self.dirty_words = set()
+        self.scores = {}
+        self.word_stats = {w.lower(): 0 for w in self.words}
+        self.user_word_stats = {w.lower(): {} for w in self.words}
+        self.leaderboard = Leaderboard()
+        self.word_leaders = {w.lower(): Leaderboard() for w in self.words}
+        self.user_words = {}
+        self.seen = IdRanges()
+        self.backfill = None
+        self.needs_update = True
+
+    # ---------- поиск слов ----------
+    def search_terms(self):
+        """[(слово в нижнем регистре, что ищем)] — корень из словаря корней или само слово/фраза."""
+        return [(w.lower(), self.roots.get(w.lower(), w.lower())) for w in self.words]
+
+    def match(self, msg_text: str) -> dict:
+        """{слово в нижнем регистре: совпадений} для текста сообщения в нижнем регистре."""
+        if self.mode == 1:
+            # Точное совпадение: если слово есть в словаре корней - подходит и корень
+            return {s_lower: 1 for s_lower, term in self.search_terms() if msg_text == s_lower or msg_text == term}
+        # Вхождение (для бота-транскрибатора это основной вариант, так как там много текста)
+        # Корни (чтобы найти "фармлю" через "фарм") и фразы ищутся одним проходом автомата
+        found = self.matcher.count(msg_text)
+        if not found:
+            return {}
+        return {s_lower: found[term] for s_lower, term in self.search_terms() if term in found}
+
+    # ---------- счет ----------
+    def mark_seen(self, msg_id) -> bool:
+        """Отмечает сообщение разобранным; False — его уже посчитали (живой счет или история)."""
+        return self.seen.add(msg_id)
+
+    def unmark_seen(self, msg_id):
+        """Разбор сообщения упал: снимаем отметку, чтобы проход по истории его досчитал."""
+        self.seen.discard(msg_id)
+
+    def mark_counted(self, msg_id):
+        """Сообщение дало совпадения: id в журнал, чтобы после перезапуска история его не пересчитала."""
+        if self.store:
+            self.store.append(["c", msg_id])
+
+    def set_backfill(self, backfill):
+        self.backfill = backfill
+        if self.store:
+            self.store.append(["b", backfill])
+
+    def add_match(self, user_id, name, word, count, persist=True):
+        """Засчитывает count совпадений слова word участнику: O(log n) на все рейтинги."""
+        if persist and self.store:
+            # Имя пишем только для нового участника — остальное восстановится из снимка
+            record = ["m", user_id, word, count] + ([name] if user_id not in self.scores else [])
+            self.store.append(record)
+        self.word_stats[word] = self.word_stats.get(word, 0) + count
+        user_counts = self.user_word_stats.setdefault(word, {})
+        user_counts[user_id] = user_counts.get(user_id, 0) + count
+        words = self.user_words.setdefault(user_id, {})
+        words[word] = words.get(word, 0) + count
+        if user_id not in self.scores:
+            self.scores[user_id] = {"name": name, "count": 0}
+        self.scores[user_id]["count"] += count
+        self.leaderboard.add(user_id, count)
+        if word not in self.word_leaders:
+            self.word_leaders[word] = Leaderboard()
+        self.word_leaders[word].add(user_id, count)
+        self.dirty_users.add(user_id)
+        self.dirty_words.add(word)
+        if persist and self.store and self.store.snapshot_due():
+            self.store.snapshot(self.to_snapshot())
+
+    # ---------- снимок ----------
+    def to_snapshot(self) -> dict:
+        """Агрегаты для снимка; списки сохраняют порядок появления (от него зависят равные места)."""
+        return {
+            "chat_id": self.chat_id,
+            "title": self.title,
+            "words": self.words,
+            "mode": self.mode,
+            "roots": self.roots,
+            "start_time": self.start_time.isoformat() if self.start_time else None,
+            "initiator_id": self.initiator_id,
+            "status_msg_ids": [m.id for m in self.status_msgs],
+            "seen": self.seen.to_list(),
+            "backfill": self.backfill,
+            "scores": [[uid, data["name"], data["count"]] for uid, data in self.scores.items()],
+            "user_word_stats": {w: [[uid, n] for uid, n in users.items()] for w, users in self.user_word_stats.items()},
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict, records):
+        """Снимок + хвост журнала -> (ивент, [id сообщений статуса])."""
+        ev = cls(snapshot["chat_id"], snapshot.get("words"), snapshot.get("mode"), snapshot.get("roots"))
+        ev.title = snapshot.get("title")
+        ev.reset(snapshot.get("initiator_id"))
+        if snapshot.get("start_time"):
+            ev.start_time = datetime.fromisoformat(snapshot["start_time"])
+        ev.seen = IdRanges(snapshot.get("seen"))
+        ev.backfill = snapshot.get("backfill")
+        for uid, name, count in snapshot.get("scores", []):
+            ev.scores[uid] = {"name": name, "count": count}
+            ev.leaderboard.add(uid, count)
+        for word, pairs in snapshot.get("user_word_stats", {}).items():
+            board = ev.word_leaders.setdefault(word, Leaderboard())
+            users = ev.user_word_stats.setdefault(word, {})
+            for uid, n in pairs:
+                users[uid] = n
+                ev.word_stats[word] = ev.word_stats.get(word, 0) + n
+                ev.user_words.setdefault(uid, {})[word] = n
+                board.add(uid, n)
+        for record in records:
+            if record[0] == "m":
+                _, uid, word, count = record[:4]
+                name = record[4] if len(record) > 4 else ev.scores.get(uid, {}).get("name", str(uid))
+                ev.add_match(uid, name, word, count, persist=False)
+            elif record[0] == "c":
+                ev.seen.add(record[1])
+            elif record[0] == "b":
+                ev.backfill = record[1]
+        status_msg_ids = snapshot.get("status_msg_ids")
+        if status_msg_ids is None:
+            # Снимок старой версии: одно сообщение статуса
+            status_msg_ids = [snapshot["status_msg_id"]] if snapshot.get("status_msg_id") else []
+        return ev, status_msg_ids
+
+# Идущие ивенты: {chat_id группы: EventState}
+active_events = {}
+
+# Лимитер исходящих запросов; main.py передает общий через init_event_bot
+limiter = RateLimiter()
+
+# Папка журналов ивентов (DATA_DIR/event/<chat_id>); None — без сохранения на диск
+events_dir = None
+
+# Единый планировщик обновления сообщений статуса всех ивентов
+ui_task = None
+# Будит планировщик, когда у какого-то ивента появились изменения
+ui_wakeup = asyncio.Event()
+# Для метрик: время последних правок и задержка от изменения до его показа (сек)
+ui_edit_times = deque(maxlen=2000)
+ui_staleness = deque(maxlen=2000)
+ui_counters = {"edits": 0, "flood_waits": 0}
+
+def request_update(ev: EventState):
+    """Помечает отчет ивента устаревшим и будит планировщик."""
+    if not ev.needs_update:
+        ev.needs_update = True
+        ev.dirty_since = time.monotonic()
+    ui_wakeup.set()
+
+def event_bot_stats() -> dict:
+    """
+    Метрики обновления статусов: правки в минуту, задержка показа изменений, интервалы ивентов.
+    Вызывается из потока веб-сервера, пока loop меняет очереди и словарь ивентов, поэтому
+    сначала снимаем копии (list() от deque/dict копирует целиком, без переключения потоков).
+    """
+    now = time.monotonic()
+    edit_times = list(ui_edit_times)
+    stale = sorted(list(ui_staleness))
+    events_now = list(active_events.values())
+    return {
+        "edits_per_min": sum(1 for t in edit_times if t > now - 60),
+        "edits_total": ui_counters["edits"],
+        "flood_waits": ui_counters["flood_waits"],
+        "staleness_s": {
+            "p50": round(percentile(stale, 50), 2),
+            "p90": round(percentile(stale, 90), 2),
+            "p99": round(percentile(stale, 99), 2),
+            "max": round(stale[-1], 2) if stale else 0.0,
+        },
+        "events": {
+            ev.chat_id: {
+                "interval_s": round(ev.ui_interval, 1),
+                "pages": len(ev.status_msgs),
+                "stale_for_s": round(now - ev.dirty_since, 1) if ev.needs_update and ev.dirty_since else 0.0,
+            }
+            for ev in events_now
+        },
+    }
+
+# Кэш сущностей, чтобы сообщения шумной группы не превращались в запросы к API:
+# user_id -> (имя для отчета, бот ли) и (чат, id сообщения) -> id автора (для реплаев бота-переводчика)
+user_cache = TTLCache(max_size=50000, ttl=6 * 3600)
+message_authors = TTLCache(max_size=100000, ttl=24 * 3600)
+
+def remember_user(entity):
+    """Кладет пользователя в кэш и возвращает (имя, бот ли); для каналов и чатов — None."""
+    if not isinstance(entity, User):
+        return None
+    info = (html.escape(f"{entity.first_name} {entity.last_name or ''}".strip()), bool(entity.bot))
+    user_cache.put(entity.id, info)
+    return info
+
+def remember_update_entities(event):
+    """Пользователи, пришедшие вместе с обновлением, попадают в кэш без запросов к API."""
+    for entity in (getattr(event, "_entities", None) or {}).values():
+        if isinstance(entity, User):
+            remember_user(entity)
+
+async def get_user_info(message, user_id):
+    """(имя, бот ли) автора сообщения: из кэша, из сущностей обновления и только потом запросом."""
+    info = user_cache.get(user_id)
+    if info is not None:
+        return info
+    sender = message.sender
+    if sender is None:
+        sender = await message.get_sender()
+    return remember_user(sender)
+
+async def get_reply_author(event):
+    """(id, (имя, бот ли)) автора сообщения, на которое отвечают; (None, None), если его нет."""
+    reply_id = event.reply_to_msg_id
+    if not reply_id:
+        return None, None
+    key = (event.chat_id, reply_id)
+    user_id = message_authors.get(key)
+    if user_id is not None:
+        info = user_cache.get(user_id)
+        if info is not None:
+            return user_id, info
+    reply_msg = await event.get_reply_message()
+    if not reply_msg or reply_msg.sender_id is None:
+        return None, None
+    message_authors.put(key, reply_msg.sender_id)
+    return reply_msg.sender_id, await get_user_info(reply_msg, reply_msg.sender_id)
+
+def get_time_str(start_dt):
+    if not start_dt:
+        return "0ч 0м"
+    diff = datetime.now(timezone.utc) - start_dt
+    days = diff.days
+    seconds = diff.seconds
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+
+    time_str = ""
+    if days > 0: time_str += f"{days}д. "
+    time_str += f"{hours}ч. {minutes}м."
+    return time_str
+
+def tg_len(text: str) -> int:
+    """Длина в единицах Telegram (UTF-16): эмодзи считаются за два символа."""
+    return len(text.encode("utf-16-le")) // 2
+
+def render_user_row(ev: EventState, idx, uid, count):
+    data = ev.scores[uid]
+    # Детальная статистика по словам: только слова, которые участник говорил, в порядке слов ивента
+    words = ev.user_words.get(uid, {})
+    user_details = [
+        f"{ev.word_titles.get(w, w)} - {words[w]}"
+        for w in sorted(words, key=lambda w: ev.word_order.get(w, len(ev.word_order)))
+        if words[w] > 0
+    ]
+
+    details_str = ""
+    if user_details:
+        details_str = ", ".join(user_details)
+        if len(details_str) > ROW_LIMIT:
+            details_str = details_str[:ROW_LIMIT].rsplit(", ", 1)[0] + ", …"
+        details_str = f" ({details_str})"
+
+    # Ссылка на профиль tg://user?id=...
+    name_link = f"<a href='tg://user?id={uid}'>{data['name']}</a>"
+    return f"{idx}. {name_link} — <b>{count}</b>{details_str}"
+
+def render_word_row(ev: EventState, word):
+    w_lower = word.lower()
+    total_uses = ev.word_stats.get(w_lower, 0)
+
+    # Лидер по этому слову — вершина рейтинга слова
+    top_user_for_word = "Никто"
+    word_board = ev.word_leaders.get(w_lower)
+    leader = word_board.leader() if word_board else None
+    if leader:
+        top_user_id, top_count = leader
+        # Пытаемся достать имя из общего скора
+        if top_user_id in ev.scores:
+            u_name = ev.scores[top_user_id]['name']
+            top_user_for_word = f"<a href='tg://user?id={top_user_id}'>{u_name}</a> ({top_count})"
+
+    return f"▪️ <i>{word}</i>: использовано {total_uses} раз. Лидер: {top_user_for_word}"
+
+def render_rows(ev: EventState):
+    """
+    Строки тела отчета. Берутся из кэша; заново рисуются только строки участников и слов,
+    у которых были совпадения с прошлой отрисовки (или участников, сменивших место).
+    """
+    for uid in ev.dirty_users:
+        ev.row_cache.pop(uid, None)
+    for word in ev.dirty_words:
+        ev.word_row_cache.pop(word, None)
+    ev.dirty_users.clear()
+    ev.dirty_words.clear()
+
+    # Лучшие LEADERBOARD_TOP_K участников из инкрементального рейтинга (без сортировки всех)
+    top_users = ev.leaderboard.top(LEADERBOARD_TOP_K)
+    lines = []
+    if top_users:
+        lines += ["", "🏆 <b>Лидерборд:</b>"]
+        for idx, (uid, count) in enumerate(top_users, 1):
+            cached = ev.row_cache.get(uid)
+            if cached is None or cached[0] != idx:
+                cached = (idx, render_user_row(ev, idx, uid, count))
+                ev.row_cache[uid] = cached
+            lines.append(cached[1])
+        hidden = len(ev.leaderboard) - len(top_users)
+        if hidden > 0:
+            lines.append(f"… и еще {hidden} участников")
+        # Выбывшие из топа больше не рисуются — их строки не держим
+        if len(ev.row_cache) > 2 * len(top_users):
+            ev.row_cache = {uid: ev.row_cache[uid] for uid, _ in top_users if uid in ev.row_cache}
+    else:
+        lines += ["", "💤 Пока никто ничего не угадал."]
+
+    # Аналитика по словам
+    lines += ["", "📉 <b>Аналитика по словам:</b>"]
+    for word in ev.words:
+        w_lower = word.lower()
+        row = ev.word_row_cache.get(w_lower)
+        if row is None:
+            row = ev.word_row_cache[w_lower] = render_word_row(ev, word)
+        lines.append(row)
+    return lines
+
+def render_report_pages(ev: EventState, is_final=False):
+    """
+    Отчет, разбитый на страницы не длиннее MESSAGE_LIMIT (по целым строкам).
+    Первая страница — заголовок с группой и временем, следующие — продолжение.
+    """
+    title = "🏁 <b>ИТОГИ ИВЕНТА</b>" if is_final else "📊 <b>LIVE СТАТИСТИКА</b>"
+    group = f"💬 Группа: <b>{html.escape(ev.title)}</b>" if ev.title else f"💬 Группа: <code>{ev.chat_id}</code>"
+    timer = f"⏱ Время работы: <b>{get_time_str(ev.start_time)}</b>"
+    if is_final:
+        timer += " (Завершен)"
+
+    pages = []
+    page = [title, group, timer]
+    size = sum(tg_len(line) + 1 for line in page)
+    for line in render_rows(ev):
+        line_len = tg_len(line) + 1
+        if size + line_len > MESSAGE_LIMIT:
+            pages.append("\n".join(page))
+            page = [f"{title} <i>(продолжение, стр. {len(pages) + 1})</i>"]
+            size = tg_len(page[0]) + 1
+            if not line:
+                # Пустая строка-разделитель в начале страницы не нужна
+                continue
+        page.append(line)
+        size += line_len
+    pages.append("\n".join(page))
+    return pages
+
+async def send_report(client: TelegramClient, chat_id, pages, reply_to=None):
+    """Отправляет страницы отчета по порядку -> [сообщения]."""
+    sent = []
+    for text in pages:
+        async with limiter.throttle("send_message"):
+            sent.append(await client.send_message(chat_id, text, parse_mode='html', reply_to=reply_to))
+    return sent
+
+def _count_edit():
+    ui_edit_times.append(time.monotonic())
+    ui_counters["edits"] += 1
+
+async def refresh_status(client: TelegramClient, ev: EventState):
+    """
+    Обновляет сообщения статуса ивента: правятся только страницы с изменившимся текстом,
+    недостающие страницы досылаются, лишние (отчет стал короче) удаляются.
+    FloodWait увеличивает интервал обновления ивента, спокойное обновление — уменьшает.
+    """
+    # Флаг снимаем до отрисовки: совпадения, пришедшие во время правок, снова вызовут
+    # request_update и попадут в следующее обновление, а не потеряются
+    dirty_since = ev.dirty_since
+    ev.needs_update = False
+    ev.dirty_since = None
+    pages = render_report_pages(ev, is_final=False)
+    ok = True
+
+    for i, text in enumerate(pages):
+        try:
+            if i >= len(ev.status_msgs):
+                # Отчет вырос — новая страница отдельным сообщением
+                async with limiter.throttle("send_message"):
+                    msg = await client.send_message(ev.initiator_id, text, parse_mode='html')
+                ev.status_msgs.append(msg)
+                ev.page_texts.append(text)
+                _count_edit()
+                continue
+            # Сравниваем с последним успешно отправленным текстом (в памяти),
+            # а не с тем, что возвращает API (там могут быть отличия в разметке).
+            if text == ev.page_texts[i]:
+                # Текст страницы идентичен, обновление не требуется
+                continue
+            async with limiter.throttle("edit"):
+                await ev.status_msgs[i].edit(text, parse_mode='html')
+            ev.page_texts[i] = text # Запоминаем успешный текст
+            _count_edit()
+        except MessageNotModifiedError:
+            # Telegram говорит, что ничего не поменялось.
+            # Синхронизируем наше состояние и игнорируем ошибку.
+            ev.page_texts[i] = text
+        except FloodWaitError as e:
+            # Лимитер уже поставил метод на паузу; этот ивент дальше обновляем реже
+            ok = False
+            ui_counters["flood_waits"] += 1
+            ev.ui_interval = min(UI_MAX_INTERVAL, max(ev.ui_interval * UI_BACKOFF, e.seconds))
+            logger.warning(f"UI FloodWait {e.seconds}с ({ev.chat_id}): интервал обновления {ev.ui_interval:.0f}с")
+            break
+        except Exception as e:
+            ok = False
+            logger.warning(f"UI Update error ({ev.chat_id}, стр. {i + 1}): {e}")
+            break
+
+    if ok:
+        # Отчет стал короче — лишние страницы удаляем
+        while len(ev.status_msgs) > len(pages):
+            msg = ev.status_msgs.pop()
+            ev.page_texts.pop()
+            try:
+                async with limiter.throttle("edit"):
+                    await msg.delete()
+            except Exception:
+                pass
+        if dirty_since is not None:
+            ui_staleness.append(time.monotonic() - dirty_since)
+        # Без FloodWait постепенно возвращаемся к минимальному интервалу
+        ev.ui_interval = max(UI_MIN_INTERVAL, ev.ui_interval * UI_RECOVERY)
+    else:
+        # Не получилось — изменения остаются неотображенными с прежнего момента
+        ev.needs_update = True
+        if dirty_since is not None:
+            ev.dirty_since = dirty_since if ev.dirty_since is None else min(ev.dirty_since, dirty_since)
+    ev.last_edit_at = time.monotonic()
+
+async def ui_scheduler_loop(client: TelegramClient):
+    """
+    Фоновая задача на все ивенты сразу. Спит, пока request_update не сообщит об изменениях;
+    ивент правится, когда с его прошлого обновления прошел его интервал (сначала те, что
+    дольше не обновлялись). Сколько бы совпадений ни пришло за интервал — одно обновление
+    на ивент, а во время FloodWait на edit никто не правится до конца паузы.
+    """
+    logger.info("UI Scheduler started")
+    while True:
+        try:
+            # Сбрасываем до обхода: изменения, пришедшие во время правок, разбудят следующий круг
+            ui_wakeup.clear()
+            now = time.monotonic()
+            paused = limiter.paused_until.get("edit", 0.0) - now
+            if paused > 0:
+                await asyncio.sleep(paused)
+                continue
+
+            due, next_at = [], None
+            for ev in active_events.values():
+                # Проверяем status_msgs на случай, если сообщение статуса не удалось отправить или найти
+                if not (ev.is_running and ev.needs_update and ev.status_msgs):
+                    continue
+                at = ev.last_edit_at + ev.ui_interval
+                if at <= now:
+                    due.append(ev)
+                elif next_at is None or at < next_at:
+                    next_at = at
+            for ev in sorted(due, key=lambda ev: ev.last_edit_at):
+                await refresh_status(client, ev)
+                if limiter.paused_until.get("edit", 0.0) > time.monotonic():
+                    break
+            if due:
+                continue
+
+            # Ждем изменений или срока ближайшего отложенного ивента
+            try:
+                await asyncio.wait_for(ui_wakeup.wait(), None if next_at is None else next_at - now)
+            except asyncio.TimeoutError:
+                pass
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error(f"Error in UI loop: {e}")
+            await asyncio.sleep(5)
+
+def ensure_ui_scheduler(client: TelegramClient):
+    global ui_task
+    if ui_task is None or ui_task.done():
+        ui_task = asyncio.create_task(ui_scheduler_loop(client))
+
+async def count_message(ev: EventState, message) -> bool:
+    """
+    Разбирает одно сообщение группы (живое или из истории) и засчитывает совпадения.
+    True — что-то засчитано.
+    """
+    sender_id = message.sender_id
+    if sender_id is None:
+        return False
+    # Запоминаем автора: бот-переводчик потом ответит на это сообщение реплаем
+    message_authors.put((ev.chat_id, message.id), sender_id)
+
+    sender_info = await get_user_info(message, sender_id)
+    if not sender_info:
+        return False
+
+    is_transcription_bot = (sender_id == TRANSCRIPTION_BOT_ID)
+
+    # Логика фильтрации ботов:
+    # Если пишет бот и это НЕ бот-переводчик -> игнорируем
+    if sender_info[1] and not is_transcription_bot:
+        return False
+
+    # Игнорируем команды управления
+    if (message.raw_text or "").lower().strip().startswith((CMD_START_EVENT, CMD_STOP_EVENT, CMD_BACKFILL_EVENT)):
+        return False
+
+    # --- ОПРЕДЕЛЕНИЕ РЕАЛЬНОГО АВТОРА И ТЕКСТА ---
+    if is_transcription_bot:
+        # Если пишет бот-переводчик, ищем автора оригинального сообщения (reply)
+        user_id, target_info = await get_reply_author(message)
+        if user_id is None:
+            # Если реплая нет (странно для этого бота), игнорируем
+            return False
+    else:
+        # Обычный пользователь
+        user_id, target_info = sender_id, sender_info
+
+    if not target_info:
+        return False
+
+    # Игнорируем, если "реальный автор" тоже бот (на всякий случай)
+    full_name, target_is_bot = target_info
+    if target_is_bot:
+        return False
+
+    # Получаем текст.
+    # raw_text берет:
+    # 1. Текст обычного сообщения
+    # 2. Caption (подпись) к картинке/видео
+    # 3. Текст внутри цитирования (blockquote) без Markdown-символов
+    msg_text = (message.raw_text or "").lower().strip()
+
+    # --- ЛОГИКА ПОИСКА (режим и слова — свои у каждого ивента) ---
+    found = ev.match(msg_text)
+    if not found:
+        return False
+
+    # --- ОБНОВЛЕНИЕ СЧЕТА ПОЛЬЗОВАТЕЛЯ ---
+    ev.mark_counted(message.id)
+    for s_lower, count_in_msg in found.items():
+        ev.add_match(user_id, full_name, s_lower, count_in_msg)
+    return True
+
+# ================= ДОСЧЕТ ПО ИСТОРИИ =================
+
+async def prefetch_reply_authors(client: TelegramClient, ev: EventState, batch):
+    """Авторы сообщений, на которые отвечает бот-переводчик, — одним запросом на пачку."""
+    for m in batch:
+        if m.sender_id is not None:
+            message_authors.put((ev.chat_id, m.id), m.sender_id)
+            remember_user(m.sender)
+    missing = sorted({
+        m.reply_to_msg_id for m in batch
+        if m.sender_id == TRANSCRIPTION_BOT_ID and m.reply_to_msg_id
+        and message_authors.get((ev.chat_id, m.reply_to_msg_id)) is None
+    })
+    if not missing:
+        return
+    async with limiter.throttle("get_messages"):
+        originals = await client.get_messages(ev.chat_id, ids=missing)
+    for m in originals:
+        if m is not None and m.sender_id is not None:
+            message_authors.put((ev.chat_id, m.id), m.sender_id)
+            remember_user(m.sender)
+
+async def run_backfill(client: TelegramClient, ev: EventState):
+    """Проход по истории от курсора до end_id; курсор после каждой пачки — в журнал ивента."""
+    bf = dict(ev.backfill)
+    started = time.perf_counter()
+    logger.info(f"🔎 Бэкфилл {ev.chat_id}: сообщения {bf['cursor'] + 1}…{bf['end_id']}")
+    try:
+        async for batch in fetch_history(client, limiter, ev.chat_id, bf["cursor"], bf["end_id"]):
+            if not ev.is_running:
+                return
+            await prefetch_reply_authors(client, ev, batch)
+            counted = 0
+            for message in batch:
+                # То, что уже посчитано живым счетом (или прошлым проходом), пропускаем
+                if not ev.mark_seen(message.id):
+                    continue
+                try:
+                    if await count_message(ev, message):
+                        counted += 1
+                except BaseException:
+                    ev.unmark_seen(message.id)
+                    raise
+            bf["cursor"] = batch[-1].id
+            bf["scanned"] += len(batch)
+            bf["counted"] += counted
+            ev.set_backfill(dict(bf))
+            if counted:
+                request_update(ev)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Бэкфилл {ev.chat_id} прерван на {bf['cursor']}: {e}")
+        await notify(client, bf.get("notify"), f"❌ Бэкфилл прерван: {e}\nПовторите команду — он продолжится с места остановки.")
+        return
+    finally:
+        ev.backfill_task = None
+
+    ev.set_backfill(None)
+    logger.info(f"🔎 Бэкфилл {ev.chat_id} завершен за {time.perf_counter() - started:.0f}с: "
+                f"просмотрено {bf['scanned']}, засчитано {bf['counted']}")
+    await notify(client, bf.get("notify"),
+                 f"✅ Бэкфилл завершен: просмотрено {bf['scanned']} сообщений, засчитано {bf['counted']}.")
+
+async def notify(client: TelegramClient, chat_id, text: str):
+    if not chat_id:
+        return
+    try:
+        async with limiter.throttle("send_message"):
+            await client.send_message(chat_id, text)
+    except Exception as e:
+        logger.warning(f"Не удалось отправить сообщение о бэкфилле: {e}")
+
+_PERIOD_ARG_RE = re.compile(r"(\d+)\s*(ч|м)")
+
+async def start_backfill(client: TelegramClient, event, chat_id, raw_args: str):
+    ev = active_events.get(chat_id)
+    if ev is None:
+        async with limiter.throttle("send_message"):
+            await event.reply("⚠️ Ивент не запущен.")
+        return
+    if ev.backfill_task:
+        async with limiter.throttle("send_message"):
+            await event.reply("⚠️ Бэкфилл уже идет.")
+        return
+
+    if not ev.backfill:
+        m = _PERIOD_ARG_RE.search(raw_args.lower())
+        if m:
+            amount = int(m.group(1))
+            start_date = datetime.now(timezone.utc) - (timedelta(hours=amount) if m.group(2) == "ч" else timedelta(minutes=amount))
+        else:
+            start_date = ev.start_time
+        cursor = await first_id_after(client, limiter, chat_id, start_date)
+        end_id = await last_id(client, limiter, chat_id)
+        ev.set_backfill({"cursor": cursor, "end_id": end_id, "scanned": 0, "counted": 0, "notify": event.chat_id})
+    async with limiter.throttle("send_message"):
+        await event.reply(f"🔎 Бэкфилл: сообщения {ev.backfill['cursor'] + 1}…{ev.backfill['end_id']}"
+                          + (f" (продолжение, уже просмотрено {ev.backfill['scanned']})" if ev.backfill["scanned"] else ""))
+    ev.backfill_task = asyncio.create_task(run_backfill(client, ev))
+
+# ================= ЗАПУСК / ОСТАНОВКА ИВЕНТОВ =================
+
+_CHAT_ARG_RE = re.compile(r"^\s*(-?\d{5,})")
+_MODE_ARG_RE = re.compile(r"режим\s*([12])")
+_WORDS_ARG_RE = re.compile(r"слова\s*:\s*(.+)$", re.IGNORECASE | re.DOTALL)
+
+def parse_event_args(raw_args: str):
+    """'[-100123] [режим 1] [слова: WW, Завоз]' -> (chat_id или None, режим или None, слова или None)."""
+    chat_id = mode = words = None
+    m = _CHAT_ARG_RE.match(raw_args)
+    if m:
+        chat_id = int(m.group(1))
+    m = _MODE_ARG_RE.search(raw_args.lower())
+    if m:
+        mode = int(m.group(1))
+    m = _WORDS_ARG_RE.search(raw_args)
+    if m:
+        words = [w.strip() for w in m.group(1).split(",") if w.strip()] or None
+    return chat_id, mode, words
+
+def open_store(ev: EventState):
+    if events_dir:
+        ev.store = EventStore(os.path.join(events_dir, str(ev.chat_id)))
+        ev.store.start()
+
+def restore_events(data_dir: str):
+    """Поднимает журналы ивентов; ивенты, шедшие до перезапуска, восстанавливаются. -> [(ивент, [id сообщений статуса])]"""
+    global events_dir
+    events_dir = os.path.join(data_dir, "event")
+    restored = []
+    try:
+        names = sorted(os.listdir(events_dir))
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        if not re.fullmatch(r"-?\d+", name):
+            continue
+        started = time.perf_counter()
+        store = EventStore(os.path.join(events_dir, name))
+        try:
+            snapshot, records = store.load()
+            if not snapshot:
+                continue
+            ev, status_msg_ids = EventState.from_snapshot(snapshot, records)
+        except Exception as e:
+            logger.error(f"❌ Не удалось восстановить ивент {name}: {e}")
+            continue
+        ev.store = store
+        store.start()
+        # Свежий снимок: следующему перезапуску не придется снова читать тот же хвост
+        store.snapshot(ev.to_snapshot())
+        active_events[ev.chat_id] = ev
+        restored.append((ev, status_msg_ids))
+        logger.info(f"💾 Ивент {ev.chat_id} восстановлен за {time.perf_counter() - started:.2f}с: "
+                    f"{len(ev.scores)} участников, записей журнала после снимка: {len(records)}")
+    return restored
+
+async def resume_event(client: TelegramClient, ev: EventState, status_msg_ids):
+    """Продолжает обновлять сообщения статуса восстановленного ивента."""
+    if status_msg_ids and ev.initiator_id:
+        try:
+            async with limiter.throttle("get_messages"):
+                msgs = await client.get_messages(ev.initiator_id, ids=status_msg_ids)
+            # Удаленные вручную страницы приходят как None — их место займут новые сообщения
+            ev.status_msgs = [m for m in msgs if m is not None]
+        except Exception as e:
+            logger.warning(f"Не удалось найти сообщения статуса ивента {ev.chat_id}: {e}")
+    if not ev.status_msgs and ev.initiator_id:
+        try:
+            ev.status_msgs = await send_report(client, ev.initiator_id, render_report_pages(ev))
+        except Exception as e:
+            logger.warning(f"Не удалось отправить статус ивента {ev.chat_id}: {e}")
+    # Текст страниц после перезапуска неизвестен — первое обновление правит все
+    ev.page_texts = [None] * len(ev.status_msgs)
+    request_update(ev)
+    ensure_ui_scheduler(client)
+    # Проход по истории шел до перезапуска — продолжаем с сохраненного курсора
+    if ev.backfill:
+        ev.backfill_task = asyncio.create_task(run_backfill(client, ev))
+
+def close_event_bot():
+    """Дописывает журналы ивентов на диск (при завершении процесса)."""
+    for ev in active_events.values():
+        if ev.store:
+            ev.store.close()
+
+async def start_event(client: TelegramClient, event, chat_id, mode, words):
+    sender_id = event.sender_id
+    if chat_id in active_events:
+        async with limiter.throttle("send_message"):
+            await event.reply("⚠️ Ивент в этой группе уже запущен!")
+        return
+
+    ev = EventState(chat_id, words, mode)
+    try:
+        chat = await event.get_chat() if event.chat_id == chat_id else await client.get_entity(chat_id)
+        ev.title = getattr(chat, "title", None)
+    except Exception as e:
+        logger.warning(f"Не удалось получить название группы {chat_id}: {e}")
+    ev.reset(sender_id)
+    active_events[chat_id] = ev
+
+    pages = render_report_pages(ev, is_final=False)
+    ev.status_msgs = await send_report(client, sender_id, pages)
+    open_store(ev)
+    if ev.store:
+        ev.store.reset(ev.to_snapshot())
+
+    # Инициализируем кэш текста сразу же, чтобы планировщик не пытался редактировать
+    # только что отправленные сообщения
+    ev.page_texts = pages
+    ev.needs_update = False
+    ev.last_edit_at = time.monotonic()
+
+    ensure_ui_scheduler(client)
+    logger.info(f"Ивент в {chat_id} запущен администратором {sender_id} (режим {ev.mode}, слов: {len(ev.words)})")
+
+async def stop_event(client: TelegramClient, event, chat_id):
+    ev = active_events.pop(chat_id, None)
+    if ev is None:
+        async with limiter.throttle("send_message"):
+            await event.reply("⚠️ Ивент не запущен.")
+        return
+
+    ev.is_running = False
+    if ev.backfill_task:
+        ev.backfill_task.cancel()
+    if ev.store:
+        ev.store.clear()
+        # close() ждет поток записи (дописать очередь и fsync) — не на event loop
+        await asyncio.to_thread(ev.store.close)
+
+    # Формируем финальный отчет
+    final_pages = render_report_pages(ev, is_final=True)
+
+    # 1. Удаляем лайв-сообщения в ЛС (если есть)
+    for msg in ev.status_msgs:
+        try:
+            async with limiter.throttle("edit"):
+                await msg.delete()
+        except Exception:
+            pass
+
+    # 2. Отправляем итоги в ЛС инициатору
+    if ev.initiator_id:
+        await send_report(client, ev.initiator_id, final_pages)
+
+    # 3. Если команду написали в Группе, дублируем туда
+    if event.chat_id == chat_id:
+        await send_report(client, chat_id, final_pages, reply_to=event.id)
+
+    logger.info(f"Ивент в {chat_id} остановлен. Кэш отправителей: {user_cache.snapshot()}, авторов сообщений: {message_authors.snapshot()}")
+
+# ================= ГЛАВНАЯ ФУНКЦИЯ ПОДКЛЮЧЕНИЯ =================
+
+def init_event_bot(client: TelegramClient, shared_limiter: RateLimiter = None, data_dir: str = None):
+    """Подключает хендлеры ивента к существующему клиенту."""
+    global limiter
+    if shared_limiter is not None:
+        limiter = shared_limiter
+    logger.info("🎮 Event Bot module loaded")
+    if data_dir:
+        for ev, status_msg_ids in restore_events(data_dir):
+            asyncio.create_task(resume_event(client, ev, status_msg_ids))
+
+    @client.on(events.NewMessage(from_users=ADMIN_IDS))
+    async def admin_commands_handler(event):
+        sender_id = event.sender_id
+
+        if sender_id not in ADMIN_IDS:
+            return
+
+        raw = event.raw_text.strip()
+        text = raw.lower()
+        if text.startswith(CMD_START_EVENT):
+            command, raw_args = CMD_START_EVENT, raw[len(CMD_START_EVENT):]
+        elif text.startswith(CMD_STOP_EVENT):
+            command, raw_args = CMD_STOP_EVENT, raw[len(CMD_STOP_EVENT):]
+        elif text.startswith(CMD_BACKFILL_EVENT):
+            command, raw_args = CMD_BACKFILL_EVENT, raw[len(CMD_BACKFILL_EVENT):]
+        else:
+            return
+
+        chat_id, mode, words = parse_event_args(raw_args)
+        if not event.is_private:
+            # Команда в группе управляет ивентом этой группы
+            chat_id = event.chat_id
+        elif chat_id is None:
+            # В ЛС без id: единственный ивент этого админа, иначе группа по умолчанию
+            own = [cid for cid, ev in active_events.items() if ev.initiator_id == sender_id]
+            chat_id = own[0] if command != CMD_START_EVENT and len(own) == 1 else TARGET_GROUP_ID
+
+        # --- КОМАНДА СТАРТ ---
+        if command == CMD_START_EVENT:
+            await start_event(client, event, chat_id, mode, words)
+
+        # --- КОМАНДА СТОП ---
+        elif command == CMD_STOP_EVENT:
+            await stop_event(client, event, chat_id)
+
+        # --- КОМАНДА БЭКФИЛЛ ---
+        else:
+            await start_backfill(client, event, chat_id, raw_args)
+
+    @client.on(events.NewMessage(func=lambda e: e.chat_id in active_events))
+    async def group_watcher_handler(event):
+        # Игнорируем, если ивент не запущен
+        ev = active_events.get(event.chat_id)
+        if ev is None or not ev.is_running:
+            return
+        # Сообщение уже посчитано проходом по истории. Отметка ставится до разбора (чтобы
+        # бэкфилл не посчитал его параллельно) и снимается, если разбор упал, — тогда его досчитает бэкфилл
+        if not ev.mark_seen(event.id):
+            return
+        try:
+            remember_update_entities(event)
+            counted = await count_message(ev, event)
+        except BaseException:
+            ev.unmark_seen(event.id)
+            raise
+        if counted:
+            # Ставим флаг обновления и будим планировщик, вместо прямого вызова
+            request_update(ev)
@@ -0,0 +1,250 @@
+# event_store.py | Журнал ивента на диске: снимок агрегатов + журнал предзаписи (WAL)
+#
+# Файлы в папке ивента:
+#   snapshot.json     — агрегаты ивента на момент снимка и номер поколения G
+#   events.<G>.wal    — совпадения после снимка, по строке JSON на запись
+# Восстановление: снимок + журналы поколений >= G. Снимок делается каждые
+# SNAPSHOT_EVERY записей или SNAPSHOT_INTERVAL секунд, поэтому хвост журнала
+# и время восстановления ограничены, сколько бы ни длился ивент.
+import os
+import json
+import time
+import queue
+import logging
+import threading
+
+from utils import write_json_atomic
+
+logger = logging.getLogger("event_bot.store")
+
+# Запись в журнал пачками с одним fsync: не реже FLUSH_INTERVAL или по FLUSH_BATCH записей
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH = 500
+# Когда делать снимок агрегатов
+SNAPSHOT_EVERY = 20000
+SNAPSHOT_INTERVAL = 300.0
+
+SNAPSHOT_FILE = "snapshot.json"
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class EventStore:
+    """
+    Пишет поток записи: event loop только кладет записи в очередь. Снимок тоже
+    идет через очередь — все записи до него оказываются в старом журнале, все
+    после — в новом, поэтому снимок и журнал всегда согласованы без блокировок.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._stopping = threading.Event()
+        self._wal = None
+        self.generation = 0
+        self.since_snapshot = 0
+        self._snapshot_at = time.monotonic()
+        self.records = 0
+        self.fsyncs = 0
+
+    # ---------- API для event loop ----------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="event-store", daemon=True)
+        self._thread.start()
+
+    def append(self, record):
+        """Неблокирующая запись в журнал (список/словарь, сериализуется в потоке записи)."""
+        self._queue.put(("record", record))
+        self.since_snapshot += 1
+
+    def snapshot_due(self) -> bool:
+        return self.since_snapshot >= SNAPSHOT_EVERY or (
+            self.since_snapshot > 0 and time.monotonic() - self._snapshot_at >= SNAPSHOT_INTERVAL)
+
+    def snapshot(self, data: dict):
+        """data — агрегаты на текущий момент (уже скопированные, их можно менять дальше)."""
+        self._queue.put(("snapshot", data))
+        self.since_snapshot = 0
+        self._snapshot_at = time.monotonic()
+
+    def reset(self, data: dict):
+        """Новый ивент: старые файлы удаляются, первый снимок — data."""
+        self._queue.put(("reset", data))
+        self.since_snapshot = 0
+        self._snapshot_at = time.monotonic()
+
+    def clear(self):
+        """Ивент завершен: файлы больше не нужны."""
+        self._queue.put(("clear", None))
+        self.since_snapshot = 0
+
+    def close(self, timeout: float = 5.0):
+        """Дописывает очередь (с fsync) и останавливает поток."""
+        if self._thread:
+            self._stopping.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ---------- восстановление (до start) ----------
+    def load(self):
+        """
+        (снимок или None, [записи журнала после снимка]); битая последняя строка отбрасывается.
+        Без снимка ивента нет: оставшиеся журналы — хвост уже завершенного ивента.
+        """
+        snapshot = None
+        try:
+            with open(os.path.join(self.directory, SNAPSHOT_FILE), "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ Снимок ивента поврежден, ивент не восстановить: {e}")
+
+        gens = self._wal_generations()
+        if snapshot is None:
+            self.generation = gens[-1] if gens else 0
+            return None, []
+        self.generation = int(snapshot.get("generation", 0))
+        records = []
+        for gen in gens:
+            if gen < self.generation:
+                continue
+            path = self._wal_path(gen)
+            with open(path, "r", encoding="utf-8") as f:
+                for line_no, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # Обрыв при падении: запись не дописана до конца
+                        logger.warning(f"⚠️ {os.path.basename(path)}:{line_no}: недописанная запись пропущена")
+            self.generation = max(self.generation, gen)
+        return snapshot, records
+
+    # ---------- файлы ----------
+    def _wal_path(self, gen: int) -> str:
+        return os.path.join(self.directory, f"events.{gen}.wal")
+
+    def _wal_generations(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        gens = []
+        for name in names:
+            if name.startswith("events.") and name.endswith(".wal"):
+                try:
+                    gens.append(int(name[len("events."):-len(".wal")]))
+                except ValueError:
+                    pass
+        return sorted(gens)
+
+    def _open_wal(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._wal_path(self.generation)
+        # Недописанная строка после падения: начинаем с новой строки, чтобы не склеить записи
+        torn = False
+        try:
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    torn = f.read(1) != b"\n"
+        except FileNotFoundError:
+            pass
+        self._wal = open(path, "a", encoding="utf-8")
+        if torn:
+            self._wal.write("\n")
+
+    def _close_wal(self):
+        if self._wal:
+            self._wal.close()
+            self._wal = None
+
+    def _write_snapshot(self, data: dict):
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        write_json_atomic(path, dict(data, generation=self.generation, saved_at=time.time()),
+                          fsync=True, ensure_ascii=False, separators=(",", ":"))
+
+    def _remove_old_wals(self, keep_from: int):
+        for gen in self._wal_generations():
+            if gen < keep_from:
+                try:
+                    os.remove(self._wal_path(gen))
+                except OSError:
+                    pass
+
+    # ---------- поток записи ----------
+    def _flush(self, lines):
+        if not lines:
+            return
+        if self._wal is None:
+            self._open_wal()
+        self._wal.write("".join(lines))
+        self._wal.flush()
+        os.fsync(self._wal.fileno())
+        self.records += len(lines)
+        self.fsyncs += 1
+
+    def _handle(self, kind, payload, lines):
+        if kind == "record":
+            lines.append(_dumps(payload) + "\n")
+            return
+        # Снимок/сброс/очистка: сначала дописываем все, что было до них
+        self._flush(lines)
+        lines.clear()
+        self._close_wal()
+        if kind == "snapshot":
+            self.generation += 1
+            self._write_snapshot(payload)
+            self._remove_old_wals(self.generation)
+        elif kind == "reset":
+            # Новое поколение: снимок нового ивента атомарно заменяет старый, журналы старого не читаются
+            self.generation += 1
+            self._write_snapshot(payload)
+            self._remove_old_wals(self.generation)
+        elif kind == "clear":
+            # Сначала снимок: без него оставшиеся журналы при восстановлении игнорируются
+            try:
+                os.remove(os.path.join(self.directory, SNAPSHOT_FILE))
+            except OSError:
+                pass
+            self._remove_old_wals(self.generation + 1)
+
+    def _run(self):
+        lines = []
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                kind, payload = self._queue.get(timeout=min(timeout, 0.5))
+                try:
+                    self._handle(kind, payload, lines)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка журнала ивента ({kind}): {e}")
+            except queue.Empty:
+                pass
+
+            stopping = self._stopping.is_set()
+            if lines and (len(lines) >= FLUSH_BATCH or time.monotonic() >= deadline or stopping):
+                try:
+                    self._flush(lines)
+                except Exception as e:
+                    logger.error(f"❌ Не удалось записать журнал ивента ({len(lines)} записей): {e}")
+                lines = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + FLUSH_INTERVAL
+            if stopping and self._queue.empty() and not lines:
+                break
+        self._close_wal()
+
+    def stats(self) -> dict:
+        return {"generation": self.generation, "records": self.records, "fsyncs": self.fsyncs,
+                "since_snapshot": self.since_snapshot}
@@ -0,0 +1,71 @@
+# leaderboard.py | Рейтинг с инкрементальным обновлением: O(log n) на очко, O(K log n) на топ-K
+import heapq
+
+
+class Leaderboard:
+    """
+    Счет участников плюс куча (-счет, порядок появления, id) с ленивым удалением:
+    при изменении счета старая запись в куче не ищется, а просто устаревает и
+    выбрасывается, когда всплывает наверх. При равном счете выше тот, кто появился
+    раньше, — как при устойчивой сортировке словаря по убыванию.
+    """
+
+    def __init__(self):
+        self.scores = {}
+        self._order = {}
+        self._heap = []
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __contains__(self, key):
+        return key in self.scores
+
+    def get(self, key, default=0):
+        return self.scores.get(key, default)
+
+    def add(self, key, delta: int = 1) -> int:
+        if not delta:
+            return self.scores.get(key, 0)
+        order = self._order.get(key)
+        if order is None:
+            order = self._order[key] = len(self._order)
+        score = self.scores.get(key, 0) + delta
+        self.scores[key] = score
+        heapq.heappush(self._heap, (-score, order, key))
+        # Устаревших записей не больше, чем живых: иначе пересобираем кучу
+        if len(self._heap) > 2 * len(self.scores) + 64:
+            self._compact()
+        return score
+
+    def _compact(self):
+        self._heap = [(-score, self._order[key], key) for key, score in self.scores.items()]
+        heapq.heapify(self._heap)
+
+    def _is_live(self, entry) -> bool:
+        neg_score, _, key = entry
+        return self.scores.get(key) == -neg_score
+
+    def top(self, k: int):
+        """[(id, счет)] лучших k по убыванию счета."""
+        heap = self._heap
+        taken, seen = [], set()
+        while heap and len(taken) < k:
+            entry = heapq.heappop(heap)
+            # Дубликат с тем же счетом возможен, если счет уменьшали и вернули обратно
+            if self._is_live(entry) and entry[2] not in seen:
+                taken.append(entry)
+                seen.add(entry[2])
+        for entry in taken:
+            heapq.heappush(heap, entry)
+        return [(key, -neg_score) for neg_score, _, key in taken]
+
+    def leader(self):
+        """(id, счет) лидера или None."""
+        heap = self._heap
+        while heap and not self._is_live(heap[0]):
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        neg_score, _, key = heap[0]
+        return key, -neg_score
@@ -0,0 +1,129 @@
+# loop_monitor.py | Задержка event loop и поиск долгих (блокирующих) колбэков
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from utils import percentile
+
+logger = logging.getLogger("auto_fisher.loop")
+
+# Как часто меряем задержку loop (секунды)
+LAG_INTERVAL = 0.1
+# Колбэк, занявший loop дольше этого, считается медленным
+SLOW_CALLBACK_THRESHOLD = 0.15
+# Сколько последних замеров и медленных колбэков хранить
+LAG_HISTORY = 3000
+SLOW_HISTORY = 50
+
+
+def _format_stack(frame, limit: int = 12):
+    stack = []
+    while frame is not None and len(stack) < limit:
+        code = frame.f_code
+        stack.append(f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return stack  # от самого глубокого кадра к внешнему
+
+
+class LoopMonitor:
+    """
+    Корутина каждые LAG_INTERVAL засыпает и меряет, насколько позже проснулась —
+    это задержка loop. Сторожевой поток видит, что корутина давно не отмечалась,
+    и снимает стек потока loop прямо во время зависания: так видно, кто блокирует.
+    """
+
+    def __init__(self, interval: float = LAG_INTERVAL, slow_threshold: float = SLOW_CALLBACK_THRESHOLD):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.lags = deque(maxlen=LAG_HISTORY)
+        self.slow_callbacks = deque(maxlen=SLOW_HISTORY)
+        self.slow_total = 0
+        self._heartbeat = time.perf_counter()
+        self._loop_thread = None
+        self._task = None
+        self._watchdog = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        """Запускать из потока event loop."""
+        if self._task:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _measure(self):
+        try:
+            while True:
+                expected = time.perf_counter() + self.interval
+                await asyncio.sleep(self.interval)
+                now = time.perf_counter()
+                self.lags.append(max(0.0, now - expected))
+                self._heartbeat = now
+        except asyncio.CancelledError:
+            pass
+
+    def _watch(self):
+        current = None  # текущее зависание, которое еще длится
+        while not self._stopping.wait(self.slow_threshold / 2):
+            stalled = time.perf_counter() - self._heartbeat - self.interval
+            if stalled >= self.slow_threshold:
+                if current is None:
+                    frame = sys._current_frames().get(self._loop_thread)
+                    current = {"at": time.time(), "stalled": stalled, "stack": _format_stack(frame)}
+                    self.slow_callbacks.append(current)
+                    self.slow_total += 1
+                else:
+                    current["stalled"] = stalled
+            elif current is not None:
+                where = current["stack"][0] if current["stack"] else "?"
+                logger.warning(f"🐢 Event loop был заблокирован {current['stalled'] * 1000:.0f}мс: {where}")
+                current = None
+
+    # ---------- экспорт ----------
+    def lag_percentiles(self) -> dict:
+        values = sorted(self.lags)
+        return {
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": values[-1] if values else 0.0,
+        }
+
+    def heartbeat_age(self):
+        """Сколько секунд корутина замера не отмечалась (None, пока монитор не запущен) — пульс loop."""
+        if self._task is None:
+            return None
+        return max(0.0, time.perf_counter() - self._heartbeat)
+
+    def snapshot(self) -> dict:
+        age = self.heartbeat_age()
+        return {
+            "heartbeat_age_s": round(age, 3) if age is not None else None,
+            "lag_ms": {k: round(v * 1000, 2) for k, v in self.lag_percentiles().items()},
+            "samples": len(self.lags),
+            "slow_callbacks_total": self.slow_total,
+            "slow_callbacks": [
+                {"at": s["at"], "stalled_ms": round(s["stalled"] * 1000, 1), "stack": s["stack"]}
+                for s in list(self.slow_callbacks)[-10:]
+            ],
+        }
+
+    def summary(self) -> str:
+        p = self.lag_percentiles()
+        return (f"⏲ Задержка loop: p50 {p['p50'] * 1000:.1f}мс, p95 {p['p95'] * 1000:.1f}мс, "
+                f"p99 {p['p99'] * 1000:.1f}мс, max {p['max'] * 1000:.0f}мс; "
+                f"медленных колбэков: {self.slow_total}")
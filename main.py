@@ -1,1217 +1,1780 @@
-# main.py | Auto Fisher Bot + Render Keep-Alive
-import os
-import re
-import time
-import asyncio
-import logging
-import threading
-import io
-from datetime import datetime, timedelta, timezone
-from typing import Optional
-
-# Сторонние библиотеки
-from dotenv import load_dotenv
-from telethon import TelegramClient, events
-from telethon.sessions import StringSession
-from PIL import Image
-import aiohttp
-from flask import Flask
-
-# === ВРЕМЕННОЕ ===
-from event_bot import init_event_bot
-# ===========================
-
-# Google GenAI (новая версия)
-from google import genai
-from google.genai import types
-
-# ----------------- Настройка -----------------
-load_dotenv()
-
-# --- Config for Telethon ---
-SESSION_STRING = os.getenv("SESSION_STRING_SERVER")
-API_ID = int(os.getenv("API_ID") or 0)
-API_HASH = os.getenv("API_HASH") or ""
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-# --- Config for Render Keep-Alive ---
-RENDER_APP_URL = os.getenv("RENDER_APP_URL") # Например: https://my-bot.onrender.com
-
-if not SESSION_STRING:
-    raise RuntimeError("SESSION_STRING_SERVER not found in environment")
-
-if API_ID == 0 or API_HASH == "":
-    print("⚠️ Укажи API_ID и API_HASH в .env.")
-
-# Инициализация Gemini
-genai_client = None
-if not GEMINI_API_KEY:
-    print("⚠️ ВНИМАНИЕ: Не найден GEMINI_API_KEY. Решение капчи работать не будет!")
-else:
-    genai_client = genai.Client(api_key=GEMINI_API_KEY)
-
-# ========== МОДЕЛИ ДЛЯ КАПЧИ ==========
-# https://aistudio.google.com/u/1/usage?project=gen-lang-client-0290532217&timeRange=last-1-day&tab=rate-limit
-CAPTCHA_MODELS = [
-    "gemini-2.5-flash",
-    "gemini-2.5-flash-lite", 
-    "gemini-robotics-er-1.5-preview"
-]
-current_model_index = 0  # Начинаем с первой модели
-successful_model_index = None  # Индекс успешной модели
-
-SUPPORT_CONTACT = "@andranik_amrahyan"  # Контакт поддержки
-
-QALAIS_BOT_ID = 6964500387
-
-CMD_START = {"начать", "начинать", "старт", "start", "запуск", "go"}
-CMD_STOPS = {"закончить", "завершить", "остановить", "стоп", "stop", "конец", "финиш"}
-
-FISH_CMD = "рыбалка"
-
-# Tunables
-FIND_EMOJI_TIMEOUT = 50.0
-BOT_RESPONSE_TIMEOUT = 50.0
-
-# Cooldowns
-COOLDOWN_AFTER_CLICK = 4.5
-MIN_SEND_INTERVAL = 0.8
-
-# Логирование
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-logger = logging.getLogger("auto_fisher")
-# Отключаем лишний шум
-logging.getLogger("telethon").setLevel(logging.WARNING)
-logging.getLogger("werkzeug").setLevel(logging.WARNING) # Логи Flask
-
-# ----------------- Flask Server (Keep-Alive) -----------------
-app_flask = Flask(__name__)
-
-@app_flask.route("/")
-def home():
-    return "Bot is running!", 200
-
-@app_flask.route("/ping")
-def ping():
-    return "pong", 200
-
-def run_web_server():
-    # Render предоставляет порт через переменную окружения PORT
-    port = int(os.environ.get("PORT", 8080))
-    app_flask.run(host="0.0.0.0", port=port)
-
-async def self_ping():
-    """Периодически пингует сам себя, чтобы Render не усыплял сервис."""
-    if not RENDER_APP_URL:
-        logger.warning("⚠️ RENDER_APP_URL не задан! Бот может уснуть.")
-        return
-
-    logger.info(f"🔄 Self-ping запущен для: {RENDER_APP_URL}")
-    async with aiohttp.ClientSession() as session:
-        while True:
-            try:
-                async with session.get(f"{RENDER_APP_URL}/ping") as resp:
-                    if resp.status == 200:
-                        logger.info("Ping OK")
-                    else:
-                        logger.warning(f"Ping failed with status: {resp.status}")
-            except Exception as e:
-                logger.error(f"Ping error: {str(e)}")
-            
-            # Ждем 3 минуты (180 сек)
-            await asyncio.sleep(180)
-
-# ----------------- Telethon client -----------------
-client = TelegramClient(StringSession(SESSION_STRING), API_ID, API_HASH)
-
-_worker_task = None
-_worker_running = False
-_stop_event = asyncio.Event()
-
-bot_msg_queue: asyncio.Queue = asyncio.Queue(maxsize=128)
-
-# ========== ФУНКЦИИ УПРАВЛЕНИЯ МОДЕЛЯМИ КАПЧИ ==========
-async def rotate_captcha_model() -> bool:
-    """Переключает на следующую модель капчи. Возвращает True если есть еще модели, False если все исчерпаны."""
-    global current_model_index, successful_model_index
-    
-    logger.info(f"🔄 Ротация модели капчи. Текущая: {CAPTCHA_MODELS[current_model_index]}")
-    
-    # Сохраняем начальный индекс для проверки полного цикла
-    start_index = current_model_index
-    
-    # Пробуем следующую модель
-    next_index = (current_model_index + 1) % len(CAPTCHA_MODELS)
-    
-    # Если мы вернулись к успешной модели или прошли полный цикл
-    if next_index == start_index:
-        logger.error("❌ Все модели капчи исчерпаны!")
-        return False
-    
-    current_model_index = next_index
-    logger.info(f"✅ Переключено на модель: {CAPTCHA_MODELS[current_model_index]}")
-    return True
-
-async def get_current_captcha_model() -> str:
-    """Возвращает текущую модель капчи."""
-    global current_model_index
-    return CAPTCHA_MODELS[current_model_index]
-
-def set_successful_captcha_model():
-    """Сохраняет текущую модель как успешную."""
-    global successful_model_index, current_model_index
-    successful_model_index = current_model_index
-    logger.info(f"💾 Сохранена успешная модель: {CAPTCHA_MODELS[successful_model_index]}")
-
-# Переменные для отслеживания повторяющихся некритических ошибок
-last_captcha_error_type = None
-captcha_error_count = 0
-
-async def stop_bot_with_captcha_error(error_message: str, is_limit_exhausted: bool = False):
-    """Останавливает бота с сообщением об ошибке капчи."""
-    global _worker_task, _worker_running, _stop_event, _worker_task
-    
-    logger.error(f"🛑 Остановка бота из-за ошибки капчи: {error_message}")
-    
-    if is_limit_exhausted:
-        message_text = (
-            "❌ Достигнут лимит всех моделей для решения капчи!\n\n"
-            "Все доступные модели ИИ исчерпали свои лимиты:\n"
-            f"- {', '.join(CAPTCHA_MODELS)}\n\n"
-            "⛔ Авто-рыбалка остановлена.\n"
-            "Попробуйте снова через некоторое время."
-        )
-    else:
-        message_text = (
-            "❌ Критическая ошибка при решении капчи!\n\n"
-            f"Ошибка: {error_message}\n\n"
-            "⚠️ Пожалуйста, свяжитесь со службой поддержки и сообщите об этой ошибке.\n"
-            f"Поддержка: {SUPPORT_CONTACT}\n\n"
-            "⛔ Авто-рыбалка остановлена."
-        )
-    
-    # Отправляем сообщение об ошибке в чат
-    if error_message:
-        try:
-            await client.send_message(QALAIS_BOT_ID, message_text)
-        except Exception as e:
-            logger.error(f"Не удалось отправить сообщение об ошибке: {e}")
-    
-    # Останавливаем воркер
-    if _worker_running:
-        _stop_event.set()
-        if _worker_task:
-            _worker_task.cancel()
-            try:
-                await _worker_task
-            except asyncio.CancelledError:
-                pass
-            _worker_task = None
-        
-        # Очищаем очередь сообщений
-        while not bot_msg_queue.empty():
-            try:
-                bot_msg_queue.get_nowait()
-            except asyncio.QueueEmpty:
-                break
-        
-        _worker_running = False
-        logger.error("🛑 Бот остановлен из-за ошибки капчи")
-
-# ----------------- Event handlers -----------------
-def _resolve_peer_user_id(msg):
-    try:
-        peer = getattr(msg, "peer_id", None)
-        if peer is None: return None
-        return getattr(peer, "user_id", None)
-    except Exception:
-        return None
-
-def is_private_with_bot(msg):
-    try:
-        peer_user = _resolve_peer_user_id(msg)
-        if peer_user == QALAIS_BOT_ID: return True
-        if getattr(msg, "chat_id", None) == QALAIS_BOT_ID: return True
-        sender_id = getattr(msg, "sender_id", None)
-        if sender_id == QALAIS_BOT_ID: return False
-        if getattr(msg, "from_id", None):
-            fid = getattr(msg.from_id, "user_id", None)
-            if fid == QALAIS_BOT_ID:
-                return _resolve_peer_user_id(msg) == QALAIS_BOT_ID or getattr(msg, "chat_id", None) == QALAIS_BOT_ID
-    except Exception:
-        return False
-    return False
-
-@client.on(events.NewMessage(incoming=True, chats=QALAIS_BOT_ID))
-async def _on_any_new_message(event):
-    try:
-        m = event.message
-        if is_private_with_bot(m):
-            try:
-                bot_msg_queue.put_nowait(m)
-            except asyncio.QueueFull:
-                try:
-                    _ = bot_msg_queue.get_nowait()
-                except asyncio.QueueEmpty:
-                    pass
-                try:
-                    bot_msg_queue.put_nowait(m)
-                except asyncio.QueueFull:
-                    pass
-    except Exception:
-        pass
-
-@client.on(events.MessageEdited(chats=QALAIS_BOT_ID))
-async def _on_any_edited_message(event):
-    try:
-        m = getattr(event, "message", None) or await event.get_message()
-        if not m: return
-        if is_private_with_bot(m):
-            try:
-                bot_msg_queue.put_nowait(m)
-            except asyncio.QueueFull:
-                try:
-                    _ = bot_msg_queue.get_nowait()
-                except asyncio.QueueEmpty:
-                    pass
-                try:
-                    bot_msg_queue.put_nowait(m)
-                except asyncio.QueueFull:
-                    pass
-    except Exception:
-        pass
-
-# ----------------- Utils -----------------
-def msg_text_lower(message) -> str:
-    try:
-        return (message.message or message.raw_text or "").lower()
-    except Exception:
-        return ""
-
-async def click_button_by_flat_index(message, flat_index: int) -> bool:
-    """Улучшенная функция клика с повторными попытками"""
-    MAX_ATTEMPTS = 5
-    for attempt in range(1, MAX_ATTEMPTS + 1):
-        try:
-            mid = getattr(message, "id", None)
-            if mid:
-                try:
-                    fresh = await asyncio.wait_for(
-                        client.get_messages(QALAIS_BOT_ID, ids=mid),
-                        timeout=3.0
-                    )
-                    if fresh: message = fresh
-                except (asyncio.TimeoutError, Exception):
-                    pass
-
-            try:
-                await asyncio.wait_for(
-                    message.click(flat_index),
-                    timeout=5.0
-                )
-                return True
-            except (asyncio.TimeoutError, Exception) as e:
-                pass
-            
-        except Exception:
-            pass
-        
-        if attempt < MAX_ATTEMPTS:
-            await asyncio.sleep(0.3 * attempt)
-    
-    logger.warning(f"❌ Не удалось нажать кнопку {flat_index} после {MAX_ATTEMPTS} попыток")
-    return False
-
-async def find_button_index_with_keyword(message, keyword: str):
-    flat = []
-    for row in getattr(message, "buttons", []):
-        for b in row: flat.append(getattr(b, "text", "") or "")
-    for i, t in enumerate(flat):
-        if keyword.lower() in t.lower():
-            return i, t
-    
-    # Дополнительная проверка с похожими словами
-    similar_keywords = ["рыба", "ловить", "удочка", "закинуть", "начать рыбалку"]
-    for i, t in enumerate(flat):
-        for similar in similar_keywords:
-            if similar in t.lower():
-                return i, t
-    
-    return None, None
-
-async def find_button_has_emoji(message):
-    flat = []
-    for row in getattr(message, "buttons", []):
-        for b in row: flat.append((getattr(b, "text", "") or "").strip())
-
-    button_stats = {}
-    for s in flat:
-        if s: button_stats[s] = button_stats.get(s, 0) + 1
-    
-    most_common = max(button_stats.items(), key=lambda x: x[1])[0] if button_stats else ""
-    
-    for i, s in enumerate(flat):
-        if not s: continue
-        if all(ch in ("\u2800", "⠀") for ch in s): continue
-        if any(ch.isalpha() for ch in s.lower()): continue
-        if s != most_common and len(s) <= 3:
-            return i, s
-    return None, None
-
-# ----------------- Waiters -----------------
-async def _same_message_equiv(a, b) -> bool:
-    if a is None or b is None: return False
-    try:
-        if getattr(a, "id", None) != getattr(b, "id", None): return False
-        ta = (a.message or a.raw_text or "") or ""
-        tb = (b.message or b.raw_text or "") or ""
-        return ta == tb
-    except Exception:
-        return False
-
-async def wait_for_bot_message(after_dt: datetime = None, timeout=BOT_RESPONSE_TIMEOUT, prev_msg=None):
-    if after_dt is None: after_dt = datetime.now(timezone.utc) - timedelta(seconds=10)
-    deadline = time.time() + timeout
-    
-    try:
-        recent = await asyncio.wait_for(
-            client.get_messages(QALAIS_BOT_ID, limit=10),
-            timeout=5.0
-        )
-    except (asyncio.TimeoutError, Exception): 
-        recent = []
-    
-    if recent:
-        for m in recent:
-            if getattr(m, "date", None) and m.date > after_dt:
-                if prev_msg is not None and await _same_message_equiv(m, prev_msg): 
-                    continue
-                return m
-
-    while time.time() < deadline and not _stop_event.is_set():
-        remaining = deadline - time.time()
-        try:
-            msg = await asyncio.wait_for(
-                bot_msg_queue.get(),
-                timeout=min(remaining, 2.0)
-            )
-        except asyncio.TimeoutError: 
-            continue
-        except Exception: 
-            continue
-        
-        if not msg: 
-            continue
-        
-        mdate = getattr(msg, "date", None)
-        if prev_msg is not None and getattr(msg, "id", None) == getattr(prev_msg, "id", None):
-            if not await _same_message_equiv(msg, prev_msg): 
-                return msg
-            else: 
-                continue
-
-        if mdate and mdate > after_dt: 
-            return msg
-        if getattr(msg, "buttons", None): 
-            return msg
-
-    return None
-
-async def poll_for_button_emoji(timeout=FIND_EMOJI_TIMEOUT):
-    try:
-        recent = await asyncio.wait_for(
-            client.get_messages(QALAIS_BOT_ID, limit=12),
-            timeout=5.0
-        )
-    except (asyncio.TimeoutError, Exception): 
-        recent = []
-
-    if recent:
-        for m in recent:
-            if m and getattr(m, "buttons", None):
-                idx, txt = await find_button_has_emoji(m)
-                if idx is not None: 
-                    return m, idx, txt
-
-    deadline = time.time() + timeout
-    while time.time() < deadline and not _stop_event.is_set():
-        remaining = deadline - time.time()
-        try:
-            msg = await asyncio.wait_for(
-                bot_msg_queue.get(),
-                timeout=min(remaining, 2.0)
-            )
-        except asyncio.TimeoutError: 
-            continue
-        except Exception: 
-            continue
-        
-        if msg and getattr(msg, "buttons", None):
-            idx, txt = await find_button_has_emoji(msg)
-            if idx is not None: 
-                return msg, idx, txt
-    
-    return None, None, None
-
-# ========== ФУНКЦИИ ДЛЯ ОБРАБОТКИ ЦИКЛА РЫБАЛКИ ==========
-async def wait_for_fish_result(fish_msg_id, timeout=25.0):
-    """
-    Ожидает результат рыбалки, отслеживая редактирование сообщения с ID fish_msg_id
-    или появление нового сообщения с результатом
-    """
-    deadline = time.time() + timeout
-    
-    while time.time() < deadline and not _stop_event.is_set():
-        # Сначала проверяем, не изменилось ли исходное сообщение
-        try:
-            fresh_msg = await asyncio.wait_for(
-                client.get_messages(QALAIS_BOT_ID, ids=fish_msg_id),
-                timeout=3.0
-            )
-            if fresh_msg and fresh_msg.id == fish_msg_id:
-                txt = msg_text_lower(fresh_msg)
-                if contains_any(txt, CATCH_SUCCESS_KEYWORDS):
-                    return fresh_msg
-        except (asyncio.TimeoutError, Exception):
-            pass
-        
-        # Затем проверяем новые сообщения
-        try:
-            recent = await asyncio.wait_for(
-                client.get_messages(QALAIS_BOT_ID, limit=6),
-                timeout=3.0
-            )
-            for msg in recent:
-                txt = msg_text_lower(msg)
-                if contains_any(txt, CATCH_SUCCESS_KEYWORDS):
-                    return msg
-        except (asyncio.TimeoutError, Exception):
-            pass
-        
-        # Проверяем очередь сообщений
-        try:
-            msg = await asyncio.wait_for(
-                bot_msg_queue.get(),
-                timeout=2.0
-            )
-            if msg:
-                txt = msg_text_lower(msg)
-                if contains_any(txt, CATCH_SUCCESS_KEYWORDS):
-                    return msg
-        except asyncio.TimeoutError:
-            continue
-        except Exception:
-            continue
-        
-        await asyncio.sleep(1.0)
-    
-    return None
-
-async def click_fish_button_after_result(result_msg, fish_msg_id=None):
-    """
-    Пытается нажать кнопку "рыбачить" после результата рыбалки
-    с отслеживанием возможного редактирования сообщения
-    """
-    max_attempts = 3
-    for attempt in range(max_attempts):
-        try:
-            # Получаем свежую версию сообщения
-            if result_msg and hasattr(result_msg, 'id'):
-                fresh_msg = await asyncio.wait_for(
-                    client.get_messages(QALAIS_BOT_ID, ids=result_msg.id),
-                    timeout=3.0
-                )
-                if fresh_msg:
-                    result_msg = fresh_msg
-            
-            # Ищем кнопку "рыбачить"
-            idx, btn_text = await find_button_index_with_keyword(result_msg, "рыбач")
-            if idx is not None:
-                success = await click_button_by_flat_index(result_msg, idx)
-                if success:
-                    return True
-                else:
-                    logger.warning(f"❌ Попытка {attempt+1}: не удалось нажать кнопку")
-            else:
-                logger.warning(f"❌ Попытка {attempt+1}: кнопка 'рыбачить' не найдена")
-                
-                # Проверяем, не изменилось ли сообщение
-                if attempt < max_attempts - 1:
-                    await asyncio.sleep(1.0)
-                    
-        except (asyncio.TimeoutError, Exception) as e:
-            logger.warning(f"❌ Ошибка при попытке {attempt+1}: {e}")
-            if attempt < max_attempts - 1:
-                await asyncio.sleep(1.0)
-    
-    return False
-
-# ========== УЛУЧШЕННОЕ РЕШЕНИЕ КАПЧИ С РОТАЦИЕЙ МОДЕЛЕЙ ==========
-async def solve_captcha_message(message) -> Optional[bool]:
-    """
-    Решает капчу с ротацией моделей.
-    Возвращает:
-    - True: капча решена успешно
-    - False: капча не решена (но не критическая ошибка)
-    - None: критическая ошибка, бот должен остановиться
-    """
-    global last_captcha_error_type, captcha_error_count, current_model_index, successful_model_index
-    
-    if not genai_client:
-        logger.error("CAPTCHA: Клиент Gemini не инициализирован.")
-        await stop_bot_with_captcha_error("Клиент Gemini не инициализирован")
-        return None
-
-    flat_buttons = []
-    for row in getattr(message, "buttons", []):
-        for b in row:
-            txt = getattr(b, "text", None)
-            flat_buttons.append(txt.strip() if txt else "")
-
-    unique_options = [b for b in flat_buttons if b and not b.isspace()]
-    
-    if not unique_options:
-        logger.error("CAPTCHA: Кнопки не найдены.")
-        return False
-    
-    logger.info(f"Кнопки капчи: {unique_options}")
-
-    # Загружаем изображение капчи в память
-    image_data = None
-    try:
-        # Скачиваем в bytes
-        raw_img = await asyncio.wait_for(
-            message.download_media(file=bytes),
-            timeout=15.0
-        )
-        
-        # === ОБРАБОТКА ИЗОБРАЖЕНИЯ (CROP) ===
-        # Используем PIL для обрезки правой части (текст "ПРОВЕРКА НА РОБОТА...")
-        try:
-            with Image.open(io.BytesIO(raw_img)) as img:
-                width, height = img.size
-                # Отрезаем ~35% справа, оставляем левые 65%
-                # Текст находится справа, а нужный объект слева/по центру
-                crop_width = int(width * 0.65)
-                
-                # Обрезаем: (left, top, right, bottom)
-                cropped_img = img.crop((0, 0, crop_width, height))
-                
-                # Сохраняем обработанное изображение в буфер
-                output_buffer = io.BytesIO()
-                # Конвертируем в RGB если нужно (для PNG с прозрачностью иногда полезно, но для фото JPEG ок)
-                if img.mode in ("RGBA", "P"):
-                    cropped_img = cropped_img.convert("RGB")
-                    
-                cropped_img.save(output_buffer, format="JPEG")
-                image_data = output_buffer.getvalue()
-                # logger.info("✂️ Изображение капчи обрезано (удален текст справа)")
-        except Exception as pil_err:
-            logger.warning(f"⚠️ Ошибка обработки изображения PIL, используем оригинал: {pil_err}")
-            image_data = raw_img
-
-    except Exception as e:
-        logger.warning(f"CAPTCHA: Ошибка загрузки изображения: {e}")
-        # Проверяем, была ли такая же ошибка в прошлый раз
-        if last_captcha_error_type == "image_load_error":
-            captcha_error_count += 1
-            if captcha_error_count >= 2:
-                logger.error("CAPTCHA: Повторная ошибка загрузки изображения капчи!")
-                error_message = (
-                    "❌ Критическая ошибка при решении капчи!\n\n"
-                    "Не удалось загрузить изображение капчи дважды подряд.\n\n"
-                    "⚠️ Пожалуйста, свяжитесь со службой поддержки и сообщите об этой ошибке.\n"
-                    f"Поддержка: {SUPPORT_CONTACT}\n\n"
-                    "⛔ Авто-рыбалка остановлена."
-                )
-                try:
-                    await client.send_message(QALAIS_BOT_ID, error_message)
-                except Exception as send_err:
-                    logger.error(f"Не удалось отправить сообщение об ошибке: {send_err}")
-                
-                # Останавливаем бота
-                await stop_bot_with_captcha_error("Повторная ошибка загрузки изображения капчи")
-                return None
-        else:
-            last_captcha_error_type = "image_load_error"
-            captcha_error_count = 1
-        return False
-    
-    # === УЛУЧШЕННЫЙ ПРОМПТ ===
-    prompt = (
-        f"This is a captcha check. The image contains one MAIN object which is significantly LARGER than the others. "
-        f"There are also small decoy icons and chaotic lines - IGNORE them. "
-        f"Look strictly for the single BIGGEST visual element in the image. "
-        f"Compare this biggest object with the following emoji options: {', '.join(unique_options)}. "
-        f"Reply with ONLY the single emoji character from the list that matches the biggest object. "
-        f"Do not write explanations."
-    )
-    
-    # Сохраняем начальный индекс для проверки полного цикла
-    start_model_index = current_model_index
-    models_tried = 0
-    
-    # Пробуем решить капчу с ротацией моделей
-    while models_tried < len(CAPTCHA_MODELS):
-        current_model = await get_current_captcha_model()
-        logger.info(f"🔍 CAPTCHA: Используем модель {current_model} (попытка {models_tried + 1}/{len(CAPTCHA_MODELS)})")
-        
-        try:
-            response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    genai_client.models.generate_content,
-                    model=current_model,
-                    contents=[
-                        types.Part.from_bytes(data=image_data, mime_type="image/jpeg"),
-                        prompt
-                    ]
-                ),
-                timeout=60.0
-            )
-            
-            raw_answer = response.text.strip()
-            logger.info(f"✅ CAPTCHA: Ответ API: '{raw_answer}'")
-            
-            # === УМНЫЙ ПАРСИНГ ОТВЕТА ===
-            # ИИ может вернуть "The answer is ⚔", поэтому ищем эмодзи внутри текста
-            predicted_emoji = None
-            
-            # 1. Точное совпадение
-            if raw_answer in unique_options:
-                predicted_emoji = raw_answer
-            
-            # 2. Поиск эмодзи внутри текста
-            if not predicted_emoji:
-                # Собираем все варианты из unique_options, которые ИИ упомянул в своем ответе
-                found_options = [opt for opt in unique_options if opt in raw_answer]
-            
-                if len(found_options) == 1:
-                    # Если найден ровно один вариант — это наш выбор
-                    predicted_emoji = found_options[0]
-                elif len(found_options) > 1:
-                    # Если ИИ упомянул больше одного варианта из доступных кнопок
-                    logger.error(f"❌ CAPTCHA: ИИ выдал неоднозначный ответ (найдено несколько эмодзи из возможных вариантов: {found_options})")
-                    
-                    await stop_bot_with_captcha_error("Ошибка интерпретации: В ответе ИИ найдено несколько эмодзи из возможных вариантов")
-                    return None
-                # Если len(found_options) == 0, predicted_emoji останется None, и сработает логика ниже
-            
-            best_idx = -1
-            if predicted_emoji:
-                for i, btn_txt in enumerate(flat_buttons):
-                    if predicted_emoji == btn_txt: # Ищем точное совпадение кнопки
-                        best_idx = i
-                        break
-            
-            if best_idx != -1:
-                logger.info(f"🎯 CAPTCHA: Нажимаем кнопку {best_idx} ({predicted_emoji})")
-                try:
-                    await asyncio.wait_for(
-                        message.click(best_idx),
-                        timeout=10.0
-                    )
-                    logger.info(f"✅ Капча решена успешно с моделью {current_model}")
-                    
-                    # Сбрасываем счетчик ошибок при успешном решении
-                    last_captcha_error_type = None
-                    captcha_error_count = 0
-                    
-                    # Сохраняем успешную модель для будущего использования
-                    set_successful_captcha_model()
-                    
-                    # Если использовали не первую модель, возвращаемся к ней для следующих капч
-                    if successful_model_index is not None and successful_model_index != 0:
-                        current_model_index = successful_model_index
-                        logger.info(f"🔄 Возвращаемся к успешной модели: {CAPTCHA_MODELS[current_model_index]}")
-                    
-                    return True
-                except (asyncio.TimeoutError, Exception) as e:
-                    logger.warning(f"❌ Не удалось нажать кнопку капчи: {e}")
-                    
-                    # Проверяем, была ли такая же ошибка в прошлый раз
-                    if last_captcha_error_type == "button_click_error":
-                        captcha_error_count += 1
-                        if captcha_error_count >= 2:
-                            logger.error("CAPTCHA: Повторная ошибка нажатия кнопки капчи!")
-                            error_message = (
-                                "❌ Критическая ошибка при решении капчи!\n\n"
-                                "Не удалось нажать кнопку капчи дважды подряд.\n\n"
-                                "⚠️ Пожалуйста, свяжитесь со службой поддержки и сообщите об этой ошибке.\n"
-                                f"Поддержка: {SUPPORT_CONTACT}\n\n"
-                                "⛔ Авто-рыбалка остановлена."
-                            )
-                            try:
-                                await client.send_message(QALAIS_BOT_ID, error_message)
-                            except Exception as send_err:
-                                logger.error(f"Не удалось отправить сообщение об ошибке: {send_err}")
-                            
-                            # Останавливаем бота
-                            await stop_bot_with_captcha_error("Повторная ошибка нажатия кнопки капчи")
-                            return None
-                    else:
-                        last_captcha_error_type = "button_click_error"
-                        captcha_error_count = 1
-                    return False
-            else:
-                logger.error(f"❌ CAPTCHA: Соответствующая кнопка не найдена в ответе API")
-                
-                # Отправляем сообщение пользователю о необходимости решить капчу вручную
-                error_message = (
-                    "❌ Не удалось решить капчу автоматически (Соответствующая кнопка не найдена в ответе API).\n\n"
-                    "Пожалуйста, решите капчу вручную и снова запустите авто рыбалку.\n"
-                    "Если это случается часто, свяжитесь со службой поддержки.\n"
-                    f"Поддержка: {SUPPORT_CONTACT}\n\n"
-                    "⛔ Авто-рыбалка остановлена."
-                )
-                try:
-                    await client.send_message(QALAIS_BOT_ID, error_message)
-                except Exception as send_err:
-                    logger.error(f"Не удалось отправить сообщение об ошибке: {send_err}")
-                
-                # Останавливаем бота
-                await stop_bot_with_captcha_error("")
-                return None
-                
-        except asyncio.TimeoutError:
-            logger.error(f"❌ CAPTCHA: Тайм-аут ожидания ответа от {current_model}")
-            await stop_bot_with_captcha_error(
-                f"Тайм-аут ожидания ответа от {current_model}",
-                is_limit_exhausted=False
-            )
-            return None
-        except Exception as e:
-            error_str = str(e)
-            logger.warning(f"⚠️ CAPTCHA: Ошибка с моделью {current_model}: {error_str}")
-            
-            # Проверяем тип ошибки
-            is_404_error = '404' in error_str and 'NOT_FOUND' in error_str.upper()
-            is_resource_exhausted = 'RESOURCE_EXHAUSTED' in error_str.upper()
-            
-            if is_404_error or is_resource_exhausted:
-                logger.warning(f"⚠️ CAPTCHA: Модель {current_model} недоступна или лимит исчерпан")
-                
-                # Пробуем следующую модель
-                has_more_models = await rotate_captcha_model()
-                models_tried += 1
-                
-                # Если прошли полный цикл и вернулись к началу
-                if not has_more_models or (current_model_index == start_model_index and models_tried >= len(CAPTCHA_MODELS)):
-                    await stop_bot_with_captcha_error(
-                        f"Все модели исчерпаны. Последняя ошибка: {error_str}",
-                        is_limit_exhausted=True
-                    )
-                    return None
-                
-                # Продолжаем с следующей моделью
-                continue
-            else:
-                # Другие ошибки - критическая ситуация
-                logger.error(f"❌ CAPTCHA: Критическая ошибка с моделью {current_model}: {error_str}")
-                await stop_bot_with_captcha_error(
-                    f"Критическая ошибка с моделью {current_model}: {error_str}",
-                    is_limit_exhausted=False
-                )
-                return None
-    
-    # Если дошли сюда, значит все модели были перепробованы без успеха
-    await stop_bot_with_captcha_error(
-        "Все модели перепробованы, но ни одна не сработала",
-        is_limit_exhausted=True
-    )
-    return None
-
-# ----------------- keywords -----------------
-MENU_KEYWORDS = ["меню рыбалки", "уровень рыбака", "поймано рыбы", "уникальные виды"]
-FISH_WAIT_KEYWORDS = ["вы закинули удочку в воду",
-                      "дождитесь момента, когда рыба зацепится за крючок и подсекайте ее",
-                      "у вас будет пару секунд, чтобы подсечь рыбу"]
-CATCH_SUCCESS_KEYWORDS = ["вы поймали рыбу", "вы поймали предмет", "поздравляем с удачной рыбалкой",
-                          "леска не выдержала и оборвалась", "сорвалась с крючка",
-                          "подсечь рыбу"]
-CAPTCHA_KEYWORDS = ["нам нужно убедиться, что вы не робот",
-                    "нажмите на кнопку с эмодзи, который отображен",
-                    "нажмите на кнопку ниже, чтобы продолжить"]
-
-def contains_any(text: str, keywords):
-    if not text: return False
-    text_lower = text.lower()
-    for k in keywords:
-        if k in text_lower: return True
-    return False
-
-# ========== ОПТИМИЗИРОВАННЫЙ ОСНОВНОЙ ВОРКЕР ==========
-async def fisher_worker():
-    logger.info("🚀 Fisher worker started")
-    fishing_in_progress = False
-    last_click_time = None
-    last_send_time = None
-    consecutive_fails = 0
-    last_captcha_time = None
-
-    try:
-        while not _stop_event.is_set():
-            now = datetime.now(timezone.utc)
-            
-            # Если слишком много неудач подряд - делаем паузу
-            if consecutive_fails >= 3:
-                logger.warning(f"⚠️ {consecutive_fails} неудач подряд, пауза 10 секунд")
-                await asyncio.sleep(10)
-                consecutive_fails = 0
-                continue
-            
-            # Проверяем кулдаун
-            if last_click_time and (now - last_click_time).total_seconds() < COOLDOWN_AFTER_CLICK:
-                try:
-                    menu_msg = await asyncio.wait_for(
-                        wait_for_bot_message(timeout=3.0),
-                        timeout=3.5
-                    )
-                except (asyncio.TimeoutError, Exception):
-                    menu_msg = None
-            else:
-                if last_send_time and (now - last_send_time).total_seconds() < MIN_SEND_INTERVAL:
-                    await asyncio.sleep(0.3)
-                    continue
-                    
-                try:
-                    await asyncio.wait_for(
-                        client.send_message(QALAIS_BOT_ID, FISH_CMD),
-                        timeout=5.0
-                    )
-                    last_send_time = datetime.now(timezone.utc)
-                    fishing_in_progress = True
-                    last_click_time = datetime.now(timezone.utc)
-                    consecutive_fails = 0
-                except Exception as e:
-                    logger.warning(f"send_message failed: {e}")
-                    consecutive_fails += 1
-                    await asyncio.sleep(2)
-                    continue
-
-                await asyncio.sleep(2.0)
-                
-                try:
-                    menu_msg = await asyncio.wait_for(
-                        wait_for_bot_message(timeout=10.0),
-                        timeout=10.5
-                    )
-                except (asyncio.TimeoutError, Exception):
-                    menu_msg = None
-
-            if menu_msg is None:
-                consecutive_fails += 1
-                await asyncio.sleep(1)
-                continue
-
-            txt = msg_text_lower(menu_msg)
-
-            # ========== ОПТИМИЗИРОВАННАЯ ЛОГИКА ОБРАБОТКИ ==========
-            
-            # 1. Капча (самый высокий приоритет)
-            if contains_any(txt, CAPTCHA_KEYWORDS):
-                logger.info("🔐 Обнаружена капча")
-                
-                last_captcha_time = datetime.now(timezone.utc)
-                
-                while not bot_msg_queue.empty():
-                    try:
-                        bot_msg_queue.get_nowait()
-                    except asyncio.QueueEmpty:
-                        break
-                
-                result = await solve_captcha_message(menu_msg)
-                
-                if result is None:
-                    # Критическая ошибка, бот уже остановлен
-                    return
-                elif result:
-                    consecutive_fails = 0
-                    await asyncio.sleep(3.0)
-                    
-                    while not bot_msg_queue.empty():
-                        try:
-                            bot_msg_queue.get_nowait()
-                        except asyncio.QueueEmpty:
-                            break
-                    
-                    fishing_in_progress = False
-                    last_click_time = None
-                    
-                    logger.info("✅ Капча решена, начинаем новую рыбалку")
-                else:
-                    consecutive_fails += 1
-                    logger.warning("❌ Не удалось решить капчу (не критическая ошибка)")
-                
-                await asyncio.sleep(1)
-                continue
-            
-            # 2. Меню рыбалки (нужно нажать "рыбачить")
-            if contains_any(txt, MENU_KEYWORDS):
-                idx, btn_text = await find_button_index_with_keyword(menu_msg, "рыбач")
-                
-                if idx is None:
-                    for row in getattr(menu_msg, "buttons", []):
-                        for i, b in enumerate(row):
-                            txt_btn = getattr(b, "text", "") or ""
-                            if txt_btn and not txt_btn.isspace():
-                                idx = i
-                                break
-                        if idx is not None:
-                            break
-                
-                if idx is not None:
-                    success = await click_button_by_flat_index(menu_msg, idx)
-                    if success:
-                        fishing_in_progress = True
-                        last_click_time = datetime.now(timezone.utc)
-                        consecutive_fails = 0
-                        
-                        await asyncio.sleep(2.0)
-                        fish_wait_msg = await wait_for_bot_message(timeout=8.0)
-                        if fish_wait_msg:
-                            txt_fish = msg_text_lower(fish_wait_msg)
-                            if contains_any(txt_fish, FISH_WAIT_KEYWORDS):
-                                found_msg, found_idx, found_text = await poll_for_button_emoji(timeout=30.0)
-                                if found_msg:
-                                    fish_msg_id = found_msg.id
-                                    
-                                    success_fish = await click_button_by_flat_index(found_msg, found_idx)
-                                    if success_fish:
-                                        last_click_time = datetime.now(timezone.utc)
-                                        
-                                        await asyncio.sleep(2.0)
-                                        
-                                        result_msg = await wait_for_fish_result(fish_msg_id, timeout=20.0)
-                                        
-                                        if result_msg:                                            
-                                            fish_button_success = await click_fish_button_after_result(result_msg, fish_msg_id)
-                                            
-                                            if fish_button_success:
-                                                fishing_in_progress = True
-                                                last_click_time = datetime.now(timezone.utc)
-                                                consecutive_fails = 0
-                                                
-                                                await asyncio.sleep(1.5)
-                                                continue
-                                            else:
-                                                logger.warning("❌ Не удалось нажать 'рыбачить' после результата")
-                                                fishing_in_progress = False
-                                                consecutive_fails += 1
-                                        else:
-                                            logger.warning("❌ Результат рыбалки не получен")
-                                            consecutive_fails += 1
-                                    else:
-                                        logger.warning("❌ Не удалось нажать кнопку с рыбой")
-                                        consecutive_fails += 1
-                                else:
-                                    logger.warning("❌ Кнопка с рыбой не найдена")
-                                    consecutive_fails += 1
-                            else:
-                                if contains_any(txt_fish, CAPTCHA_KEYWORDS):
-                                    result = await solve_captcha_message(fish_wait_msg)
-                                    if result is None:
-                                        return
-                                consecutive_fails += 1
-                        else:
-                            consecutive_fails += 1
-                    else:
-                        consecutive_fails += 1
-                else:
-                    consecutive_fails += 1
-                
-                await asyncio.sleep(0.5)
-                continue
-            
-            # 3. Ожидание поклевки (сообщение с FISH_WAIT_KEYWORDS)
-            if contains_any(txt, FISH_WAIT_KEYWORDS):                
-                idx, btn_text = await find_button_has_emoji(menu_msg)
-                if idx is not None:
-                    found_msg, found_idx, found_text = menu_msg, idx, btn_text
-                else:
-                    found_msg, found_idx, found_text = await poll_for_button_emoji(timeout=30.0)
-                
-                if found_msg and found_idx is not None:
-                    fish_msg_id = found_msg.id
-                    
-                    success_fish = await click_button_by_flat_index(found_msg, found_idx)
-                    if success_fish:
-                        last_click_time = datetime.now(timezone.utc)
-                        
-                        await asyncio.sleep(2.0)
-                        
-                        result_msg = await wait_for_fish_result(fish_msg_id, timeout=20.0)
-                        
-                        if result_msg:                            
-                            fish_button_success = await click_fish_button_after_result(result_msg, fish_msg_id)
-                            
-                            if fish_button_success:
-                                fishing_in_progress = True
-                                last_click_time = datetime.now(timezone.utc)
-                                consecutive_fails = 0
-                                
-                                await asyncio.sleep(1.5)
-                                continue
-                            else:
-                                logger.warning("❌ Не удалось нажать 'рыбачить' после результата")
-                                fishing_in_progress = False
-                                consecutive_fails += 1
-                        else:
-                            logger.warning("❌ Результат рыбалки не получен")
-                            consecutive_fails += 1
-                    else:
-                        logger.warning("❌ Не удалось нажать кнопку с рыбой")
-                        consecutive_fails += 1
-                else:
-                    logger.warning("❌ Кнопка с рыбой не найдена")
-                    consecutive_fails += 1
-                
-                await asyncio.sleep(0.5)
-                continue
-            
-            # 4. Результат рыбалки (если мы пропустили предыдущие шаги)
-            if contains_any(txt, CATCH_SUCCESS_KEYWORDS):                
-                fish_button_success = await click_fish_button_after_result(menu_msg)
-                
-                if fish_button_success:
-                    fishing_in_progress = True
-                    last_click_time = datetime.now(timezone.utc)
-                    consecutive_fails = 0
-                    await asyncio.sleep(1.5)
-                    continue
-                else:
-                    logger.warning("❌ Не удалось нажать 'рыбачить' после результата")
-                    fishing_in_progress = False
-                    consecutive_fails += 1
-                
-                await asyncio.sleep(0.5)
-                continue
-            
-            # 5. Неопознанное состояние
-            consecutive_fails += 1
-            logger.warning(f"❓ Неизвестное состояние: {txt[:50]}...")
-            await asyncio.sleep(1)
-
-    except asyncio.CancelledError:
-        raise
-    except Exception as e:
-        logger.exception(f"❌ Critical error in fisher_worker: {e}")
-    finally:
-        logger.info("🛑 Fisher worker stopped")
-
-# ----------------- Commands -----------------
-CMD_START_PATTERN = r'(?i)^(' + '|'.join(re.escape(cmd) for cmd in CMD_START) + r')$'
-
-@client.on(events.NewMessage(outgoing=True, chats=QALAIS_BOT_ID, pattern=CMD_START_PATTERN))
-async def cmd_start(event):
-    global _worker_task, _worker_running, _stop_event, bot_msg_queue
-    global last_captcha_error_type, captcha_error_count
-    
-    if _worker_running:
-        await event.reply("Бот уже запущен.")
-        return
-    
-    # Сбрасываем счетчики ошибок капчи при запуске
-    last_captcha_error_type = None
-    captcha_error_count = 0
-    
-    # Очищаем очередь сообщений перед запуском
-    while not bot_msg_queue.empty():
-        try:
-            bot_msg_queue.get_nowait()
-        except asyncio.QueueEmpty:
-            break
-    
-    _stop_event.clear()
-    _worker_running = True
-    _worker_task = asyncio.create_task(fisher_worker())
-    logger.info("✅ Авто-рыбалка запущена по команде")
-    await event.reply("✅ Авто-рыбалка запущена.")
-
-@client.on(events.NewMessage(outgoing=True, chats=QALAIS_BOT_ID))
-async def cmd_stop_listener(event):
-    global _worker_task, _worker_running, _stop_event, bot_msg_queue
-    txt = (event.raw_text or "").strip().lower()
-    if txt in CMD_STOPS:
-        if not _worker_running:
-            await event.reply("Бот не запущен.")
-            return
-        
-        logger.info("🛑 Получена команда остановки")
-        _stop_event.set()
-        
-        if _worker_task:
-            try:
-                await asyncio.wait_for(_worker_task, timeout=5.0)
-            except (asyncio.CancelledError, asyncio.TimeoutError):
-                _worker_task.cancel()
-                try:
-                    await _worker_task
-                except asyncio.CancelledError:
-                    pass
-        
-        while not bot_msg_queue.empty():
-            try:
-                bot_msg_queue.get_nowait()
-            except asyncio.QueueEmpty:
-                break
-        
-        _worker_running = False
-        _worker_task = None
-        await event.reply("⛔ Авто-рыбалка остановлена.")
-
-async def main():
-    logger.info("Connecting to Telegram...")
-    
-    # Логируем информацию о моделях капчи
-    logger.info(f"🤖 Доступные модели капчи: {', '.join(CAPTCHA_MODELS)}")
-    logger.info(f"🔧 Начинаем с модели: {CAPTCHA_MODELS[current_model_index]}")
-    
-    for attempt in range(1, 6):
-        try:
-            await client.start()
-            logger.info("✅ Подключение к Telegram успешно")
-            break
-        except Exception as e:
-            logger.warning(f"⚠️ Попытка {attempt}/5 подключения не удалась: {e}")
-            if attempt < 5:
-                await asyncio.sleep(5 * attempt)
-            else:
-                logger.error("❌ Не удалось подключиться к Telegram после 5 попыток")
-                return
-    
-    # === ВРЕМЕННОЕ ===
-    try:
-        init_event_bot(client)
-    except Exception as e:
-        logger.error(f"❌ Не удалось загрузить Event Bot: {e}")
-    # ==========================
-    
-    if RENDER_APP_URL:
-        asyncio.create_task(self_ping())
-        logger.info("🔄 Самопинг запущен")
-    else:
-        logger.warning("⚠️ RENDER_APP_URL не задан, самопингование отключено.")
-
-    logger.info("🤖 Бот запущен. Отправьте 'начать' в личном чате с игровым ботом.")
-    
-    while not bot_msg_queue.empty():
-        try:
-            bot_msg_queue.get_nowait()
-        except asyncio.QueueEmpty:
-            break
-    
-    await client.run_until_disconnected()
-
-if __name__ == "__main__":
-    web_thread = threading.Thread(target=run_web_server, daemon=True)
-    web_thread.start()
-    logger.info("🌐 Веб-сервер запущен")
-    
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        logger.info("👋 Завершение работы по запросу пользователя")
-    except Exception as e:
-        logger.error(f"💥 Критическая ошибка: {e}")
-    finally:
-        logger.info("👋 Бот остановлен")
+# main.py | Auto Fisher Bot + Render Keep-Alive
+import time
+STARTUP_T0 = time.perf_counter()  # отсчет для отчета о времени запуска
+
+import os
+import re
+import asyncio
+import logging
+import threading
+import io
+import contextvars
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+# Сторонние библиотеки
+# (тяжелые google.genai, PIL, flask и aiohttp импортируются лениво — при первом использовании)
+from dotenv import load_dotenv
+from telethon import TelegramClient, events
+from telethon.sessions import StringSession
+from telethon.errors import FloodWaitError
+
+# === ВРЕМЕННОЕ ===
+from event_bot import init_event_bot, close_event_bot, event_bot_stats
+# ===========================
+
+from captcha_quota import QuotaLedger
+from rate_limiter import RateLimiter
+from buttons import emoji_button_index
+from adaptive_cooldown import CooldownLearner, parse_wait_reply
+from catch_log import CatchLogWriter, parse_catch_result
+from tracing import Tracer
+import profiler
+from loop_monitor import LoopMonitor
+from reconnect import ConnectionWatch
+from worker_state import WorkerCheckpoint
+from accounts import load_accounts
+from captcha_solver import (
+    ask_model, needs_second_opinion, get_consensus, crop_captcha_image, CaptchaAnswer
+)
+from captcha_service import request_solve
+
+# ----------------- Настройка -----------------
+load_dotenv()
+
+# --- Config for Telethon ---
+# Несколько аккаунтов — в ACCOUNTS_FILE; без него один аккаунт из SESSION_STRING_SERVER
+ACCOUNTS_FILE = os.getenv("ACCOUNTS_FILE", "accounts.json")
+SESSION_STRING = os.getenv("SESSION_STRING_SERVER")
+API_ID = int(os.getenv("API_ID") or 0)
+API_HASH = os.getenv("API_HASH") or ""
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# --- Config for Render Keep-Alive ---
+RENDER_APP_URL = os.getenv("RENDER_APP_URL") # Например: https://my-bot.onrender.com
+
+# --- Шарды: SHARDS=N (или auto — по числу ядер) запускает супервизор и N процессов с аккаунтами ---
+_shards_env = os.getenv("SHARDS", "1").strip().lower()
+SHARDS = (os.cpu_count() or 1) if _shards_env == "auto" else max(1, int(_shards_env or 1))
+SHARD_ACCOUNTS = os.getenv("SHARD_ACCOUNTS")  # задает супервизор: аккаунты этого шарда через запятую
+SHARD_BASE_PORT = int(os.getenv("SHARD_BASE_PORT", "9100"))
+SUPERVISOR_MODE = SHARDS > 1 and SHARD_ACCOUNTS is None
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+
+# --- Event loop: USE_UVLOOP=1 включает uvloop, если он установлен ---
+USE_UVLOOP = os.getenv("USE_UVLOOP", "0") == "1"
+
+# --- Папка для файлов состояния (журнал квот и т.п.) ---
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
+if API_ID == 0 or API_HASH == "":
+    print("⚠️ Укажи API_ID и API_HASH в .env.")
+
+# Клиент Gemini создается лениво (get_genai_client) — импорт google.genai занимает секунды
+genai_client = None
+if not GEMINI_API_KEY:
+    print("⚠️ ВНИМАНИЕ: Не найден GEMINI_API_KEY. Решение капчи работать не будет!")
+
+# Прогрев (импорт google.genai и PIL) в фоне сразу после подключения к Telegram
+CAPTCHA_WARMUP = os.getenv("CAPTCHA_WARMUP", "1") != "0"
+# Общий сервис капчи (captcha_service.py) для всех аккаунтов и шардов; пусто — решаем сами
+CAPTCHA_SERVICE_URL = os.getenv("CAPTCHA_SERVICE_URL", "").strip()
+# Шарды — отдельные процессы с общим DATA_DIR: журнал квот моделей должен вести один
+# процесс (сервис капчи), иначе шарды затирают счетчики друг друга в captcha_quota.json
+if SHARDS > 1 and not CAPTCHA_SERVICE_URL:
+    raise RuntimeError("SHARDS>1 требует CAPTCHA_SERVICE_URL: квоты моделей ведет один сервис капчи (captcha_service.py)")
+_genai_lock = threading.Lock()
+
+def get_genai_client():
+    """Возвращает клиент Gemini, при первом вызове импортирует SDK и создает клиент."""
+    global genai_client
+    if genai_client is None and GEMINI_API_KEY:
+        with _genai_lock:
+            if genai_client is None:
+                from google import genai  # Google GenAI (новая версия)
+                genai_client = genai.Client(api_key=GEMINI_API_KEY)
+    return genai_client
+
+async def warm_up_captcha():
+    """Фоновый прогрев решателя капчи, чтобы первая капча не ждала импортов."""
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(get_genai_client)
+        await asyncio.to_thread(__import__, "PIL.Image")
+        logger.info(f"🔥 Решатель капчи прогрет за {time.perf_counter() - started:.2f}с")
+    except Exception as e:
+        logger.warning(f"⚠️ Прогрев решателя капчи не удался: {e}")
+
+# ========== МОДЕЛИ ДЛЯ КАПЧИ ==========
+# https://aistudio.google.com/u/1/usage?project=gen-lang-client-0290532217&timeRange=last-1-day&tab=rate-limit
+CAPTCHA_MODELS = [
+    "gemini-2.5-flash",
+    "gemini-2.5-flash-lite", 
+    "gemini-robotics-er-1.5-preview"
+]
+
+# Журнал квот: помнит исчерпанные модели между перезапусками
+quota_ledger = QuotaLedger(os.path.join(DATA_DIR, "captcha_quota.json"), CAPTCHA_MODELS)
+
+SUPPORT_CONTACT = "@andranik_amrahyan"  # Контакт поддержки
+
+QALAIS_BOT_ID = 6964500387
+
+CMD_START = {"начать", "начинать", "старт", "start", "запуск", "go"}
+CMD_STOPS = {"закончить", "завершить", "остановить", "стоп", "stop", "конец", "финиш"}
+CMD_TRACE = {"трейс", "трейсы", "trace"}
+CMD_PROFILE = {"профиль", "profile"}  # + необязательное число секунд
+
+FISH_CMD = "рыбалка"
+
+# Tunables
+FIND_EMOJI_TIMEOUT = 50.0
+BOT_RESPONSE_TIMEOUT = 50.0
+
+# Конвейер: следующий заброс сразу после результата, учет цикла — в фоне
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "1") != "0"
+
+# Cooldowns (начальные значения; дальше интервалы подстраиваются под ответы игры)
+COOLDOWN_AFTER_CLICK = 4.5
+MIN_SEND_INTERVAL = 0.8
+
+# Короткие FloodWait (до N секунд) Telethon пересыпает сам на любом вызове;
+# длинные приходят ошибкой в лимитер, который ставит метод на паузу для всего аккаунта
+FLOOD_SLEEP_THRESHOLD = 10
+# Таймаут заброса и клика — дольше FLOOD_SLEEP_THRESHOLD: пока Telethon пересыпает
+# короткий FloodWait, wait_for не должен отменять вызов и считать его неудачей
+ACTION_TIMEOUT = FLOOD_SLEEP_THRESHOLD + 5.0
+
+# Логирование
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("auto_fisher")
+# Отключаем лишний шум
+logging.getLogger("telethon").setLevel(logging.WARNING)
+logging.getLogger("werkzeug").setLevel(logging.WARNING) # Логи Flask
+
+# ----------------- Отчет о времени запуска -----------------
+startup_marks = {"imports": None, "connected": None, "handlers": None, "resumed": None,
+                 "first_action": None, "first_cast": None}
+resumed_stage = None  # этап, с которого воркер продолжил после перезапуска
+startup_reported = False
+
+def mark_startup(stage: str):
+    """
+    Отмечает этап запуска (один раз). Отчет в лог — после первого заброса, когда
+    отмечены и подключение, и хендлеры (действие продолженного воркера может их опередить).
+    """
+    global startup_reported
+    if startup_marks.get(stage) is not None:
+        return
+    startup_marks[stage] = round(time.perf_counter() - STARTUP_T0, 3)
+    if startup_reported or any(startup_marks[k] is None for k in ("imports", "connected", "handlers", "first_cast")):
+        return
+    startup_reported = True
+    report = (
+        "🚀 Запуск: импорт {imports}с → подключение {connected}с → хендлеры {handlers}с → "
+        "первый заброс {first_cast}с".format(**startup_marks)
+    )
+    if resumed_stage:
+        report += f" (продолжение с этапа {resumed_stage}"
+        if startup_marks["first_action"] is not None:
+            report += f", первое действие {startup_marks['first_action']}с"
+        report += ")"
+    logger.info(report)
+
+# ----------------- Flask Server (Keep-Alive) -----------------
+def create_web_app():
+    """Flask импортируется здесь, в потоке веб-сервера, а не при старте бота."""
+    from flask import Flask, jsonify
+    app_flask = Flask(__name__)
+
+    @app_flask.route("/")
+    def home():
+        return "Bot is running!", 200
+
+    @app_flask.route("/ping")
+    def ping():
+        return "pong", 200
+
+    @app_flask.route("/metrics")
+    def metrics():
+        """Метрики циклов рядом с задержкой event loop — для сопоставления пропусков с зависаниями."""
+        if supervisor is not None:
+            return jsonify(dict(supervisor.metrics(), startup=dict(startup_marks)))
+        return jsonify({
+            "accounts": {acc.name: acc.snapshot() for acc in accounts},
+            "stages": tracer.stage_stats(),
+            "loop": loop_monitor.snapshot(),
+            "event_bot": event_bot_stats(),
+            "startup": dict(startup_marks),
+        })
+
+    return app_flask
+
+def run_web_server():
+    # Render предоставляет порт через переменную окружения PORT
+    port = int(os.environ.get("PORT", 8080))
+    create_web_app().run(host=WEB_HOST, port=port)
+
+async def self_ping():
+    """Периодически пингует сам себя, чтобы Render не усыплял сервис."""
+    if not RENDER_APP_URL:
+        logger.warning("⚠️ RENDER_APP_URL не задан! Бот может уснуть.")
+        return
+
+    logger.info(f"🔄 Self-ping запущен для: {RENDER_APP_URL}")
+    import aiohttp
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"{RENDER_APP_URL}/ping") as resp:
+                    if resp.status == 200:
+                        logger.info("Ping OK")
+                    else:
+                        logger.warning(f"Ping failed with status: {resp.status}")
+            except Exception as e:
+                logger.error(f"Ping error: {str(e)}")
+            
+            # Ждем 3 минуты (180 сек)
+            await asyncio.sleep(180)
+
+# ----------------- Общее для всех аккаунтов -----------------
+# Трейсинг этапов цикла (спаны привязаны к задаче воркера через contextvars,
+# поэтому один трейсер на все аккаунты; цикл помечается аккаунтом для сводок по аккаунту);
+# RPC считаются через хук лимитера аккаунта
+tracer = Tracer()
+
+# Аккаунт, которому принадлежит текущая задача воркера
+_current_account = contextvars.ContextVar("fisher_account", default=None)
+
+def _checkpoint_stage(stage: str):
+    """Хук трейсера: вход в спан — переход этапа цикла, сохраняем снимок аккаунта."""
+    account = _current_account.get()
+    if account is not None:
+        account.save_worker_state(stage)
+
+tracer.on_span = _checkpoint_stage
+
+# Задержка event loop и медленные колбэки
+loop_monitor = LoopMonitor()
+
+
+async def get_captcha_consensus(primary, image_data: bytes, options):
+    """Параллельно опрашивает другие доступные модели и выбирает ответ голосованием по уверенности."""
+    return await get_consensus(get_genai_client(), quota_ledger, CAPTCHA_MODELS, primary, image_data, options)
+
+
+# ----------------- Event handlers -----------------
+def _resolve_peer_user_id(msg):
+    try:
+        peer = getattr(msg, "peer_id", None)
+        if peer is None: return None
+        return getattr(peer, "user_id", None)
+    except Exception:
+        return None
+
+def is_private_with_bot(msg):
+    try:
+        peer_user = _resolve_peer_user_id(msg)
+        if peer_user == QALAIS_BOT_ID: return True
+        if getattr(msg, "chat_id", None) == QALAIS_BOT_ID: return True
+        sender_id = getattr(msg, "sender_id", None)
+        if sender_id == QALAIS_BOT_ID: return False
+        if getattr(msg, "from_id", None):
+            fid = getattr(msg.from_id, "user_id", None)
+            if fid == QALAIS_BOT_ID:
+                return _resolve_peer_user_id(msg) == QALAIS_BOT_ID or getattr(msg, "chat_id", None) == QALAIS_BOT_ID
+    except Exception:
+        return False
+    return False
+
+# ----------------- Utils -----------------
+def msg_text_lower(message) -> str:
+    try:
+        return (message.message or message.raw_text or "").lower()
+    except Exception:
+        return ""
+
+async def find_button_index_with_keyword(message, keyword: str):
+    flat = []
+    for row in getattr(message, "buttons", []):
+        for b in row: flat.append(getattr(b, "text", "") or "")
+    for i, t in enumerate(flat):
+        if keyword.lower() in t.lower():
+            return i, t
+    
+    # Дополнительная проверка с похожими словами
+    similar_keywords = ["рыба", "ловить", "удочка", "закинуть", "начать рыбалку"]
+    for i, t in enumerate(flat):
+        for similar in similar_keywords:
+            if similar in t.lower():
+                return i, t
+    
+    return None, None
+
+async def find_button_has_emoji(message):
+    return emoji_button_index(message)
+
+# ----------------- Waiters -----------------
+async def _same_message_equiv(a, b) -> bool:
+    if a is None or b is None: return False
+    try:
+        if getattr(a, "id", None) != getattr(b, "id", None): return False
+        ta = (a.message or a.raw_text or "") or ""
+        tb = (b.message or b.raw_text or "") or ""
+        return ta == tb
+    except Exception:
+        return False
+
+# ========== КОНВЕЙЕР: ЗАБРОС СРАЗУ, УЧЕТ ЦИКЛА В ФОНЕ ==========
+# Журнал уловов всех аккаунтов: запись пачками в отдельном потоке
+catch_log = CatchLogWriter(os.path.join(DATA_DIR, "catches.db"))
+_background_tasks = set()
+
+def spawn_background(coro):
+    """Запускает фоновую задачу и держит на нее ссылку, пока она не завершится."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+# ----------------- keywords -----------------
+MENU_KEYWORDS = ["меню рыбалки", "уровень рыбака", "поймано рыбы", "уникальные виды"]
+FISH_WAIT_KEYWORDS = ["вы закинули удочку в воду",
+                      "дождитесь момента, когда рыба зацепится за крючок и подсекайте ее",
+                      "у вас будет пару секунд, чтобы подсечь рыбу"]
+CATCH_SUCCESS_KEYWORDS = ["вы поймали рыбу", "вы поймали предмет", "поздравляем с удачной рыбалкой",
+                          "леска не выдержала и оборвалась", "сорвалась с крючка",
+                          "подсечь рыбу"]
+CAPTCHA_KEYWORDS = ["нам нужно убедиться, что вы не робот",
+                    "нажмите на кнопку с эмодзи, который отображен",
+                    "нажмите на кнопку ниже, чтобы продолжить"]
+
+def contains_any(text: str, keywords):
+    if not text: return False
+    text_lower = text.lower()
+    for k in keywords:
+        if k in text_lower: return True
+    return False
+
+# ----------------- Commands -----------------
+CMD_START_PATTERN = r'(?i)^(' + '|'.join(re.escape(cmd) for cmd in CMD_START) + r')$'
+CMD_TRACE_PATTERN = r'(?i)^(' + '|'.join(re.escape(cmd) for cmd in CMD_TRACE) + r')$'
+CMD_PROFILE_PATTERN = r'(?i)^(' + '|'.join(re.escape(cmd) for cmd in CMD_PROFILE) + r')(?:\s+(\d+))?$'
+_profile_running = False
+
+# ----------------- Аккаунт -----------------
+class AccountLog(logging.LoggerAdapter):
+    """Логи аккаунта с префиксом имени — при нескольких аккаунтах в одном процессе."""
+    def process(self, msg, kwargs):
+        return f"[{self.extra['account']}] {msg}", kwargs
+
+class FisherAccount:
+    """
+    Одна сессия Telethon со своим воркером, очередью сообщений, лимитером,
+    интервалами и состоянием капчи. Журнал квот, трейсер, журнал уловов и
+    event loop общие — в одном процессе работают десятки таких аккаунтов.
+    """
+
+    def __init__(self, name: str, session: str, api_id: int, api_hash: str, data_dir: str):
+        self.name = name
+        self.data_dir = data_dir
+        self.log = AccountLog(logger, {"account": name})
+        
+        # Короткие FloodWait Telethon пересыпает сам (вызовы вне лимитера их не видят),
+        # длинные отдает ошибкой лимитеру, который ставит метод на паузу для всех задач аккаунта
+        self.client = TelegramClient(StringSession(session), api_id, api_hash,
+                                     flood_sleep_threshold=FLOOD_SLEEP_THRESHOLD)
+        
+        # Обученные интервалы переживают перезапуск
+        self.cooldowns = CooldownLearner(os.path.join(data_dir, "cooldowns.json"), COOLDOWN_AFTER_CLICK, MIN_SEND_INTERVAL)
+        
+        # Единый лимитер исходящих запросов аккаунта (воркер, ожидания и event_bot).
+        # Обученный интервал отправки соблюдает сам воркер: бюджет send_message общий с event_bot
+        self.limiter = RateLimiter()
+        self.limiter.on_acquire = tracer.note_rpc
+        
+        # Разрывы соединения и время от разрыва до первого успешного действия
+        self.connection_watch = ConnectionWatch(self.client, on_reconnect=self.catch_up_missed_updates)
+        
+        self._worker_task = None
+        self._worker_running = False
+        self._stop_event = asyncio.Event()
+        self.bot_msg_queue: asyncio.Queue = asyncio.Queue(maxsize=128)
+        
+        self.current_model_index = 0  # Начинаем с первой модели
+        self.successful_model_index = None  # Индекс успешной модели
+        # Переменные для отслеживания повторяющихся некритических ошибок
+        self.last_captcha_error_type = None
+        self.captcha_error_count = 0
+        
+        # Снимок состояния воркера
+        self.worker_checkpoint = WorkerCheckpoint(os.path.join(data_dir, "worker_state.json"))
+        
+        # Статистика циклов (обновляется фоновыми задачами)
+        self.cycle_stats = {"cycles": 0, "last_cycle_s": None, "outcomes": {}, "value_total": 0.0}
+        # Заброс, начавший текущий цикл (monotonic): длительность цикла — от него до результата.
+        # Сбрасывается при паузах (стоп, капча, "подожди"), чтобы простой не попал в длительность
+        self._cycle_started_at = None
+
+    def register_handlers(self):
+        """Хендлеры сообщений игрового бота и команд — на клиент этого аккаунта."""
+        on = self.client.add_event_handler
+        on(self._on_any_new_message, events.NewMessage(incoming=True, chats=QALAIS_BOT_ID))
+        on(self._on_any_edited_message, events.MessageEdited(chats=QALAIS_BOT_ID))
+        on(self.cmd_start, events.NewMessage(outgoing=True, chats=QALAIS_BOT_ID, pattern=CMD_START_PATTERN))
+        on(self.cmd_stop_listener, events.NewMessage(outgoing=True, chats=QALAIS_BOT_ID))
+        on(self.cmd_trace, events.NewMessage(outgoing=True, chats=QALAIS_BOT_ID, pattern=CMD_TRACE_PATTERN))
+        on(self.cmd_profile, events.NewMessage(outgoing=True, chats=QALAIS_BOT_ID, pattern=CMD_PROFILE_PATTERN))
+
+    async def catch_up_missed_updates(self):
+        """После переподключения догружаем пропущенные обновления: они пройдут через те же
+        хендлеры, и поклевка, пришедшая во время разрыва, попадет в очередь воркера."""
+        started = time.perf_counter()
+        await self.client.catch_up()
+        self.log.info(f"📥 Запрошены пропущенные обновления ({time.perf_counter() - started:.2f}с)")
+
+    def note_worker_action(self):
+        """Успешный заброс или клик — для замеров запуска и восстановления после разрыва."""
+        mark_startup("first_action")
+        self.connection_watch.note_action()
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self._worker_running,
+            "stage": self.worker_checkpoint.get("stage"),
+            "cycles": dict(self.cycle_stats),
+            "stages": tracer.stage_stats(self.name),
+            "limiter": self.limiter.snapshot(),
+            "connection": self.connection_watch.snapshot(),
+            "captcha_model": CAPTCHA_MODELS[self.current_model_index],
+        }
+
+    async def connect(self) -> bool:
+        for attempt in range(1, 6):
+            try:
+                await self.client.start()
+                self.log.info("✅ Подключение к Telegram успешно")
+                return True
+            except Exception as e:
+                self.log.warning(f"⚠️ Попытка {attempt}/5 подключения не удалась: {e}")
+                if attempt < 5:
+                    await asyncio.sleep(5 * attempt)
+        self.log.error("❌ Не удалось подключиться к Telegram после 5 попыток")
+        return False
+
+    # ========== ФУНКЦИИ УПРАВЛЕНИЯ МОДЕЛЯМИ КАПЧИ ==========
+    async def rotate_captcha_model(self) -> bool:
+        """Переключает на следующую модель капчи. Возвращает True если есть еще модели, False если все исчерпаны."""
+        self.log.info(f"🔄 Ротация модели капчи. Текущая: {CAPTCHA_MODELS[self.current_model_index]}")
+        
+        # Ищем следующую модель, у которой по журналу квот еще остался лимит
+        for step in range(1, len(CAPTCHA_MODELS)):
+            next_index = (self.current_model_index + step) % len(CAPTCHA_MODELS)
+            if quota_ledger.is_available(CAPTCHA_MODELS[next_index]):
+                self.current_model_index = next_index
+                self.log.info(f"✅ Переключено на модель: {CAPTCHA_MODELS[self.current_model_index]}")
+                return True
+        
+        self.log.error("❌ Все модели капчи исчерпаны!")
+        return False
+
+    async def get_current_captcha_model(self) -> str:
+        """Возвращает текущую модель капчи."""
+        return CAPTCHA_MODELS[self.current_model_index]
+
+    def set_successful_captcha_model(self):
+        """Сохраняет текущую модель как успешную."""
+        self.successful_model_index = self.current_model_index
+        self.log.info(f"💾 Сохранена успешная модель: {CAPTCHA_MODELS[self.successful_model_index]}")
+
+    def save_worker_state(self, stage: str = None):
+        """Пишет снимок (только если что-то изменилось); stage=None — этап не меняется."""
+        fields = {
+            "running": self._worker_running,
+            "captcha_error_type": self.last_captcha_error_type,
+            "captcha_error_count": self.captcha_error_count,
+            "model_index": self.current_model_index,
+            "successful_model_index": self.successful_model_index,
+        }
+        if stage:
+            fields["stage"] = stage
+        self.worker_checkpoint.update(**fields)
+
+    def restore_worker_state(self):
+        """Восстанавливает счетчики капчи и модель из снимка; возвращает этап, если воркер был запущен."""
+        state = self.worker_checkpoint.state
+        self.last_captcha_error_type = state.get("captcha_error_type")
+        self.captcha_error_count = int(state.get("captcha_error_count") or 0)
+        if isinstance(state.get("model_index"), int) and 0 <= state["model_index"] < len(CAPTCHA_MODELS):
+            self.current_model_index = state["model_index"]
+        if isinstance(state.get("successful_model_index"), int) and 0 <= state["successful_model_index"] < len(CAPTCHA_MODELS):
+            self.successful_model_index = state["successful_model_index"]
+        return (state.get("stage") or "send_fish_cmd") if state.get("running") else None
+
+    async def stop_bot_with_captcha_error(self, error_message: str, is_limit_exhausted: bool = False):
+        """Останавливает бота с сообщением об ошибке капчи."""
+        self.log.error(f"🛑 Остановка бота из-за ошибки капчи: {error_message}")
+        
+        if is_limit_exhausted:
+            retry_hint = "Попробуйте снова через некоторое время."
+            next_at = quota_ledger.next_available_at()
+            if next_at:
+                retry_hint = (
+                    "Лимит снова появится примерно в "
+                    f"{datetime.fromtimestamp(next_at, timezone.utc).strftime('%H:%M')} UTC."
+                )
+            message_text = (
+                "❌ Достигнут лимит всех моделей для решения капчи!\n\n"
+                "Все доступные модели ИИ исчерпали свои лимиты:\n"
+                f"- {', '.join(CAPTCHA_MODELS)}\n\n"
+                "⛔ Авто-рыбалка остановлена.\n"
+                f"{retry_hint}"
+            )
+        else:
+            message_text = (
+                "❌ Критическая ошибка при решении капчи!\n\n"
+                f"Ошибка: {error_message}\n\n"
+                "⚠️ Пожалуйста, свяжитесь со службой поддержки и сообщите об этой ошибке.\n"
+                f"Поддержка: {SUPPORT_CONTACT}\n\n"
+                "⛔ Авто-рыбалка остановлена."
+            )
+        
+        # Отправляем сообщение об ошибке в чат
+        if error_message:
+            try:
+                async with self.limiter.throttle("send_message"):
+                    await self.client.send_message(QALAIS_BOT_ID, message_text)
+            except Exception as e:
+                self.log.error(f"Не удалось отправить сообщение об ошибке: {e}")
+        
+        # Останавливаем воркер
+        if self._worker_running:
+            self._stop_event.set()
+            if self._worker_task:
+                self._worker_task.cancel()
+                try:
+                    await self._worker_task
+                except asyncio.CancelledError:
+                    pass
+                self._worker_task = None
+            
+            # Очищаем очередь сообщений
+            while not self.bot_msg_queue.empty():
+                try:
+                    self.bot_msg_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+            
+            self._worker_running = False
+            self.save_worker_state("stopped")
+            self.log.error("🛑 Бот остановлен из-за ошибки капчи")
+
+    async def _on_any_new_message(self, event):
+        try:
+            m = event.message
+            if is_private_with_bot(m):
+                try:
+                    self.bot_msg_queue.put_nowait(m)
+                except asyncio.QueueFull:
+                    try:
+                        _ = self.bot_msg_queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        pass
+                    try:
+                        self.bot_msg_queue.put_nowait(m)
+                    except asyncio.QueueFull:
+                        pass
+        except Exception:
+            pass
+
+    async def _on_any_edited_message(self, event):
+        try:
+            m = getattr(event, "message", None) or await event.get_message()
+            if not m: return
+            if is_private_with_bot(m):
+                try:
+                    self.bot_msg_queue.put_nowait(m)
+                except asyncio.QueueFull:
+                    try:
+                        _ = self.bot_msg_queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        pass
+                    try:
+                        self.bot_msg_queue.put_nowait(m)
+                    except asyncio.QueueFull:
+                        pass
+        except Exception:
+            pass
+
+    async def click_button_by_flat_index(self, message, flat_index: int, refresh: bool = True) -> bool:
+        """Улучшенная функция клика с повторными попытками.
+        refresh=False — первая попытка без перезапроса сообщения (кнопки уже известны)."""
+        MAX_ATTEMPTS = 5
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                mid = getattr(message, "id", None)
+                if mid and (refresh or attempt > 1):
+                    try:
+                        async with self.limiter.throttle("get_messages"):
+                            fresh = await asyncio.wait_for(
+                                self.client.get_messages(QALAIS_BOT_ID, ids=mid),
+                                timeout=3.0
+                            )
+                        if fresh: message = fresh
+                    except (asyncio.TimeoutError, Exception):
+                        pass
+
+                # Бюджет кликов и длинные FloodWait держит лимитер, паузу после неудачной попытки — цикл ниже
+                try:
+                    async with self.limiter.throttle("click"):
+                        await asyncio.wait_for(
+                            message.click(flat_index),
+                            timeout=ACTION_TIMEOUT
+                        )
+                    self.note_worker_action()
+                    return True
+                except (asyncio.TimeoutError, Exception) as e:
+                    pass
+                
+            except Exception:
+                pass
+
+            # Быстрые ошибки не должны съедать бюджет кликов подряд
+            if attempt < MAX_ATTEMPTS:
+                await asyncio.sleep(0.3 * attempt)
+        
+        self.log.warning(f"❌ Не удалось нажать кнопку {flat_index} после {MAX_ATTEMPTS} попыток")
+        return False
+
+    @tracer.traced("wait_for_bot_message")
+    async def wait_for_bot_message(self, after_dt: datetime = None, timeout=BOT_RESPONSE_TIMEOUT, prev_msg=None):
+        if after_dt is None: after_dt = datetime.now(timezone.utc) - timedelta(seconds=10)
+        deadline = time.time() + timeout
+        
+        try:
+            async with self.limiter.throttle("get_messages"):
+                recent = await asyncio.wait_for(
+                    self.client.get_messages(QALAIS_BOT_ID, limit=10),
+                    timeout=5.0
+                )
+        except (asyncio.TimeoutError, Exception): 
+            recent = []
+        
+        if recent:
+            for m in recent:
+                if getattr(m, "date", None) and m.date > after_dt:
+                    if prev_msg is not None and await _same_message_equiv(m, prev_msg): 
+                        continue
+                    return m
+
+        while time.time() < deadline and not self._stop_event.is_set():
+            remaining = deadline - time.time()
+            try:
+                msg = await asyncio.wait_for(
+                    self.bot_msg_queue.get(),
+                    timeout=min(remaining, 2.0)
+                )
+            except asyncio.TimeoutError: 
+                continue
+            except Exception: 
+                continue
+            
+            if not msg: 
+                continue
+            
+            mdate = getattr(msg, "date", None)
+            if prev_msg is not None and getattr(msg, "id", None) == getattr(prev_msg, "id", None):
+                if not await _same_message_equiv(msg, prev_msg): 
+                    return msg
+                else: 
+                    continue
+
+            if mdate and mdate > after_dt: 
+                return msg
+            if getattr(msg, "buttons", None): 
+                return msg
+
+        return None
+
+    @tracer.traced("poll_for_button_emoji")
+    async def poll_for_button_emoji(self, timeout=FIND_EMOJI_TIMEOUT):
+        try:
+            async with self.limiter.throttle("get_messages"):
+                recent = await asyncio.wait_for(
+                    self.client.get_messages(QALAIS_BOT_ID, limit=12),
+                    timeout=5.0
+                )
+        except (asyncio.TimeoutError, Exception): 
+            recent = []
+
+        if recent:
+            for m in recent:
+                if m and getattr(m, "buttons", None):
+                    idx, txt = await find_button_has_emoji(m)
+                    if idx is not None: 
+                        return m, idx, txt
+
+        deadline = time.time() + timeout
+        while time.time() < deadline and not self._stop_event.is_set():
+            remaining = deadline - time.time()
+            try:
+                msg = await asyncio.wait_for(
+                    self.bot_msg_queue.get(),
+                    timeout=min(remaining, 2.0)
+                )
+            except asyncio.TimeoutError: 
+                continue
+            except Exception: 
+                continue
+            
+            if msg and getattr(msg, "buttons", None):
+                idx, txt = await find_button_has_emoji(msg)
+                if idx is not None: 
+                    return msg, idx, txt
+        
+        return None, None, None
+
+    # ========== ФУНКЦИИ ДЛЯ ОБРАБОТКИ ЦИКЛА РЫБАЛКИ ==========
+    @tracer.traced("wait_for_fish_result")
+    async def wait_for_fish_result(self, fish_msg_id, timeout=25.0):
+        """
+        Ожидает результат рыбалки, отслеживая редактирование сообщения с ID fish_msg_id
+        или появление нового сообщения с результатом
+        """
+        deadline = time.time() + timeout
+        
+        while time.time() < deadline and not self._stop_event.is_set():
+            # Сначала проверяем, не изменилось ли исходное сообщение
+            try:
+                async with self.limiter.throttle("get_messages"):
+                    fresh_msg = await asyncio.wait_for(
+                        self.client.get_messages(QALAIS_BOT_ID, ids=fish_msg_id),
+                        timeout=3.0
+                    )
+                if fresh_msg and fresh_msg.id == fish_msg_id:
+                    txt = msg_text_lower(fresh_msg)
+                    if contains_any(txt, CATCH_SUCCESS_KEYWORDS):
+                        return fresh_msg
+            except (asyncio.TimeoutError, Exception):
+                pass
+            
+            # Затем проверяем новые сообщения
+            try:
+                async with self.limiter.throttle("get_messages"):
+                    recent = await asyncio.wait_for(
+                        self.client.get_messages(QALAIS_BOT_ID, limit=6),
+                        timeout=3.0
+                    )
+                for msg in recent:
+                    txt = msg_text_lower(msg)
+                    if contains_any(txt, CATCH_SUCCESS_KEYWORDS):
+                        return msg
+            except (asyncio.TimeoutError, Exception):
+                pass
+            
+            # Проверяем очередь сообщений
+            try:
+                msg = await asyncio.wait_for(
+                    self.bot_msg_queue.get(),
+                    timeout=2.0
+                )
+                if msg:
+                    txt = msg_text_lower(msg)
+                    if contains_any(txt, CATCH_SUCCESS_KEYWORDS):
+                        return msg
+            except asyncio.TimeoutError:
+                continue
+            except Exception:
+                continue
+            
+            await asyncio.sleep(1.0)
+        
+        return None
+
+    @tracer.traced("click_fish_button_after_result")
+    async def click_fish_button_after_result(self, result_msg, fish_msg_id=None):
+        """
+        Пытается нажать кнопку "рыбачить" после результата рыбалки
+        с отслеживанием возможного редактирования сообщения
+        """
+        max_attempts = 3
+        for attempt in range(max_attempts):
+            try:
+                # Получаем свежую версию сообщения
+                if result_msg and hasattr(result_msg, 'id'):
+                    async with self.limiter.throttle("get_messages"):
+                        fresh_msg = await asyncio.wait_for(
+                            self.client.get_messages(QALAIS_BOT_ID, ids=result_msg.id),
+                            timeout=3.0
+                        )
+                    if fresh_msg:
+                        result_msg = fresh_msg
+                
+                # Ищем кнопку "рыбачить"
+                idx, btn_text = await find_button_index_with_keyword(result_msg, "рыбач")
+                if idx is not None:
+                    success = await self.click_button_by_flat_index(result_msg, idx)
+                    if success:
+                        return True
+                    else:
+                        self.log.warning(f"❌ Попытка {attempt+1}: не удалось нажать кнопку")
+                else:
+                    self.log.warning(f"❌ Попытка {attempt+1}: кнопка 'рыбачить' не найдена")
+                    
+                    # Проверяем, не изменилось ли сообщение
+                    if attempt < max_attempts - 1:
+                        await asyncio.sleep(1.0)
+                        
+            except (asyncio.TimeoutError, Exception) as e:
+                self.log.warning(f"❌ Ошибка при попытке {attempt+1}: {e}")
+                if attempt < max_attempts - 1:
+                    await asyncio.sleep(1.0)
+        
+        return False
+
+    def note_cycle(self, outcome: str, duration: float = None):
+        """Фиксирует исход цикла в журнале и в трейсе."""
+        catch_log.record_cycle(outcome, duration, self.name)
+        tracer.set_outcome(outcome)
+        self.save_worker_state()
+
+    def note_recast_failed(self):
+        """
+        Не удался заброс после результата. Цикл уже записан как "result" в record_cycle_result,
+        поэтому вторую строку в журнал циклов не пишем — только помечаем трейс.
+        """
+        tracer.set_outcome("recast_failed")
+        self.save_worker_state()
+
+    def note_cast(self):
+        """Удочка заброшена (команда, "рыбачить" в меню или после результата) — начало цикла."""
+        self._cycle_started_at = time.monotonic()
+        mark_startup("first_cast")
+
+    async def record_cycle_result(self, result_msg, started_at: Optional[float], finished_at: float):
+        """Учет завершенного цикла: разбор результата, лог и статистика."""
+        try:
+            raw_text = getattr(result_msg, "message", None) or getattr(result_msg, "raw_text", None) or ""
+            parsed = parse_catch_result(raw_text)
+            outcome = parsed["outcome"]
+            self.cycle_stats["cycles"] += 1
+            self.cycle_stats["outcomes"][outcome] = self.cycle_stats["outcomes"].get(outcome, 0) + 1
+            if parsed["value"]:
+                self.cycle_stats["value_total"] += parsed["value"]
+            # Цикл без известного заброса (после паузы или перезапуска) не дает длительности
+            self.cycle_stats["last_cycle_s"] = round(finished_at - started_at, 2) if started_at is not None else None
+            
+            parsed["ts"] = time.time()
+            parsed["raw"] = raw_text
+            parsed["account"] = self.name
+            catch_log.record(parsed)
+            self.note_cycle("result", self.cycle_stats["last_cycle_s"])
+            
+            title = f"{outcome}: {parsed['name']}" if parsed["name"] else outcome
+            self.log.info(f"🐟 Цикл #{self.cycle_stats['cycles']}: {title} (цикл {self.cycle_stats['last_cycle_s']}с)")
+        except Exception as e:
+            self.log.warning(f"Ошибка учета цикла: {e}")
+
+    @tracer.traced("recast")
+    async def recast_after_result(self, result_msg, fish_msg_id=None) -> bool:
+        """
+        Нажимает "рыбачить" после результата. В режиме конвейера кнопка
+        из уже полученного сообщения нажимается сразу (без повторного get_messages),
+        а учет цикла идет фоновой задачей и не задерживает заброс.
+        """
+        started_at, finished_at = self._cycle_started_at, time.monotonic()
+        self._cycle_started_at = None
+        if not PIPELINE_MODE:
+            success = await self.click_fish_button_after_result(result_msg, fish_msg_id)
+            if success:
+                self.note_cast()
+            await self.record_cycle_result(result_msg, started_at, finished_at)
+            return success
+        
+        success = False
+        idx, _ = await find_button_index_with_keyword(result_msg, "рыбач")
+        if idx is not None:
+            success = await self.click_button_by_flat_index(result_msg, idx, refresh=False)
+        if not success:
+            # Кнопки еще нет в сообщении — обычный путь с ожиданием редактирования
+            success = await self.click_fish_button_after_result(result_msg, fish_msg_id)
+        if success:
+            self.note_cast()
+        spawn_background(self.record_cycle_result(result_msg, started_at, finished_at))
+        return success
+
+    # ========== УЛУЧШЕННОЕ РЕШЕНИЕ КАПЧИ С РОТАЦИЕЙ МОДЕЛЕЙ ==========
+    async def click_captcha_answer(self, message, flat_buttons, answer, model_label: str) -> Optional[bool]:
+        """Нажимает кнопку ответа (модели или сервиса капчи); результат — как у solve_captcha_message."""
+        predicted_emoji = answer.answer if answer else None
+        
+        best_idx = -1
+        if predicted_emoji:
+            for i, btn_txt in enumerate(flat_buttons):
+                if predicted_emoji == btn_txt: # Ищем точное совпадение кнопки
+                    best_idx = i
+                    break
+        
+        if best_idx != -1:
+            self.log.info(f"🎯 CAPTCHA: Нажимаем кнопку {best_idx} ({predicted_emoji})")
+            try:
+                async with self.limiter.throttle("click"):
+                    await asyncio.wait_for(
+                        message.click(best_idx),
+                        timeout=ACTION_TIMEOUT
+                    )
+                self.log.info(f"✅ Капча решена успешно с моделью {model_label}")
+                
+                # Сбрасываем счетчик ошибок при успешном решении
+                self.last_captcha_error_type = None
+                self.captcha_error_count = 0
+                
+                return True
+            except (asyncio.TimeoutError, Exception) as e:
+                self.log.warning(f"❌ Не удалось нажать кнопку капчи: {e}")
+                
+                # Проверяем, была ли такая же ошибка в прошлый раз
+                if self.last_captcha_error_type == "button_click_error":
+                    self.captcha_error_count += 1
+                    if self.captcha_error_count >= 2:
+                        self.log.error("CAPTCHA: Повторная ошибка нажатия кнопки капчи!")
+                        error_message = (
+                            "❌ Критическая ошибка при решении капчи!\n\n"
+                            "Не удалось нажать кнопку капчи дважды подряд.\n\n"
+                            "⚠️ Пожалуйста, свяжитесь со службой поддержки и сообщите об этой ошибке.\n"
+                            f"Поддержка: {SUPPORT_CONTACT}\n\n"
+                            "⛔ Авто-рыбалка остановлена."
+                        )
+                        try:
+                            async with self.limiter.throttle("send_message"):
+                                await self.client.send_message(QALAIS_BOT_ID, error_message)
+                        except Exception as send_err:
+                            self.log.error(f"Не удалось отправить сообщение об ошибке: {send_err}")
+                        
+                        # Останавливаем бота
+                        await self.stop_bot_with_captcha_error("Повторная ошибка нажатия кнопки капчи")
+                        return None
+                else:
+                    self.last_captcha_error_type = "button_click_error"
+                    self.captcha_error_count = 1
+                return False
+        else:
+            self.log.error(f"❌ CAPTCHA: Соответствующая кнопка не найдена в ответе API")
+            
+            # Отправляем сообщение пользователю о необходимости решить капчу вручную
+            error_message = (
+                "❌ Не удалось решить капчу автоматически (Соответствующая кнопка не найдена в ответе API).\n\n"
+                "Пожалуйста, решите капчу вручную и снова запустите авто рыбалку.\n"
+                "Если это случается часто, свяжитесь со службой поддержки.\n"
+                f"Поддержка: {SUPPORT_CONTACT}\n\n"
+                "⛔ Авто-рыбалка остановлена."
+            )
+            try:
+                async with self.limiter.throttle("send_message"):
+                    await self.client.send_message(QALAIS_BOT_ID, error_message)
+            except Exception as send_err:
+                self.log.error(f"Не удалось отправить сообщение об ошибке: {send_err}")
+            
+            # Останавливаем бота
+            await self.stop_bot_with_captcha_error("")
+            return None
+
+    async def solve_captcha_via_service(self, message, flat_buttons, image_data: bytes, options) -> Optional[bool]:
+        """Решение через общий сервис капчи: повторы, квоты и пачки запросов — на его стороне."""
+        try:
+            result = await request_solve(CAPTCHA_SERVICE_URL, self.name, image_data, options)
+        except Exception as e:
+            self.log.error(f"❌ CAPTCHA: Сервис капчи недоступен: {e}")
+            await self.stop_bot_with_captcha_error(f"Сервис капчи недоступен: {e}", is_limit_exhausted=False)
+            return None
+
+        status = result.get("status")
+        if status == "ok":
+            model_label = f"{result.get('model')} (сервис{', кэш' if result.get('cached') else ''})"
+            self.log.info(f"✅ CAPTCHA: Ответ сервиса: '{result.get('answer')}' (уверенность {result.get('confidence', 0.0):.2f})")
+            answer = CaptchaAnswer(result.get("model"), result.get("answer"), float(result.get("confidence") or 0.0))
+            return await self.click_captcha_answer(message, flat_buttons, answer, model_label)
+        if status == "no_answer":
+            return await self.click_captcha_answer(message, flat_buttons, None, f"{result.get('model')} (сервис)")
+        if status == "exhausted":
+            await self.stop_bot_with_captcha_error("Все модели сервиса капчи исчерпаны", is_limit_exhausted=True)
+            return None
+        self.log.error(f"❌ CAPTCHA: Ошибка сервиса капчи: {result.get('error')}")
+        await self.stop_bot_with_captcha_error(f"Ошибка сервиса капчи: {result.get('error')}", is_limit_exhausted=False)
+        return None
+
+    @tracer.traced("captcha")
+    async def solve_captcha_message(self, message) -> Optional[bool]:
+        """
+        Решает капчу с ротацией моделей.
+        Возвращает:
+        - True: капча решена успешно
+        - False: капча не решена (но не критическая ошибка)
+        - None: критическая ошибка, бот должен остановиться
+        """
+        # Время на капчу — не рыбалка: цикл начнется заново со следующего заброса
+        self._cycle_started_at = None
+        
+        # С общим сервисом квоты и клиент Gemini живут в нем
+        if not CAPTCHA_SERVICE_URL:
+            if not await asyncio.to_thread(get_genai_client):
+                self.log.error("CAPTCHA: Клиент Gemini не инициализирован.")
+                await self.stop_bot_with_captcha_error("Клиент Gemini не инициализирован")
+                return None
+
+            # Отмечаем капчу в журнале квот и заранее предупреждаем о скором исчерпании лимитов
+            quota_ledger.record_captcha()
+            if quota_ledger.forecast()["exhausted_at"]:
+                self.log.warning(f"📒 При текущем темпе капч лимиты моделей закончатся до сброса: {quota_ledger.summary()}")
+
+        flat_buttons = []
+        for row in getattr(message, "buttons", []):
+            for b in row:
+                txt = getattr(b, "text", None)
+                flat_buttons.append(txt.strip() if txt else "")
+
+        unique_options = [b for b in flat_buttons if b and not b.isspace()]
+        
+        if not unique_options:
+            self.log.error("CAPTCHA: Кнопки не найдены.")
+            return False
+        
+        self.log.info(f"Кнопки капчи: {unique_options}")
+
+        # Загружаем изображение капчи в память
+        image_data = None
+        try:
+            # Скачиваем в bytes
+            async with self.limiter.throttle("download"):
+                raw_img = await asyncio.wait_for(
+                    message.download_media(file=bytes),
+                    timeout=15.0
+                )
+            
+            # === ОБРАБОТКА ИЗОБРАЖЕНИЯ (CROP) ===
+            # PIL работает в отдельном потоке, чтобы не блокировать event loop;
+            # сервису отдаем оригинал — он сам обрезает и по нему же ищет повторы
+            if CAPTCHA_SERVICE_URL:
+                image_data = raw_img
+            else:
+                try:
+                    image_data = await asyncio.to_thread(crop_captcha_image, raw_img)
+                except Exception as pil_err:
+                    self.log.warning(f"⚠️ Ошибка обработки изображения PIL, используем оригинал: {pil_err}")
+                    image_data = raw_img
+
+        except Exception as e:
+            self.log.warning(f"CAPTCHA: Ошибка загрузки изображения: {e}")
+            # Проверяем, была ли такая же ошибка в прошлый раз
+            if self.last_captcha_error_type == "image_load_error":
+                self.captcha_error_count += 1
+                if self.captcha_error_count >= 2:
+                    self.log.error("CAPTCHA: Повторная ошибка загрузки изображения капчи!")
+                    error_message = (
+                        "❌ Критическая ошибка при решении капчи!\n\n"
+                        "Не удалось загрузить изображение капчи дважды подряд.\n\n"
+                        "⚠️ Пожалуйста, свяжитесь со службой поддержки и сообщите об этой ошибке.\n"
+                        f"Поддержка: {SUPPORT_CONTACT}\n\n"
+                        "⛔ Авто-рыбалка остановлена."
+                    )
+                    try:
+                        async with self.limiter.throttle("send_message"):
+                            await self.client.send_message(QALAIS_BOT_ID, error_message)
+                    except Exception as send_err:
+                        self.log.error(f"Не удалось отправить сообщение об ошибке: {send_err}")
+                    
+                    # Останавливаем бота
+                    await self.stop_bot_with_captcha_error("Повторная ошибка загрузки изображения капчи")
+                    return None
+            else:
+                self.last_captcha_error_type = "image_load_error"
+                self.captcha_error_count = 1
+            return False
+        
+        if CAPTCHA_SERVICE_URL:
+            return await self.solve_captcha_via_service(message, flat_buttons, image_data, unique_options)
+        
+        # Сохраняем начальный индекс для проверки полного цикла
+        start_model_index = self.current_model_index
+        models_tried = 0
+        
+        # Пробуем решить капчу с ротацией моделей
+        while models_tried < len(CAPTCHA_MODELS):
+            current_model = await self.get_current_captcha_model()
+            
+            # Модель, исчерпавшую квоту по журналу, пропускаем без лишнего запроса
+            if not quota_ledger.is_available(current_model):
+                self.log.info(f"⏭ CAPTCHA: Пропускаем {current_model} — квота исчерпана по журналу")
+                models_tried += 1
+                if not await self.rotate_captcha_model():
+                    break
+                continue
+            
+            self.log.info(f"🔍 CAPTCHA: Используем модель {current_model} (попытка {models_tried + 1}/{len(CAPTCHA_MODELS)})")
+            
+            try:
+                quota_ledger.record_request(current_model)
+                answer = await asyncio.wait_for(
+                    ask_model(get_genai_client(), current_model, image_data, unique_options),
+                    timeout=60.0
+                )
+                self.log.info(f"✅ CAPTCHA: Ответ API: '{answer.raw}' (уверенность {answer.confidence:.2f})")
+                
+                # === ВТОРОЕ МНЕНИЕ ТОЛЬКО ПРИ СОМНЕНИЯХ ===
+                # Неоднозначный ответ или низкая уверенность — параллельно спрашиваем другие модели
+                if needs_second_opinion(answer):
+                    answer = await get_captcha_consensus(answer, image_data, unique_options)
+                
+                result = await self.click_captcha_answer(message, flat_buttons, answer, current_model)
+                if result:
+                    # Сохраняем успешную модель для будущего использования
+                    self.set_successful_captcha_model()
+                    
+                    # Если использовали не первую модель, возвращаемся к ней для следующих капч
+                    if self.successful_model_index is not None and self.successful_model_index != 0:
+                        self.current_model_index = self.successful_model_index
+                        self.log.info(f"🔄 Возвращаемся к успешной модели: {CAPTCHA_MODELS[self.current_model_index]}")
+                return result
+                    
+            except asyncio.TimeoutError:
+                self.log.error(f"❌ CAPTCHA: Тайм-аут ожидания ответа от {current_model}")
+                await self.stop_bot_with_captcha_error(
+                    f"Тайм-аут ожидания ответа от {current_model}",
+                    is_limit_exhausted=False
+                )
+                return None
+            except Exception as e:
+                error_str = str(e)
+                self.log.warning(f"⚠️ CAPTCHA: Ошибка с моделью {current_model}: {error_str}")
+                
+                # Проверяем тип ошибки
+                is_404_error = '404' in error_str and 'NOT_FOUND' in error_str.upper()
+                is_resource_exhausted = 'RESOURCE_EXHAUSTED' in error_str.upper()
+                
+                if is_404_error or is_resource_exhausted:
+                    self.log.warning(f"⚠️ CAPTCHA: Модель {current_model} недоступна или лимит исчерпан")
+                    if is_resource_exhausted:
+                        quota_ledger.mark_exhausted(current_model, error_str)
+                    
+                    # Пробуем следующую модель
+                    has_more_models = await self.rotate_captcha_model()
+                    models_tried += 1
+                    
+                    # Если прошли полный цикл и вернулись к началу
+                    if not has_more_models or (self.current_model_index == start_model_index and models_tried >= len(CAPTCHA_MODELS)):
+                        await self.stop_bot_with_captcha_error(
+                            f"Все модели исчерпаны. Последняя ошибка: {error_str}",
+                            is_limit_exhausted=True
+                        )
+                        return None
+                    
+                    # Продолжаем с следующей моделью
+                    continue
+                else:
+                    # Другие ошибки - критическая ситуация
+                    self.log.error(f"❌ CAPTCHA: Критическая ошибка с моделью {current_model}: {error_str}")
+                    await self.stop_bot_with_captcha_error(
+                        f"Критическая ошибка с моделью {current_model}: {error_str}",
+                        is_limit_exhausted=False
+                    )
+                    return None
+        
+        # Если дошли сюда, значит все модели были перепробованы без успеха
+        await self.stop_bot_with_captcha_error(
+            "Все модели перепробованы, но ни одна не сработала",
+            is_limit_exhausted=True
+        )
+        return None
+
+    # ========== ОПТИМИЗИРОВАННЫЙ ОСНОВНОЙ ВОРКЕР ==========
+    async def fetch_latest_bot_message(self):
+        """Последнее сообщение игрового бота (не наше) — с него продолжаем после перезапуска."""
+        try:
+            async with self.limiter.throttle("get_messages"):
+                recent = await asyncio.wait_for(self.client.get_messages(QALAIS_BOT_ID, limit=5), timeout=5.0)
+        except (asyncio.TimeoutError, Exception):
+            return None
+        for m in recent or []:
+            if not getattr(m, "out", False):
+                return m
+        return None
+
+    async def fisher_worker(self, resume_stage: str = None):
+        """resume_stage — этап из снимка: вместо нового заброса сначала разбираем последнее сообщение бота."""
+        self.log.info("🚀 Fisher worker started")
+        _current_account.set(self)  # контекст задачи: по нему хук трейсера находит снимок аккаунта
+        fishing_in_progress = False
+        last_click_time = None
+        last_send_time = None  # Прошлый заброс — от него меряется интервал отправки
+        last_action_kind = None  # "send" или "click" — чем было последнее действие
+        probe = None  # (интервал, выдержанная пауза) — проверяем по ответу игры на заброс
+        consecutive_fails = 0
+        last_captcha_time = None
+
+        try:
+            while not self._stop_event.is_set():
+                now = datetime.now(timezone.utc)
+                tracer.begin_cycle(self.name)
+                
+                # Нет соединения — не копим неудачи, а ждем восстановления и продолжаем с того же места
+                if not self.connection_watch.connected:
+                    if await self.connection_watch.wait_restored(timeout=60.0):
+                        consecutive_fails = 0
+                    continue
+                
+                # Если слишком много неудач подряд - делаем паузу
+                if consecutive_fails >= 3:
+                    self.log.warning(f"⚠️ {consecutive_fails} неудач подряд, пауза 10 секунд")
+                    await asyncio.sleep(10)
+                    consecutive_fails = 0
+                    continue
+                
+                # Продолжение после перезапуска: состояние игры берем из последнего сообщения
+                if resume_stage and resume_stage != "send_fish_cmd":
+                    resume_stage = None
+                    menu_msg = await self.fetch_latest_bot_message()
+                    if menu_msg is None:
+                        continue
+                # Проверяем кулдаун после клика (обученный интервал вместо фиксированного COOLDOWN_AFTER_CLICK);
+                # после заброса его не ждем — там работает только интервал отправки
+                elif (last_action_kind == "click" and last_click_time
+                      and (now - last_click_time).total_seconds() < self.cooldowns["cast"].value):
+                    try:
+                        menu_msg = await asyncio.wait_for(
+                            self.wait_for_bot_message(timeout=3.0),
+                            timeout=3.5
+                        )
+                    except (asyncio.TimeoutError, Exception):
+                        menu_msg = None
+                else:
+                    # Обученный интервал между забросами (MIN_SEND_INTERVAL) держит сам воркер
+                    if last_send_time:
+                        wait = self.cooldowns["send"].value - (now - last_send_time).total_seconds()
+                        if wait > 0:
+                            await asyncio.sleep(wait)
+                            now = datetime.now(timezone.utc)
+                    probe = None
+                    if last_action_kind == "send" and last_send_time:
+                        # Заброс сразу после заброса: проверяем интервал отправки от прошлой отправки
+                        probe = ("send", (now - last_send_time).total_seconds())
+                    elif last_action_kind == "click" and last_click_time:
+                        probe = ("cast", (now - last_click_time).total_seconds())
+                    try:
+                        with tracer.span("send_fish_cmd"):
+                            async with self.limiter.throttle("send_message"):
+                                await asyncio.wait_for(
+                                    self.client.send_message(QALAIS_BOT_ID, FISH_CMD),
+                                    timeout=ACTION_TIMEOUT
+                                )
+                        fishing_in_progress = True
+                        last_send_time = datetime.now(timezone.utc)  # last_click_time не трогаем: это не клик
+                        last_action_kind = "send"
+                        consecutive_fails = 0
+                        self.note_cast()
+                        self.note_worker_action()
+                    except FloodWaitError as e:
+                        # Лимитер уже поставил send_message на паузу: следующий заброс дождется ее конца
+                        self.log.warning(f"🚦 FloodWait {e.seconds}с на заброс — ждем")
+                        continue
+                    except Exception as e:
+                        self.log.warning(f"send_message failed: {e}")
+                        consecutive_fails += 1
+                        await asyncio.sleep(2)
+                        continue
+
+                    await asyncio.sleep(2.0)
+                    
+                    try:
+                        menu_msg = await asyncio.wait_for(
+                            self.wait_for_bot_message(timeout=10.0),
+                            timeout=10.5
+                        )
+                    except (asyncio.TimeoutError, Exception):
+                        menu_msg = None
+
+                if menu_msg is None:
+                    consecutive_fails += 1
+                    self.note_cycle("no_reply")
+                    await asyncio.sleep(1)
+                    continue
+
+                txt = msg_text_lower(menu_msg)
+
+                # 0. Игра просит подождать — заброс был слишком ранним, учим интервал
+                wait_hint = None if contains_any(txt, CAPTCHA_KEYWORDS) else parse_wait_reply(txt)
+                if wait_hint is not None:
+                    if probe:
+                        self.cooldowns.reject(probe[0], probe[1], wait_hint)
+                    probe = None
+                    self._cycle_started_at = None
+                    self.log.info(f"⏳ Игра просит подождать ({wait_hint:.0f}с), повторим позже")
+                    self.note_cycle("rate_limited")
+                    await asyncio.sleep(wait_hint)
+                    continue
+                if probe and contains_any(txt, MENU_KEYWORDS + FISH_WAIT_KEYWORDS + CAPTCHA_KEYWORDS):
+                    self.cooldowns.success(probe[0], probe[1])
+                probe = None
+
+                # ========== ОПТИМИЗИРОВАННАЯ ЛОГИКА ОБРАБОТКИ ==========
+                
+                # 1. Капча (самый высокий приоритет)
+                if contains_any(txt, CAPTCHA_KEYWORDS):
+                    self.log.info("🔐 Обнаружена капча")
+                    
+                    last_captcha_time = datetime.now(timezone.utc)
+                    
+                    while not self.bot_msg_queue.empty():
+                        try:
+                            self.bot_msg_queue.get_nowait()
+                        except asyncio.QueueEmpty:
+                            break
+                    
+                    result = await self.solve_captcha_message(menu_msg)
+                    
+                    if result is None:
+                        # Критическая ошибка, бот уже остановлен
+                        return
+                    elif result:
+                        consecutive_fails = 0
+                        await asyncio.sleep(3.0)
+                        
+                        while not self.bot_msg_queue.empty():
+                            try:
+                                self.bot_msg_queue.get_nowait()
+                            except asyncio.QueueEmpty:
+                                break
+                        
+                        fishing_in_progress = False
+                        last_click_time = None
+                        
+                        self.log.info("✅ Капча решена, начинаем новую рыбалку")
+                        self.note_cycle("captcha_solved")
+                    else:
+                        consecutive_fails += 1
+                        self.log.warning("❌ Не удалось решить капчу (не критическая ошибка)")
+                        self.note_cycle("captcha_failed")
+                    
+                    await asyncio.sleep(1)
+                    continue
+                
+                # 2. Меню рыбалки (нужно нажать "рыбачить")
+                if contains_any(txt, MENU_KEYWORDS):
+                    idx, btn_text = await find_button_index_with_keyword(menu_msg, "рыбач")
+                    
+                    if idx is None:
+                        for row in getattr(menu_msg, "buttons", []):
+                            for i, b in enumerate(row):
+                                txt_btn = getattr(b, "text", "") or ""
+                                if txt_btn and not txt_btn.isspace():
+                                    idx = i
+                                    break
+                            if idx is not None:
+                                break
+                    
+                    if idx is not None:
+                        with tracer.span("menu_click"):
+                            success = await self.click_button_by_flat_index(menu_msg, idx)
+                        if success:
+                            fishing_in_progress = True
+                            last_click_time = datetime.now(timezone.utc)
+                            last_action_kind = "click"
+                            consecutive_fails = 0
+                            self.note_cast()
+                            
+                            await asyncio.sleep(2.0)
+                            fish_wait_msg = await self.wait_for_bot_message(timeout=8.0)
+                            if fish_wait_msg:
+                                txt_fish = msg_text_lower(fish_wait_msg)
+                                if contains_any(txt_fish, FISH_WAIT_KEYWORDS):
+                                    found_msg, found_idx, found_text = await self.poll_for_button_emoji(timeout=30.0)
+                                    if found_msg:
+                                        fish_msg_id = found_msg.id
+                                        
+                                        with tracer.span("emoji_click"):
+                                            success_fish = await self.click_button_by_flat_index(found_msg, found_idx)
+                                        if success_fish:
+                                            last_click_time = datetime.now(timezone.utc)
+                                            last_action_kind = "click"
+                                            
+                                            await asyncio.sleep(2.0)
+                                            
+                                            result_msg = await self.wait_for_fish_result(fish_msg_id, timeout=20.0)
+                                            
+                                            if result_msg:                                            
+                                                fish_button_success = await self.recast_after_result(result_msg, fish_msg_id)
+                                                
+                                                if fish_button_success:
+                                                    fishing_in_progress = True
+                                                    last_click_time = datetime.now(timezone.utc)
+                                                    last_action_kind = "click"
+                                                    consecutive_fails = 0
+                                                    
+                                                    if not PIPELINE_MODE:
+                                                        await asyncio.sleep(1.5)
+                                                    continue
+                                                else:
+                                                    self.log.warning("❌ Не удалось нажать 'рыбачить' после результата")
+                                                    self.note_recast_failed()
+                                                    fishing_in_progress = False
+                                                    consecutive_fails += 1
+                                            else:
+                                                self.log.warning("❌ Результат рыбалки не получен")
+                                                self.note_cycle("no_result")
+                                                consecutive_fails += 1
+                                        else:
+                                            self.log.warning("❌ Не удалось нажать кнопку с рыбой")
+                                            self.note_cycle("hook_failed")
+                                            consecutive_fails += 1
+                                    else:
+                                        self.log.warning("❌ Кнопка с рыбой не найдена")
+                                        self.note_cycle("no_bite_button")
+                                        consecutive_fails += 1
+                                else:
+                                    if contains_any(txt_fish, CAPTCHA_KEYWORDS):
+                                        result = await self.solve_captcha_message(fish_wait_msg)
+                                        if result is None:
+                                            return
+                                        self.note_cycle("captcha_solved" if result else "captcha_failed")
+                                    consecutive_fails += 1
+                            else:
+                                consecutive_fails += 1
+                        else:
+                            consecutive_fails += 1
+                    else:
+                        consecutive_fails += 1
+                    
+                    await asyncio.sleep(0.5)
+                    continue
+                
+                # 3. Ожидание поклевки (сообщение с FISH_WAIT_KEYWORDS)
+                if contains_any(txt, FISH_WAIT_KEYWORDS):                
+                    idx, btn_text = await find_button_has_emoji(menu_msg)
+                    if idx is not None:
+                        found_msg, found_idx, found_text = menu_msg, idx, btn_text
+                    else:
+                        found_msg, found_idx, found_text = await self.poll_for_button_emoji(timeout=30.0)
+                    
+                    if found_msg and found_idx is not None:
+                        fish_msg_id = found_msg.id
+                        
+                        with tracer.span("emoji_click"):
+                            success_fish = await self.click_button_by_flat_index(found_msg, found_idx)
+                        if success_fish:
+                            last_click_time = datetime.now(timezone.utc)
+                            last_action_kind = "click"
+                            
+                            await asyncio.sleep(2.0)
+                            
+                            result_msg = await self.wait_for_fish_result(fish_msg_id, timeout=20.0)
+                            
+                            if result_msg:                            
+                                fish_button_success = await self.recast_after_result(result_msg, fish_msg_id)
+                                
+                                if fish_button_success:
+                                    fishing_in_progress = True
+                                    last_click_time = datetime.now(timezone.utc)
+                                    last_action_kind = "click"
+                                    consecutive_fails = 0
+                                    
+                                    if not PIPELINE_MODE:
+                                        await asyncio.sleep(1.5)
+                                    continue
+                                else:
+                                    self.log.warning("❌ Не удалось нажать 'рыбачить' после результата")
+                                    self.note_recast_failed()
+                                    fishing_in_progress = False
+                                    consecutive_fails += 1
+                            else:
+                                self.log.warning("❌ Результат рыбалки не получен")
+                                self.note_cycle("no_result")
+                                consecutive_fails += 1
+                        else:
+                            self.log.warning("❌ Не удалось нажать кнопку с рыбой")
+                            self.note_cycle("hook_failed")
+                            consecutive_fails += 1
+                    else:
+                        self.log.warning("❌ Кнопка с рыбой не найдена")
+                        self.note_cycle("no_bite_button")
+                        consecutive_fails += 1
+                    
+                    await asyncio.sleep(0.5)
+                    continue
+                
+                # 4. Результат рыбалки (если мы пропустили предыдущие шаги)
+                if contains_any(txt, CATCH_SUCCESS_KEYWORDS):                
+                    fish_button_success = await self.recast_after_result(menu_msg)
+                    
+                    if fish_button_success:
+                        fishing_in_progress = True
+                        last_click_time = datetime.now(timezone.utc)
+                        last_action_kind = "click"
+                        consecutive_fails = 0
+                        if not PIPELINE_MODE:
+                            await asyncio.sleep(1.5)
+                        continue
+                    else:
+                        self.log.warning("❌ Не удалось нажать 'рыбачить' после результата")
+                        self.note_recast_failed()
+                        fishing_in_progress = False
+                        consecutive_fails += 1
+                    
+                    await asyncio.sleep(0.5)
+                    continue
+                
+                # 5. Неопознанное состояние
+                consecutive_fails += 1
+                self.log.warning(f"❓ Неизвестное состояние: {txt[:50]}...")
+                self.note_cycle("unknown_state")
+                await asyncio.sleep(1)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.log.exception(f"❌ Critical error in fisher_worker: {e}")
+        finally:
+            tracer.end_cycle()
+            self.log.info("🛑 Fisher worker stopped")
+
+    # ----------------- Commands -----------------
+    def start_worker(self, resume_stage: str = None):
+        """Запускает воркер (по команде или при продолжении после перезапуска)."""
+        # Очищаем очередь сообщений перед запуском
+        while not self.bot_msg_queue.empty():
+            try:
+                self.bot_msg_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+        
+        self._stop_event.clear()
+        self._worker_running = True
+        self._cycle_started_at = None
+        self.save_worker_state(resume_stage or "start")
+        self._worker_task = asyncio.create_task(self.fisher_worker(resume_stage))
+
+    async def cmd_start(self, event):
+        if self._worker_running:
+            async with self.limiter.throttle("send_message"):
+                await event.reply("Бот уже запущен.")
+            return
+        
+        # Сбрасываем счетчики ошибок капчи при запуске
+        self.last_captcha_error_type = None
+        self.captcha_error_count = 0
+        
+        self.start_worker()
+        self.log.info("✅ Авто-рыбалка запущена по команде")
+        async with self.limiter.throttle("send_message"):
+            await event.reply("✅ Авто-рыбалка запущена.")
+
+    async def cmd_stop_listener(self, event):
+        txt = (event.raw_text or "").strip().lower()
+        if txt in CMD_STOPS:
+            if not self._worker_running:
+                async with self.limiter.throttle("send_message"):
+                    await event.reply("Бот не запущен.")
+                return
+            
+            self.log.info("🛑 Получена команда остановки")
+            self._stop_event.set()
+            
+            if self._worker_task:
+                try:
+                    await asyncio.wait_for(self._worker_task, timeout=5.0)
+                except (asyncio.CancelledError, asyncio.TimeoutError):
+                    self._worker_task.cancel()
+                    try:
+                        await self._worker_task
+                    except asyncio.CancelledError:
+                        pass
+            
+            while not self.bot_msg_queue.empty():
+                try:
+                    self.bot_msg_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+            
+            self._worker_running = False
+            self._worker_task = None
+            self._cycle_started_at = None
+            self.save_worker_state("stopped")
+            self.cooldowns.save()
+            async with self.limiter.throttle("send_message"):
+                await event.reply(f"⛔ Авто-рыбалка остановлена.\n⏱ Интервалы: {self.cooldowns.report()}")
+
+    async def cmd_trace(self, event):
+        """Сводка по этапам цикла в чат, JSON последних трейсов — в Избранное."""
+        async with self.limiter.throttle("send_message"):
+            await event.reply(f"{tracer.summary(self.name)}\n{loop_monitor.summary()}\n{self.connection_watch.summary()}")
+        
+        if not tracer.cycles(self.name):
+            return
+        data = io.BytesIO(tracer.export_json(account=self.name).encode("utf-8"))
+        data.name = "traces.json"
+        try:
+            async with self.limiter.throttle("send_message"):
+                await self.client.send_file("me", data, caption="🧭 Трейсы циклов рыбалки")
+        except Exception as e:
+            self.log.warning(f"Не удалось отправить трейсы: {e}")
+
+
+    async def cmd_profile(self, event):
+        """Сэмплирующий профиль event loop на N секунд + дамп asyncio-задач (только владелец аккаунта)."""
+        global _profile_running
+        if _profile_running:
+            async with self.limiter.throttle("send_message"):
+                await event.reply("⏳ Профилирование уже идет.")
+            return
+        
+        seconds = min(int(event.pattern_match.group(2) or 10), profiler.MAX_DURATION)
+        _profile_running = True
+        try:
+            async with self.limiter.throttle("send_message"):
+                await event.reply(f"🔬 Профилирую event loop {seconds}с...")
+            
+            stacks = await profiler.profile_loop(seconds)
+            tasks_dump = profiler.dump_tasks()
+            
+            top = profiler.top_frames(stacks, limit=8)
+            lines = [f"🔬 Профиль за {seconds}с: {sum(stacks.values())} сэмплов"]
+            for frame, share in top:
+                lines.append(f"▪️ {share * 100:.1f}% {frame}")
+            async with self.limiter.throttle("send_message"):
+                await event.reply("\n".join(lines))
+            
+            collapsed = io.BytesIO(profiler.collapsed_text(stacks).encode("utf-8"))
+            collapsed.name = "profile.collapsed.txt"
+            tasks_file = io.BytesIO(tasks_dump.encode("utf-8"))
+            tasks_file.name = "asyncio_tasks.txt"
+            async with self.limiter.throttle("send_message"):
+                await self.client.send_file("me", [collapsed, tasks_file],
+                                       caption="🔬 Профиль event loop (flamegraph.pl / speedscope) и задачи asyncio")
+        except Exception as e:
+            self.log.warning(f"Ошибка профилирования: {e}")
+        finally:
+            _profile_running = False
+
+# ----------------- Запуск -----------------
+account_configs = load_accounts(ACCOUNTS_FILE, SESSION_STRING, API_ID, API_HASH, DATA_DIR)
+if not account_configs:
+    raise RuntimeError("SESSION_STRING_SERVER not found in environment (и нет файла аккаунтов)")
+# Event Bot живет на первом аккаунте из списка — в каком бы шарде тот ни оказался
+PRIMARY_ACCOUNT = account_configs[0]["name"]
+if SHARD_ACCOUNTS is not None:
+    _shard_names = {n.strip() for n in SHARD_ACCOUNTS.split(",") if n.strip()}
+    account_configs = [cfg for cfg in account_configs if cfg["name"] in _shard_names]
+
+supervisor = None
+if SUPERVISOR_MODE:
+    from supervisor import Supervisor
+    supervisor = Supervisor(
+        SHARDS,
+        load_names=lambda: [c["name"] for c in load_accounts(ACCOUNTS_FILE, SESSION_STRING, API_ID, API_HASH, DATA_DIR)],
+        accounts_path=ACCOUNTS_FILE if os.path.exists(ACCOUNTS_FILE) else None,
+        base_port=SHARD_BASE_PORT,
+        script=os.path.abspath(__file__),
+    )
+    accounts = []
+else:
+    accounts = [FisherAccount(**cfg) for cfg in account_configs]
+
+async def start_account(account: FisherAccount, primary: bool) -> bool:
+    """Подключает аккаунт, вешает хендлеры и продолжает рыбалку, если она шла до перезапуска."""
+    # Счетчики капчи и модель — из снимка; этап, если воркер был запущен до перезапуска
+    resume_stage = account.restore_worker_state()
+    account.log.info(f"🔧 Модель капчи: {CAPTCHA_MODELS[account.current_model_index]}; "
+                     f"⏱ Интервалы: {account.cooldowns.report()}")
+    if not await account.connect():
+        return False
+    mark_startup("connected")
+    account.register_handlers()
+    mark_startup("handlers")
+    # === ВРЕМЕННОЕ === (Event Bot — только на первом аккаунте)
+    if primary:
+        try:
+            init_event_bot(account.client, account.limiter, DATA_DIR)
+        except Exception as e:
+            account.log.error(f"❌ Не удалось загрузить Event Bot: {e}")
+    # ==========================
+    account.connection_watch.start()
+    
+    # Воркер был запущен до перезапуска — продолжаем без команды "старт"
+    if resume_stage:
+        global resumed_stage
+        resumed_stage = resumed_stage or resume_stage
+        account.log.info(f"♻️ Продолжаем авто-рыбалку после перезапуска (этап: {resume_stage})")
+        mark_startup("resumed")
+        account.start_worker(resume_stage)
+    return True
+
+async def run_supervisor():
+    """Режим SHARDS>1: этот процесс только раздает аккаунты шардам и собирает их метрики."""
+    logger.info(f"🧩 Супервизор: {SHARDS} шардов, аккаунтов: {len(account_configs)}")
+    if RENDER_APP_URL:
+        asyncio.create_task(self_ping())
+    await supervisor.run()
+
+async def main():
+    mark_startup("imports")
+    if supervisor is not None:
+        return await run_supervisor()
+    logger.info(f"Connecting to Telegram... (аккаунтов: {len(accounts)})")
+    catch_log.start()
+    loop_monitor.start()
+    
+    # Логируем информацию о моделях капчи
+    if CAPTCHA_SERVICE_URL:
+        logger.info(f"🧠 Капча решается общим сервисом: {CAPTCHA_SERVICE_URL}")
+    else:
+        logger.info(f"🤖 Доступные модели капчи: {', '.join(CAPTCHA_MODELS)}")
+        logger.info(f"📒 Квоты моделей: {quota_ledger.summary()}")
+    
+    started = await asyncio.gather(*(start_account(acc, acc.name == PRIMARY_ACCOUNT) for acc in accounts))
+    live = [acc for acc, ok in zip(accounts, started) if ok]
+    if not live:
+        logger.error("❌ Не удалось подключить ни один аккаунт")
+        return
+    
+    if CAPTCHA_WARMUP and GEMINI_API_KEY and not CAPTCHA_SERVICE_URL:
+        spawn_background(warm_up_captcha())
+    
+    if RENDER_APP_URL:
+        asyncio.create_task(self_ping())
+        logger.info("🔄 Самопинг запущен")
+    else:
+        logger.warning("⚠️ RENDER_APP_URL не задан, самопингование отключено.")
+
+    logger.info(f"🤖 Бот запущен ({len(live)}/{len(accounts)} аккаунтов). "
+                "Отправьте 'начать' в личном чате с игровым ботом.")
+    
+    await asyncio.gather(*(acc.client.run_until_disconnected() for acc in live))
+
+def get_loop_factory():
+    """Фабрика event loop: uvloop по USE_UVLOOP=1, иначе (или если его нет) стандартный asyncio."""
+    if not USE_UVLOOP:
+        return None
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("⚠️ USE_UVLOOP=1, но uvloop не установлен — используем стандартный event loop")
+        return None
+    logger.info("⚡ Используем uvloop")
+    return uvloop.new_event_loop
+
+if __name__ == "__main__":
+    web_thread = threading.Thread(target=run_web_server, daemon=True)
+    web_thread.start()
+    logger.info("🌐 Веб-сервер запущен")
+    
+    try:
+        with asyncio.Runner(loop_factory=get_loop_factory()) as runner:
+            runner.run(main())
+    except KeyboardInterrupt:
+        logger.info("👋 Завершение работы по запросу пользователя")
+    except Exception as e:
+        logger.error(f"💥 Критическая ошибка: {e}")
+    finally:
+        close_event_bot()
+        catch_log.close()
+        for account in accounts:
+            account.worker_checkpoint.close()
+        logger.info("👋 Бот остановлен")
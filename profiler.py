@@ -0,0 +1,76 @@
+# profiler.py | Сэмплирующий профилировщик потока event loop и дамп asyncio-задач
+import io
+import os
+import sys
+import time
+import asyncio
+import threading
+from collections import Counter
+
+# Интервал сэмплирования по умолчанию (секунды)
+SAMPLE_INTERVAL = 0.005
+# Ограничение длительности профиля по команде
+MAX_DURATION = 120
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_thread(thread_id: int, duration: float, interval: float = SAMPLE_INTERVAL) -> Counter:
+    """
+    Снимает стеки потока thread_id каждые interval секунд в течение duration.
+    Вызывать из другого потока (например, через asyncio.to_thread), иначе
+    профилироваться будет сам сэмплер. Возвращает Counter свернутых стеков.
+    """
+    stacks = Counter()
+    me = threading.get_ident()
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None and thread_id != me:
+            parts = []
+            while frame is not None:
+                parts.append(_frame_label(frame))
+                frame = frame.f_back
+            parts.reverse()
+            stacks[";".join(parts)] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def collapsed_text(stacks: Counter) -> str:
+    """Формат "a;b;c N" — подходит для flamegraph.pl и speedscope."""
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+def top_frames(stacks: Counter, limit: int = 10):
+    """[(кадр, доля самостоятельного времени)] — самые горячие верхушки стеков."""
+    total = sum(stacks.values())
+    leafs = Counter()
+    for stack, count in stacks.items():
+        leafs[stack.rsplit(";", 1)[-1]] += count
+    return [(frame, count / total) for frame, count in leafs.most_common(limit)] if total else []
+
+
+def dump_tasks(limit: int = 20) -> str:
+    """Стеки всех asyncio-задач текущего loop (вызывать из потока loop)."""
+    out = io.StringIO()
+    tasks = sorted(asyncio.all_tasks(), key=lambda t: t.get_name())
+    out.write(f"asyncio tasks: {len(tasks)}\n\n")
+    for task in tasks:
+        coro = task.get_coro()
+        name = getattr(coro, "__qualname__", repr(coro))
+        state = "done" if task.done() else ("cancelling" if task.cancelling() else "pending")
+        out.write(f"=== {task.get_name()} [{state}] {name}\n")
+        task.print_stack(limit=limit, file=out)
+        out.write("\n")
+    return out.getvalue()
+
+
+async def profile_loop(duration: float, interval: float = SAMPLE_INTERVAL) -> Counter:
+    """Профилирует поток текущего event loop в течение duration секунд."""
+    loop_thread = threading.get_ident()
+    return await asyncio.to_thread(sample_thread, loop_thread, duration, interval)
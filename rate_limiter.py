@@ -0,0 +1,126 @@
+# rate_limiter.py | Общий лимитер исходящих запросов к Telegram (token bucket + FloodWait)
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from telethon.errors import FloodWaitError
+
+logger = logging.getLogger("auto_fisher.limiter")
+
+# Бюджеты по методам: rate — запросов в секунду, burst — сколько можно сразу подряд
+DEFAULT_BUDGETS = {
+    "send_message": {"rate": 1.25, "burst": 1},
+    "get_messages": {"rate": 4.0, "burst": 8},
+    "click": {"rate": 2.0, "burst": 3},
+    "edit": {"rate": 0.5, "burst": 2},
+    "download": {"rate": 1.0, "burst": 2},
+}
+# Общий бюджет аккаунта поверх всех методов
+GLOBAL_BUDGET = {"rate": 20.0, "burst": 20}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Сколько ждать до появления одного токена."""
+        self._refill(now)
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1.0
+
+
+class RateLimiter:
+    """
+    Все исходящие вызовы (send_message, get_messages, клики, редактирование)
+    проходят через один экземпляр: у каждого метода свой бюджет, плюс общий.
+    FloodWait от Telegram ставит метод на паузу ровно на указанное время.
+    """
+
+    def __init__(self, budgets=None, global_budget=None):
+        budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+        self.buckets = {m: TokenBucket(b["rate"], b["burst"]) for m, b in budgets.items()}
+        g = global_budget or GLOBAL_BUDGET
+        self.global_bucket = TokenBucket(g["rate"], g["burst"])
+        self.paused_until = {}  # {method: monotonic}
+        self.stats = {m: {"calls": 0, "waited": 0.0, "flood_waits": 0} for m in self.buckets}
+        # Хук на каждый пропущенный вызов (например, подсчет RPC в трейсинге)
+        self.on_acquire = None
+
+    def _bucket(self, method: str) -> TokenBucket:
+        if method not in self.buckets:
+            b = DEFAULT_BUDGETS["get_messages"]
+            self.buckets[method] = TokenBucket(b["rate"], b["burst"])
+            self.stats[method] = {"calls": 0, "waited": 0.0, "flood_waits": 0}
+        return self.buckets[method]
+
+    def set_rate(self, method: str, rate: float):
+        """Меняет скорость метода на лету (например, после обучения интервалов)."""
+        bucket = self._bucket(method)
+        bucket._refill(time.monotonic())
+        bucket.rate = rate
+
+    async def acquire(self, method: str):
+        bucket = self._bucket(method)
+        started = time.monotonic()
+        while True:
+            now = time.monotonic()
+            wait = max(
+                self.paused_until.get(method, 0.0) - now,
+                bucket.delay(now),
+                self.global_bucket.delay(now),
+            )
+            if wait <= 0:
+                bucket.take(now)
+                self.global_bucket.take(now)
+                st = self.stats[method]
+                st["calls"] += 1
+                st["waited"] += now - started
+                if self.on_acquire:
+                    self.on_acquire(method)
+                return
+            await asyncio.sleep(wait)
+
+    def flood_wait(self, method: str, seconds: float):
+        until = time.monotonic() + seconds
+        if until > self.paused_until.get(method, 0.0):
+            self.paused_until[method] = until
+        self._bucket(method)
+        self.stats[method]["flood_waits"] += 1
+        logger.warning(f"🚦 FloodWait {seconds}с для {method} — пауза метода")
+
+    @asynccontextmanager
+    async def throttle(self, method: str):
+        """
+        async with limiter.throttle("get_messages"):
+            msgs = await client.get_messages(...)
+        """
+        await self.acquire(method)
+        try:
+            yield
+        except FloodWaitError as e:
+            self.flood_wait(method, e.seconds)
+            raise
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        out = {}
+        for m, st in self.stats.items():
+            out[m] = dict(st)
+            out[m]["waited"] = round(st["waited"], 3)
+            out[m]["paused_for"] = round(max(0.0, self.paused_until.get(m, 0.0) - now), 1)
+        return out
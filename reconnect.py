@@ -0,0 +1,128 @@
+# reconnect.py | Отслеживание разрывов соединения, догонялка обновлений и время восстановления
+import time
+import asyncio
+import logging
+from collections import deque
+
+from utils import percentile
+
+logger = logging.getLogger("auto_fisher.reconnect")
+
+# Как часто проверяем состояние транспорта (секунды)
+CHECK_INTERVAL = 0.25
+# Сколько последних разрывов хранить для перцентилей
+HISTORY = 100
+
+
+def transport_connected(client) -> bool:
+    """
+    client.is_connected() остается True, пока Telethon сам переподключается,
+    поэтому смотрим на транспорт отправителя; если внутренности поменялись — на is_connected().
+    """
+    sender = getattr(client, "_sender", None)
+    check = getattr(sender, "_transport_connected", None)
+    if check is not None:
+        try:
+            return bool(check())
+        except Exception:
+            pass
+    return client.is_connected()
+
+
+class ConnectionWatch:
+    """
+    Фоновая корутина следит за транспортом. При восстановлении вызывает
+    on_reconnect (догрузить пропущенные обновления), а первое успешное действие
+    воркера после разрыва (note_action) закрывает замер "разрыв → действие".
+    """
+
+    def __init__(self, client, on_reconnect=None, interval: float = CHECK_INTERVAL):
+        self.client = client
+        self.on_reconnect = on_reconnect
+        self.interval = interval
+        self.disconnects = 0
+        self.outages = deque(maxlen=HISTORY)     # длительность разрыва
+        self.recoveries = deque(maxlen=HISTORY)  # разрыв → первое успешное действие
+        self.down_since = None
+        self._pending_since = None  # разрыв, после которого еще не было успешного действия
+        self._restored = asyncio.Event()
+        self._restored.set()
+        self._task = None
+
+    @property
+    def connected(self) -> bool:
+        return self._restored.is_set()
+
+    def start(self):
+        """Запускать из event loop после подключения клиента."""
+        if not self._task:
+            self._task = asyncio.create_task(self._watch())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _watch(self):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                up = transport_connected(self.client)
+                if not up and self.down_since is None:
+                    self.down_since = time.perf_counter()
+                    self._pending_since = self.down_since
+                    self.disconnects += 1
+                    self._restored.clear()
+                    logger.warning("📡 Соединение с Telegram потеряно, ждем переподключения")
+                elif up and self.down_since is not None:
+                    outage = time.perf_counter() - self.down_since
+                    self.outages.append(outage)
+                    self.down_since = None
+                    logger.info(f"📡 Соединение восстановлено через {outage:.1f}с")
+                    if self.on_reconnect:
+                        try:
+                            await self.on_reconnect()
+                        except Exception as e:
+                            logger.warning(f"⚠️ Не удалось догрузить пропущенные обновления: {e}")
+                    self._restored.set()
+        except asyncio.CancelledError:
+            pass
+
+    async def wait_restored(self, timeout: float) -> bool:
+        """Ждет восстановления соединения не дольше timeout; True — соединение есть."""
+        if self._restored.is_set():
+            return True
+        try:
+            await asyncio.wait_for(self._restored.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def note_action(self):
+        """Успешное действие воркера (заброс/клик); первое после разрыва — конец восстановления."""
+        if self._pending_since is not None and self.down_since is None:
+            recovery = time.perf_counter() - self._pending_since
+            self._pending_since = None
+            self.recoveries.append(recovery)
+            logger.info(f"⚡ Первое действие после разрыва через {recovery:.1f}с")
+
+    # ---------- экспорт ----------
+    def snapshot(self) -> dict:
+        outages, recoveries = sorted(self.outages), sorted(self.recoveries)
+        return {
+            "connected": self.connected,
+            "disconnects": self.disconnects,
+            "outage_s": {"p50": percentile(outages, 50), "max": outages[-1] if outages else 0.0},
+            "recovery_s": {
+                "p50": percentile(recoveries, 50),
+                "p95": percentile(recoveries, 95),
+                "last": self.recoveries[-1] if self.recoveries else None,
+            },
+        }
+
+    def summary(self) -> str:
+        s = self.snapshot()
+        last = s["recovery_s"]["last"]
+        return (f"📡 Разрывов: {s['disconnects']}, восстановление до действия: "
+                f"p50 {s['recovery_s']['p50']:.1f}с, p95 {s['recovery_s']['p95']:.1f}с"
+                + (f", последнее {last:.1f}с" if last is not None else ""))
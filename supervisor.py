@@ -0,0 +1,272 @@
+# supervisor.py | Шарды: аккаунты распределяются по процессам (по одному на ядро)
+#
+# Каждый шард — обычный `python main.py` со своим списком аккаунтов (SHARD_ACCOUNTS)
+# и своим веб-сервером на 127.0.0.1. Супервизор опрашивает /metrics шардов (это же
+# и проверка здоровья): веб-сервер шарда живет в своем потоке и отвечает даже при
+# зависшем event loop, поэтому живость loop берется из пульса loop_monitor в ответе.
+# Упавшие и зависшие шарды перезапускаются с экспоненциальной паузой,
+# а при изменении файла аккаунтов перезапускаются только шарды, чей состав изменился.
+import os
+import sys
+import time
+import signal
+import asyncio
+import hashlib
+import logging
+
+import aiohttp
+
+logger = logging.getLogger("auto_fisher.supervisor")
+
+# Проверка здоровья: интервал, таймаут запроса и сколько провалов подряд терпим
+HEALTH_INTERVAL = 5.0
+HEALTH_TIMEOUT = 3.0
+HEALTH_MAX_FAILS = 3
+# Event loop шарда считается зависшим, если пульс loop_monitor старше LOOP_STALL_MAX секунд
+# или медианная задержка loop больше LOOP_LAG_MAX_MS
+LOOP_STALL_MAX = 30.0
+LOOP_LAG_MAX_MS = 5000.0
+# Шарду дается время на подключение аккаунтов, прежде чем проверять здоровье
+STARTUP_GRACE = 60.0
+# Пауза перед перезапуском: 1, 2, 4 ... RESTART_BACKOFF_MAX секунд;
+# сбрасывается, если шард проработал STABLE_AFTER секунд
+RESTART_BACKOFF_MAX = 300.0
+STABLE_AFTER = 600.0
+# Как часто проверяем, не изменился ли файл аккаунтов
+RELOAD_INTERVAL = 10.0
+# Сколько ждать штатного завершения шарда перед kill
+STOP_TIMEOUT = 15.0
+
+
+def assign_shard(name: str, shards: int) -> int:
+    """
+    Rendezvous-хеширование: у каждого аккаунта свой "любимый" шард. При добавлении
+    или удалении аккаунта остальные не переезжают, при смене числа шардов
+    переезжает только ~1/N аккаунтов.
+    """
+    def score(i):
+        return hashlib.blake2b(f"{name}:{i}".encode("utf-8"), digest_size=8).digest()
+    return max(range(shards), key=score)
+
+
+def plan_shards(names, shards: int):
+    """[[имена аккаунтов шарда 0], [шарда 1], ...]"""
+    plan = [[] for _ in range(shards)]
+    for name in names:
+        plan[assign_shard(name, shards)].append(name)
+    return plan
+
+
+def loop_unhealthy(loop: dict):
+    """Причина считать event loop шарда зависшим (по snapshot() loop_monitor) или None."""
+    if not loop:
+        return None
+    age = loop.get("heartbeat_age_s")
+    if age is not None and age > LOOP_STALL_MAX:
+        return f"event loop не отмечался {age:.0f}с"
+    lag = (loop.get("lag_ms") or {}).get("p50", 0.0)
+    if lag > LOOP_LAG_MAX_MS:
+        return f"медианная задержка event loop {lag:.0f}мс"
+    return None
+
+
+class Shard:
+    def __init__(self, index: int, port: int):
+        self.index = index
+        self.port = port
+        self.accounts = []
+        self.proc = None
+        self.started_at = None
+        self.restarts = 0
+        self.backoff = 1.0
+        self.next_start_at = 0.0
+        self.health_fails = 0
+        self.metrics = None       # последний ответ /metrics шарда
+        self.metrics_at = None
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+    def status(self) -> dict:
+        return {
+            "pid": self.proc.pid if self.alive else None,
+            "alive": self.alive,
+            "accounts": list(self.accounts),
+            "port": self.port,
+            "restarts": self.restarts,
+            "uptime_s": round(time.monotonic() - self.started_at, 1) if self.alive and self.started_at else 0.0,
+            "health_fails": self.health_fails,
+            "metrics_age_s": round(time.monotonic() - self.metrics_at, 1) if self.metrics_at else None,
+        }
+
+
+class Supervisor:
+    """
+    load_names() — функция, возвращающая текущие имена аккаунтов (перечитывается
+    при изменении файла accounts_path). Метрики шардов собираются в metrics().
+    """
+
+    def __init__(self, shards: int, load_names, accounts_path: str = None, base_port: int = 9100,
+                 script: str = None, env: dict = None):
+        self.load_names = load_names
+        self.accounts_path = accounts_path
+        self.script = script or os.path.abspath(sys.argv[0])
+        self.env = dict(env if env is not None else os.environ)
+        self.shards = [Shard(i, base_port + i) for i in range(shards)]
+        self._accounts_mtime = None
+        self._stopping = False
+
+    # ---------- процессы ----------
+    async def _start(self, shard: Shard):
+        env = dict(self.env)
+        env.update({
+            "SHARD_INDEX": str(shard.index),
+            "SHARD_ACCOUNTS": ",".join(shard.accounts),
+            "SHARDS": "1",          # шард не должен сам становиться супервизором
+            "PORT": str(shard.port),
+            "WEB_HOST": "127.0.0.1",
+            "RENDER_APP_URL": "",   # самопинг делает только супервизор
+        })
+        shard.proc = await asyncio.create_subprocess_exec(sys.executable, self.script, env=env)
+        shard.started_at = time.monotonic()
+        shard.health_fails = 0
+        shard.metrics = None
+        shard.metrics_at = None
+        logger.info(f"🧩 Шард {shard.index} запущен (pid {shard.proc.pid}): {', '.join(shard.accounts)}")
+
+    async def _stop(self, shard: Shard):
+        if not shard.alive:
+            return
+        # SIGINT — штатное завершение main.py (KeyboardInterrupt, журнал уловов дописывается)
+        try:
+            if os.name == "posix":
+                shard.proc.send_signal(signal.SIGINT)
+            else:
+                shard.proc.terminate()
+            await asyncio.wait_for(shard.proc.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Шард {shard.index} не завершился за {STOP_TIMEOUT:.0f}с, kill")
+            shard.proc.kill()
+            await shard.proc.wait()
+        except ProcessLookupError:
+            pass
+
+    async def _restart_later(self, shard: Shard, reason: str):
+        await self._stop(shard)
+        if shard.started_at and time.monotonic() - shard.started_at >= STABLE_AFTER:
+            shard.backoff = 1.0
+        shard.next_start_at = time.monotonic() + shard.backoff
+        logger.warning(f"🔁 Шард {shard.index}: {reason}, перезапуск через {shard.backoff:.0f}с")
+        shard.backoff = min(shard.backoff * 2, RESTART_BACKOFF_MAX)
+        shard.restarts += 1
+        shard.proc = None
+
+    # ---------- проверка здоровья ----------
+    async def _check(self, session, shard: Shard):
+        if not shard.alive:
+            return
+        try:
+            async with session.get(f"http://127.0.0.1:{shard.port}/metrics",
+                                   timeout=aiohttp.ClientTimeout(total=HEALTH_TIMEOUT)) as resp:
+                if resp.status != 200:
+                    raise RuntimeError(f"HTTP {resp.status}")
+                shard.metrics = await resp.json(content_type=None)
+                shard.metrics_at = time.monotonic()
+            loop_problem = loop_unhealthy(shard.metrics.get("loop"))
+            if loop_problem:
+                raise RuntimeError(loop_problem)
+            shard.health_fails = 0
+        except Exception as e:
+            if time.monotonic() - shard.started_at < STARTUP_GRACE:
+                return
+            shard.health_fails += 1
+            logger.warning(f"⚠️ Шард {shard.index} нездоров ({shard.health_fails}/{HEALTH_MAX_FAILS}): {e}")
+            if shard.health_fails >= HEALTH_MAX_FAILS:
+                await self._restart_later(shard, f"не проходит проверку здоровья ({e})")
+
+    # ---------- распределение аккаунтов ----------
+    def _accounts_changed(self) -> bool:
+        if not self.accounts_path:
+            # Один аккаунт из .env — распределяем один раз
+            first = self._accounts_mtime is None
+            self._accounts_mtime = 0.0
+            return first
+        try:
+            mtime = os.path.getmtime(self.accounts_path)
+        except OSError:
+            mtime = 0.0
+        if mtime == self._accounts_mtime:
+            return False
+        self._accounts_mtime = mtime
+        return True
+
+    async def rebalance(self):
+        try:
+            names = self.load_names()
+        except Exception as e:
+            logger.error(f"❌ Не удалось перечитать аккаунты, оставляем текущее распределение: {e}")
+            return
+        plan = plan_shards(names, len(self.shards))
+        for shard, wanted in zip(self.shards, plan):
+            if wanted == shard.accounts:
+                continue
+            moved = set(wanted) ^ set(shard.accounts)
+            if shard.alive:
+                logger.info(f"⚖️ Шард {shard.index}: изменился состав ({', '.join(sorted(moved))}), перезапуск")
+                await self._stop(shard)
+                shard.proc = None
+            shard.accounts = wanted
+            shard.backoff = 1.0
+            shard.next_start_at = 0.0
+
+    # ---------- основной цикл ----------
+    async def run(self):
+        last_reload = 0.0
+        async with aiohttp.ClientSession() as session:
+            try:
+                while not self._stopping:
+                    now = time.monotonic()
+                    if now - last_reload >= RELOAD_INTERVAL:
+                        last_reload = now
+                        if self._accounts_changed():
+                            await self.rebalance()
+                    for shard in self.shards:
+                        if shard.proc is not None and shard.proc.returncode is not None:
+                            await self._restart_later(shard, f"процесс завершился с кодом {shard.proc.returncode}")
+                        if shard.proc is None and shard.accounts and now >= shard.next_start_at:
+                            await self._start(shard)
+                    await asyncio.gather(*(self._check(session, s) for s in self.shards))
+                    await asyncio.sleep(HEALTH_INTERVAL)
+            finally:
+                await asyncio.gather(*(self._stop(s) for s in self.shards), return_exceptions=True)
+
+    def stop(self):
+        self._stopping = True
+
+    # ---------- метрики ----------
+    def metrics(self) -> dict:
+        """Один /metrics на весь парк: аккаунты всех шардов, суммарные циклы, состояние шардов."""
+        accounts, loops, totals = {}, {}, {"cycles": 0, "value_total": 0.0, "outcomes": {}}
+        event_bot = {}
+        for shard in self.shards:
+            m = shard.metrics or {}
+            loops[shard.index] = m.get("loop")
+            # Шарды без идущих ивентов не показываем
+            if (m.get("event_bot") or {}).get("events"):
+                event_bot[shard.index] = m["event_bot"]
+            for name, acc in (m.get("accounts") or {}).items():
+                acc = dict(acc, shard=shard.index)
+                accounts[name] = acc
+                cycles = acc.get("cycles") or {}
+                totals["cycles"] += cycles.get("cycles", 0)
+                totals["value_total"] += cycles.get("value_total", 0.0)
+                for k, n in (cycles.get("outcomes") or {}).items():
+                    totals["outcomes"][k] = totals["outcomes"].get(k, 0) + n
+        return {
+            "shards": {s.index: s.status() for s in self.shards},
+            "accounts": accounts,
+            "totals": totals,
+            "loop": loops,
+            "event_bot": event_bot,
+        }
@@ -0,0 +1,205 @@
+# tracing.py | Легкие спаны этапов цикла рыбалки: длительность и число RPC
+import json
+import time
+import functools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+from utils import percentile
+
+# Текущий цикл и спан — через contextvars, чтобы у каждой задачи были свои
+_current_cycle = contextvars.ContextVar("trace_cycle", default=None)
+_current_span = contextvars.ContextVar("trace_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "start", "duration", "child_time", "rpcs", "error")
+
+    def __init__(self, name: str, start: float):
+        self.name = name
+        self.start = start
+        self.duration = None
+        self.child_time = 0.0  # время вложенных спанов (например, recast -> click_fish_button_after_result)
+        self.rpcs = 0
+        self.error = None
+
+    @property
+    def self_time(self):
+        """Собственное время спана без вложенных: суммы по этапам не превышают длительность цикла."""
+        if self.duration is None:
+            return None
+        return max(0.0, self.duration - self.child_time)
+
+    def to_dict(self, cycle_start: float) -> dict:
+        return {
+            "name": self.name,
+            "offset": round(self.start - cycle_start, 4),
+            "duration": round(self.duration, 4) if self.duration is not None else None,
+            "self": round(self.self_time, 4) if self.duration is not None else None,
+            "rpcs": self.rpcs,
+            "error": self.error,
+        }
+
+
+class CycleTrace:
+    __slots__ = ("account", "started_at", "start", "duration", "spans", "rpcs", "outcome")
+
+    def __init__(self, account: str = None):
+        self.account = account  # аккаунт, чей воркер ведет цикл (трейсер общий на всех)
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self.rpcs = 0
+        self.outcome = None
+
+    def to_dict(self) -> dict:
+        return {
+            "account": self.account,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 4) if self.duration is not None else None,
+            "rpcs": self.rpcs,
+            "outcome": self.outcome,
+            "spans": [s.to_dict(self.start) for s in self.spans],
+        }
+
+
+class Tracer:
+    """
+    Кольцевой буфер последних циклов. Спан — контекстный менеджер или декоратор:
+
+        with tracer.span("emoji_click"):
+            ...
+
+        @tracer.traced("wait_for_fish_result")
+        async def wait_for_fish_result(...): ...
+    """
+
+    def __init__(self, size: int = 300):
+        self.traces = deque(maxlen=size)
+        # Хук on_span(name) — вызывается при входе в каждый спан (переход этапа цикла)
+        self.on_span = None
+
+    # ---------- циклы ----------
+    def begin_cycle(self, account: str = None) -> CycleTrace:
+        """Начинает новый цикл текущей задачи (предыдущий, если открыт, закрывается)."""
+        self.end_cycle()
+        cycle = CycleTrace(account)
+        _current_cycle.set(cycle)
+        return cycle
+
+    def end_cycle(self, outcome: str = None):
+        cycle = _current_cycle.get()
+        if cycle is None:
+            return
+        cycle.duration = time.perf_counter() - cycle.start
+        if outcome:
+            cycle.outcome = outcome
+        # Пустые циклы (без единого этапа) в буфер не кладем
+        if cycle.spans:
+            self.traces.append(cycle)
+        _current_cycle.set(None)
+
+    def set_outcome(self, outcome: str):
+        cycle = _current_cycle.get()
+        if cycle is not None:
+            cycle.outcome = outcome
+
+    # ---------- спаны ----------
+    @contextmanager
+    def span(self, name: str):
+        cycle = _current_cycle.get()
+        if cycle is None:
+            yield None
+            return
+        span = Span(name, time.perf_counter())
+        parent = _current_span.get()
+        cycle.spans.append(span)
+        if self.on_span:
+            self.on_span(name)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - span.start
+            _current_span.reset(token)
+            # Время вложенного спана вычитается из родителя (если тот еще открыт)
+            if parent is not None and parent.duration is None:
+                parent.child_time += span.duration
+
+    def traced(self, name: str):
+        """Декоратор для async-функций: весь вызов — один спан."""
+        def deco(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return await fn(*args, **kwargs)
+            return wrapper
+        return deco
+
+    def note_rpc(self, method: str = None):
+        """Учитывает RPC в текущем спане и цикле (хук лимитера)."""
+        span = _current_span.get()
+        if span is not None:
+            span.rpcs += 1
+        cycle = _current_cycle.get()
+        if cycle is not None:
+            cycle.rpcs += 1
+
+    # ---------- экспорт ----------
+    def cycles(self, account: str = None):
+        """Циклы в буфере; account — только циклы этого аккаунта."""
+        traces = list(self.traces)
+        if account is not None:
+            traces = [t for t in traces if t.account == account]
+        return traces
+
+    def export_json(self, last: int = None, account: str = None) -> str:
+        traces = self.cycles(account)
+        if last:
+            traces = traces[-last:]
+        return json.dumps([t.to_dict() for t in traces], ensure_ascii=False, indent=1)
+
+    def stage_stats(self, account: str = None) -> dict:
+        """{этап: {count, avg, p50, p95, rpcs}} по циклам в буфере (всех или одного аккаунта); время — собственное, без вложенных этапов."""
+        durations, rpcs = {}, {}
+        for cycle in self.cycles(account):
+            for s in cycle.spans:
+                if s.duration is None:
+                    continue
+                durations.setdefault(s.name, []).append(s.self_time)
+                rpcs[s.name] = rpcs.get(s.name, 0) + s.rpcs
+        stats = {}
+        for name, values in durations.items():
+            values.sort()
+            stats[name] = {
+                "count": len(values),
+                "avg": sum(values) / len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "rpcs": rpcs[name] / len(values),
+            }
+        return stats
+
+    def summary(self, account: str = None) -> str:
+        traces = self.cycles(account)
+        if not traces:
+            return "Трейсов пока нет."
+        cycle_durations = sorted(t.duration for t in traces if t.duration is not None)
+        total_rpcs = sum(t.rpcs for t in traces)
+        lines = [
+            f"🧭 Циклов в буфере: {len(traces)}, "
+            f"p50 {percentile(cycle_durations, 50):.2f}с, p95 {percentile(cycle_durations, 95):.2f}с, "
+            f"RPC/цикл {total_rpcs / len(traces):.1f}",
+        ]
+        stats = self.stage_stats(account)
+        for name, st in sorted(stats.items(), key=lambda kv: -kv[1]["avg"] * kv[1]["count"]):
+            lines.append(
+                f"▪️ {name}: ×{st['count']} ср {st['avg']:.2f}с p50 {st['p50']:.2f}с "
+                f"p95 {st['p95']:.2f}с, RPC {st['rpcs']:.1f}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,28 @@
+# utils.py | Общие мелочи для модулей бота
+import os
+import json
+
+
+def percentile(sorted_values, p: float) -> float:
+    """p-й перцентиль (0..100) уже отсортированного списка; пустой список — 0.0."""
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+def write_json_atomic(path: str, data, fsync: bool = False, **dump_kwargs):
+    """
+    Пишет JSON во временный файл и подменяет им path (os.replace): читатель видит
+    старый или новый файл целиком. Ошибки — вызывающему.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, **dump_kwargs)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
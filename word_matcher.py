@@ -0,0 +1,93 @@
+# word_matcher.py | Подсчет вхождений многих слов за один проход по сообщению
+import re
+
+# Меньше стольких строк цикл str.count (он в C и очень быстр на коротких списках)
+# выигрывает у регулярки-бора; порог измерен bench_words.py
+SCAN_MIN_TERMS = 120
+
+
+class WordMatcher:
+    """
+    Строится один раз по списку искомых строк; count() за один проход по тексту
+    возвращает {строка: число вхождений}. Вхождения одной строки не перекрываются —
+    ровно как str.count, поэтому результат совпадает с циклом по text.count(term).
+
+    Строки складываются в бор, а бор компилируется в одну регулярку: движок re идет
+    по тексту в C и в каждой позиции проверяет только одну ветку бора, а не все
+    строки подряд. На Python разбираются лишь позиции, где вхождение действительно
+    есть, поэтому сообщения без загаданных слов почти ничего не стоят.
+
+    Для коротких списков (меньше SCAN_MIN_TERMS) остается обычный цикл по str.count.
+    """
+
+    def __init__(self, terms):
+        self.terms = []
+        index = {}
+        for term in terms:
+            if term and term not in index:
+                index[term] = len(self.terms)
+                self.terms.append(term)
+
+        # Бор: goto[state] = {символ: state}, ends[state] = id строки, оканчивающейся здесь
+        goto, ends = [{}], [None]
+        for tid, term in enumerate(self.terms):
+            state = 0
+            for ch in term:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    ends.append(None)
+                state = nxt
+            ends[state] = tid
+
+        self._goto = goto
+        self._ends = ends
+        self._lengths = [len(t) for t in self.terms]
+        self.use_scan = len(self.terms) >= SCAN_MIN_TERMS
+        self._search = re.compile(_trie_regex(goto, ends, 0)).search if self.use_scan else None
+
+    def count(self, text: str) -> dict:
+        """{строка: вхождений} только для найденных строк."""
+        if not self.use_scan:
+            counts = {}
+            for term in self.terms:
+                n = text.count(term)
+                if n:
+                    counts[term] = n
+            return counts
+        search, goto, ends, lengths = self._search, self._goto, self._ends, self._lengths
+        counts = {}
+        next_free = {}  # id строки -> позиция, с которой может начаться следующее вхождение
+        end = len(text)
+        found = search(text)
+        while found is not None:
+            start = found.start()
+            # С этой позиции начинается хотя бы одна строка; спускаемся по бору и
+            # собираем все строки, начинающиеся здесь (короткие — префиксы длинных)
+            state, pos = 0, start
+            while pos < end:
+                state = goto[state].get(text[pos])
+                if state is None:
+                    break
+                tid = ends[state]
+                if tid is not None and start >= next_free.get(tid, 0):
+                    counts[tid] = counts.get(tid, 0) + 1
+                    next_free[tid] = start + lengths[tid]
+                pos += 1
+            found = search(text, start + 1)
+        return {self.terms[tid]: n for tid, n in counts.items()}
+
+
+def _trie_regex(goto, ends, state) -> str:
+    """
+    Регулярка "здесь начинается одна из строк", собранная по бору. Достаточно
+    кратчайшего совпадения, поэтому на конце строки ветка обрывается.
+    """
+    branches = []
+    for ch, nxt in goto[state].items():
+        branches.append(re.escape(ch) + ("" if ends[nxt] is not None else _trie_regex(goto, ends, nxt)))
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
@@ -0,0 +1,92 @@
+# worker_state.py | Снимок состояния воркера на диске для продолжения после перезапуска
+import json
+import time
+import queue
+import logging
+import threading
+
+from utils import write_json_atomic
+
+logger = logging.getLogger("auto_fisher.state")
+
+
+class WorkerCheckpoint:
+    """
+    Маленький JSON со снимком состояния: запущен ли воркер, текущий этап цикла,
+    счетчики ошибок капчи и модель. update() только меняет состояние в памяти и
+    ставит копию в очередь; файл пишет отдельный поток (атомарно, tmp + os.replace),
+    а скопившиеся в очереди снимки схлопываются в одну запись — последнюю.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state = {}
+        self.writes = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self.state = data
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ Снимок состояния воркера поврежден, начинаем с чистого: {e}")
+
+    def update(self, **fields) -> bool:
+        """Обновляет поля и ставит запись в очередь, если что-то изменилось. True — запись поставлена."""
+        changed = {k: v for k, v in fields.items() if self.state.get(k) != v}
+        if not changed:
+            return False
+        self.state.update(changed)
+        if "stage" in changed:
+            self.state["stage_at"] = time.time()
+        self.state["saved_at"] = time.time()
+        self._queue.put(dict(self.state))
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="worker-state", daemon=True)
+            self._thread.start()
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """Дописывает последний снимок и останавливает поток записи."""
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ---------- поток записи ----------
+    def _run(self):
+        while True:
+            state = self._queue.get()
+            stopping = state is None
+            # Пока писали прошлый снимок, могли прийти новые — пишем только последний
+            try:
+                while True:
+                    item = self._queue.get_nowait()
+                    if item is None:
+                        stopping = True
+                    else:
+                        state = item
+            except queue.Empty:
+                pass
+            if state is not None:
+                self._save(state)
+            if stopping:
+                return
+
+    def _save(self, state: dict) -> bool:
+        try:
+            write_json_atomic(self.path, state, ensure_ascii=False)
+            self.writes += 1
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить снимок состояния воркера: {e}")
+            return False
+
+    def get(self, key: str, default=None):
+        return self.state.get(key, default)